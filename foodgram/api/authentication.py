@@ -0,0 +1,116 @@
+"""Аутентификация по токену с кешем ключ -> пользователь.
+
+TokenAuthentication DRF на каждый запрос выбирает токен вместе с
+пользователем. Если кеш Django общий для воркеров (SHARED_CACHE),
+результат хранится в нем AUTH_TOKEN_CACHE_TTL секунд: id пользователя
+и поля USER_FIELDS, остальные поля модели отложены и загружаются при
+обращении.
+Запись сбрасывается при удалении или изменении токена (в том числе
+при выходе через auth/token/logout) и при любом сохранении
+пользователя: смена пароля, деактивация, правка профиля. С локальным
+кешем процесса сброс не дошел бы до других воркеров, поэтому токен
+проверяется по базе, как в TokenAuthentication.
+
+С AUTH_TOKEN_TTL > 0 токен старше AUTH_TOKEN_TTL секунд удаляется при
+первом запросе с ним, а вход выдает новый токен вместо просроченного.
+"""
+from datetime import timedelta
+from hashlib import sha256
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+from users.models import CustomUser
+
+# Поля пользователя, которых хватает сериализаторам и проверкам прав;
+# from_db ждет значения в порядке полей модели
+USER_FIELDS = tuple(
+    field.attname for field in CustomUser._meta.concrete_fields
+    if field.attname in {
+        'id', 'email', 'username', 'first_name', 'last_name',
+        'is_active', 'is_staff', 'is_superuser',
+    }
+)
+TOKEN_FIELDS = ('key', 'user_id', 'created')
+
+
+def cache_key(key):
+    return 'auth-token:' + sha256(key.encode()).hexdigest()
+
+
+def is_expired(created):
+    ttl = settings.AUTH_TOKEN_TTL
+    return ttl > 0 and created + timedelta(seconds=ttl) <= timezone.now()
+
+
+def delete_expired_tokens(user):
+    """Удаляет просроченный токен пользователя перед входом."""
+    if settings.AUTH_TOKEN_TTL > 0:
+        Token.objects.filter(
+            user=user,
+            created__lte=timezone.now() - timedelta(
+                seconds=settings.AUTH_TOKEN_TTL)
+        ).delete()
+
+
+def load_entry(key):
+    """(значения USER_FIELDS, время создания токена) из базы."""
+    try:
+        token = Token.objects.select_related('user').get(key=key)
+    except Token.DoesNotExist:
+        raise AuthenticationFailed('Недействительный токен.')
+    entry = (
+        [getattr(token.user, field) for field in USER_FIELDS],
+        token.created,
+    )
+    cache.set(cache_key(key), entry, settings.AUTH_TOKEN_CACHE_TTL)
+    return entry
+
+
+def check_expiry(key, created):
+    if is_expired(created):
+        Token.objects.filter(key=key).delete()
+        raise AuthenticationFailed('Срок действия токена истек.')
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        if not settings.SHARED_CACHE:
+            user, token = super().authenticate_credentials(key)
+            check_expiry(key, token.created)
+            return user, token
+        entry = cache.get(cache_key(key))
+        if entry is None:
+            entry = load_entry(key)
+        values, created = entry
+        check_expiry(key, created)
+        user = CustomUser.from_db(DEFAULT_DB_ALIAS, USER_FIELDS, values)
+        if not user.is_active:
+            raise AuthenticationFailed(
+                'Пользователь неактивен или удален.')
+        token = Token.from_db(
+            DEFAULT_DB_ALIAS, TOKEN_FIELDS, (key, user.pk, created))
+        token.user = user
+        return user, token
+
+
+@receiver((post_save, post_delete), sender=Token)
+def invalidate_token(sender, instance, **kwargs):
+    cache.delete(cache_key(instance.key))
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_user_tokens(sender, instance, created, raw=False, **kwargs):
+    if created or raw:
+        return
+    cache.delete_many([
+        cache_key(key) for key in Token.objects.filter(
+            user_id=instance.pk).values_list('key', flat=True)
+    ])
@@ -0,0 +1,238 @@
+"""Постоянные соединения с БД: проверка перед повторным использованием,
+пул процесса и их статистика для /api/metrics.
+
+Без пула каждый поток держит свое соединение DB_CONN_MAX_AGE секунд
+(CONN_MAX_AGE). Django закрывает его в начале и конце запроса, если оно
+устарело или в нем были ошибки; кроме того, при DB_CONN_HEALTH_CHECKS
+в начале запроса соединение, простоявшее без дела дольше
+DB_CONN_HEALTH_CHECK_IDLE секунд, проверяется connection.is_usable() и
+при обрыве открывается заново. Соединения, которыми пользовались только
+что, не проверяются: обрываются обычно простаивающие соединения, а
+проверка стоила бы лишнего обращения к базе на каждый запрос.
+
+С DB_POOL_SIZE > 0 (только PostgreSQL, backend api.pooled_postgresql)
+потоки процесса делят не больше DB_POOL_SIZE соединений: соединение
+берется из пула при первом обращении к БД (с той же проверкой после
+простоя) и возвращается в конце запроса. Поток, которому не хватило
+соединения, ждет до DB_POOL_TIMEOUT секунд.
+"""
+import threading
+import time
+from collections import defaultdict, deque
+
+from django.conf import settings
+from django.core.signals import request_finished, request_started
+from django.db import OperationalError, connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+COUNTERS = {
+    'foodgram_db_connects_total':
+        'Открытия соединений Django (с пулом - выдачи из пула).',
+    'foodgram_db_reconnects_total':
+        'Соединения, не прошедшие проверку и открытые заново.',
+    'foodgram_db_pool_checkouts_total': 'Выдачи соединений из пула.',
+    'foodgram_db_pool_waits_total':
+        'Выдачи, которым пришлось ждать свободного соединения.',
+    'foodgram_db_pool_timeouts_total':
+        'Выдачи, не дождавшиеся соединения за DB_POOL_TIMEOUT.',
+    'foodgram_db_pool_opened_total': 'Новые соединения, открытые пулом.',
+}
+
+
+class ConnectionStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(int)
+
+    def increment(self, name, alias):
+        with self._lock:
+            self._counters[(name, alias)] += 1
+
+    def render(self):
+        """Счетчики и состояние пулов в формате Prometheus."""
+        lines = []
+        with self._lock:
+            counters = dict(self._counters)
+        for name, help_text in COUNTERS.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            for (counter, alias), value in sorted(counters.items()):
+                if counter == name:
+                    lines.append(f'{name}{{database="{alias}"}} {value}')
+        name = 'foodgram_db_pool_connections'
+        lines.append(f'# HELP {name} Соединения пула: свободные и занятые.')
+        lines.append(f'# TYPE {name} gauge')
+        for alias, pool in sorted(pools.items()):
+            idle, in_use = pool.usage()
+            lines.append(f'{name}{{database="{alias}",state="idle"}} {idle}')
+            lines.append(
+                f'{name}{{database="{alias}",state="in_use"}} {in_use}')
+        return '\n'.join(lines) + '\n'
+
+
+stats = ConnectionStats()
+
+
+class ConnectionPool:
+    """Пул соединений процесса, общий для потоков.
+
+    Подкласс для драйвера определяет reset() - вернуть соединение в
+    исходное состояние - и is_healthy().
+    """
+    def __init__(self, alias):
+        self.alias = alias
+        self.size = settings.DB_POOL_SIZE
+        self.timeout = settings.DB_POOL_TIMEOUT
+        self.max_age = settings.DB_CONN_MAX_AGE
+        self.health_checks = settings.DB_CONN_HEALTH_CHECKS
+        self._condition = threading.Condition()
+        # Свободные соединения: (соединение, время открытия, время
+        # возврата в пул)
+        self._idle = deque()
+        self._created = {}
+        self._opened = 0
+
+    def reset(self, connection):
+        return True
+
+    def is_healthy(self, connection):
+        return True
+
+    def usage(self):
+        with self._condition:
+            return len(self._idle), self._opened - len(self._idle)
+
+    def _expired(self, created):
+        return time.monotonic() - created >= self.max_age
+
+    def _acquire(self):
+        """Свободное соединение или (None, None, None) - место под новое.
+        """
+        deadline = time.monotonic() + self.timeout
+        stats.increment('foodgram_db_pool_checkouts_total', self.alias)
+        with self._condition:
+            if not self._idle and self._opened >= self.size:
+                stats.increment('foodgram_db_pool_waits_total', self.alias)
+            while not self._idle and self._opened >= self.size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    stats.increment(
+                        'foodgram_db_pool_timeouts_total', self.alias)
+                    raise OperationalError(
+                        f'Нет свободного соединения с {self.alias} '
+                        f'за {self.timeout} с.')
+                self._condition.wait(remaining)
+            if self._idle:
+                # Последнее возвращенное соединение: оно точно живое
+                return self._idle.pop()
+            self._opened += 1
+            return None, None, None
+
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _drop(self, connection):
+        with self._condition:
+            self._opened -= 1
+            self._condition.notify()
+        self._close(connection)
+
+    def _reusable(self, connection, created, released):
+        if self._expired(created):
+            return False
+        if (self.health_checks and is_idle(released)
+                and not self.is_healthy(connection)):
+            stats.increment('foodgram_db_reconnects_total', self.alias)
+            return False
+        return True
+
+    def checkout(self, connect):
+        connection, created, released = self._acquire()
+        if connection is not None and not self._reusable(
+                connection, created, released):
+            # Место в пуле остается за новым соединением
+            self._close(connection)
+            connection = None
+        if connection is None:
+            try:
+                connection = connect()
+            except Exception:
+                with self._condition:
+                    self._opened -= 1
+                    self._condition.notify()
+                raise
+            created = time.monotonic()
+            stats.increment('foodgram_db_pool_opened_total', self.alias)
+        with self._condition:
+            self._created[id(connection)] = created
+        return connection
+
+    def checkin(self, connection, discard=False):
+        with self._condition:
+            created = self._created.pop(id(connection), None)
+        if (discard or created is None or self._expired(created)
+                or not self.reset(connection)):
+            self._drop(connection)
+            return
+        with self._condition:
+            self._idle.append((connection, created, time.monotonic()))
+            self._condition.notify()
+
+
+def is_idle(released):
+    """Простаивало ли соединение достаточно долго для проверки."""
+    return (
+        released is None
+        or time.monotonic() - released >= settings.DB_CONN_HEALTH_CHECK_IDLE
+    )
+
+
+pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, pool_class):
+    with _pools_lock:
+        if alias not in pools:
+            pools[alias] = pool_class(alias)
+        return pools[alias]
+
+
+@receiver(connection_created)
+def count_connect(sender, connection, **kwargs):
+    stats.increment('foodgram_db_connects_total', connection.alias)
+
+
+@receiver(request_finished)
+def mark_released(**kwargs):
+    """Запоминает, когда соединения потока освободились.
+
+    Вызывается после close_old_connections Django: закрытые им
+    соединения уже None.
+    """
+    for connection in connections.all():
+        if connection.connection is not None:
+            connection.released_at = time.monotonic()
+
+
+@receiver(request_started)
+def check_persistent_connections(**kwargs):
+    """Проверяет соединения, простаивавшие с прошлых запросов.
+
+    Вызывается после close_old_connections Django, который закрывает
+    только устаревшие соединения и соединения с ошибками.
+    """
+    if not settings.DB_CONN_HEALTH_CHECKS:
+        return
+    for connection in connections.all():
+        if (connection.connection is None
+                or not is_idle(getattr(connection, 'released_at', None))
+                or connection.is_usable()):
+            continue
+        stats.increment('foodgram_db_reconnects_total', connection.alias)
+        connection.close()
@@ -0,0 +1,50 @@
+"""Кеш не зависящей от пользователя части представления рецепта.
+
+Ключ - id рецепта, его cache_version и адрес сайта (в представлении
+абсолютные ссылки на фото). Фрагменты страницы читаются одним
+get_many, недостающие рендерятся пачкой: связи подгружаются только
+для них. Флаги пользователя накладываются поверх фрагмента.
+"""
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Prefetch, prefetch_related_objects
+
+from dish.models import RecipeIngredientAmount
+
+RECIPE_PREFETCH = (
+    'tags',
+    'image_variants',
+    Prefetch(
+        'recipeingredientamount_set',
+        queryset=RecipeIngredientAmount.objects.select_related('ingredient')
+    ),
+)
+
+
+def fragment_key(recipe, site):
+    return f'recipe-fragment:{recipe.pk}:{recipe.cache_version}:{site}'
+
+
+def get_fragments(recipes, serializer_class, context):
+    """Фрагменты рецептов recipes в том же порядке."""
+    request = context.get('request')
+    site = md5(
+        (request.build_absolute_uri('/') if request else '').encode()
+    ).hexdigest()[:8]
+    keys = [fragment_key(recipe, site) for recipe in recipes]
+    fragments = cache.get_many(keys)
+    missing = [
+        recipe for recipe, key in zip(recipes, keys) if key not in fragments
+    ]
+    if missing:
+        prefetch_related_objects(missing, *RECIPE_PREFETCH)
+        rendered = {
+            fragment_key(recipe, site): dict(
+                serializer_class(recipe, context=context).data)
+            for recipe in missing
+        }
+        cache.set_many(rendered, settings.RECIPE_FRAGMENT_TTL)
+        fragments.update(rendered)
+    return [fragments[key] for key in keys]
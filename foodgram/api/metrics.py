@@ -0,0 +1,91 @@
+"""Метрики запросов в памяти процесса и их вывод в формате Prometheus.
+
+Для каждого имени представления (recipes-list,
+recipes-download-shopping-cart и т.д.) копятся гистограммы времени
+ответа, числа SQL-запросов и времени в БД. Метрики живут в процессе:
+при нескольких воркерах gunicorn каждый отдает свои.
+"""
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+HISTOGRAMS = {
+    'foodgram_request_duration_seconds': (
+        'Время обработки запроса.', LATENCY_BUCKETS),
+    'foodgram_request_db_queries': (
+        'Число SQL-запросов на запрос.', QUERY_BUCKETS),
+    'foodgram_request_db_duration_seconds': (
+        'Время SQL-запросов на запрос.', LATENCY_BUCKETS),
+}
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {
+            name: defaultdict(lambda buckets=buckets: Histogram(buckets))
+            for name, (_, buckets) in HISTOGRAMS.items()
+        }
+        self._requests = defaultdict(int)
+
+    def observe(self, view, method, status, duration, queries, db_time):
+        labels = (view, method)
+        with self._lock:
+            self._requests[(view, method, str(status))] += 1
+            histograms = self._histograms
+            histograms['foodgram_request_duration_seconds'][
+                labels].observe(duration)
+            histograms['foodgram_request_db_queries'][
+                labels].observe(queries)
+            histograms['foodgram_request_db_duration_seconds'][
+                labels].observe(db_time)
+
+    def render(self):
+        """Текст в формате Prometheus text exposition 0.0.4."""
+        lines = [
+            '# HELP foodgram_requests_total Число обработанных запросов.',
+            '# TYPE foodgram_requests_total counter',
+        ]
+        with self._lock:
+            for (view, method, status), value in sorted(
+                    self._requests.items()):
+                lines.append(
+                    f'foodgram_requests_total{{view="{view}",'
+                    f'method="{method}",status="{status}"}} {value}')
+            for name, (help_text, buckets) in HISTOGRAMS.items():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for (view, method), histogram in sorted(
+                        self._histograms[name].items()):
+                    lines.extend(self.render_histogram(
+                        name, f'view="{view}",method="{method}"', histogram))
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def render_histogram(name, labels, histogram):
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}'
+        yield f'{name}_sum{{{labels}}} {histogram.total:.6f}'
+        yield f'{name}_count{{{labels}}} {histogram.count}'
+
+
+registry = Registry()
@@ -0,0 +1,110 @@
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from .metrics import registry
+from .replicas import (
+    SAFE_METHODS,
+    is_sticky,
+    replica_pool,
+    stick_to_primary,
+    use_replica,
+)
+
+logger = logging.getLogger('api.metrics')
+
+# Остальные методы попадают в метрики как OTHER: метка из произвольной
+# строки клиента плодила бы временные ряды без ограничения
+METHODS = frozenset(
+    ('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'))
+
+
+class QueryCollector:
+    """execute_wrapper: считает SQL-запросы и их время."""
+    def __init__(self, keep_sql):
+        self.count = 0
+        self.duration = 0.0
+        self.keep_sql = keep_sql
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.count += 1
+            self.duration += duration
+            if len(self.queries) < self.keep_sql:
+                self.queries.append((duration, sql))
+
+
+class RequestMetricsMiddleware:
+    """Время ответа, число SQL-запросов и время в БД на каждый запрос.
+
+    Пишет заголовок Server-Timing, копит гистограммы по имени
+    представления для /api/metrics и логирует запросы, превысившие
+    METRICS_QUERY_BUDGET или METRICS_LATENCY_BUDGET_MS, вместе с SQL.
+    Запросы, выполненные при отдаче StreamingHttpResponse, не учитываются.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        collector = QueryCollector(settings.METRICS_LOG_SQL_LIMIT)
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(collector))
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        view = (match.url_name or match.view_name) if match else 'unmatched'
+        method = request.method if request.method in METHODS else 'OTHER'
+        registry.observe(view, method, response.status_code,
+                         duration, collector.count, collector.duration)
+        response['Server-Timing'] = (
+            f'db;dur={collector.duration * 1000:.1f};'
+            f'desc="{collector.count} queries", '
+            f'app;dur={duration * 1000:.1f}'
+        )
+        if (collector.count > settings.METRICS_QUERY_BUDGET
+                or duration * 1000 > settings.METRICS_LATENCY_BUDGET_MS):
+            logger.warning(
+                '%s %s (%s): %.1f ms, %d SQL-запросов, %.1f ms в БД\n%s',
+                request.method, request.get_full_path(), view,
+                duration * 1000, collector.count, collector.duration * 1000,
+                '\n'.join(
+                    f'{query_duration * 1000:.1f} ms: {sql}'
+                    for query_duration, sql in collector.queries)
+            )
+        return response
+
+
+class ReadReplicaMiddleware:
+    """Направляет чтения GET-запросов к API на реплику (api/replicas.py).
+
+    Ответ StreamingHttpResponse отдается уже после сброса реплики,
+    поэтому его запросы идут в основную базу.
+    """
+    api_prefix = '/api/'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        safe = request.method in SAFE_METHODS
+        if (safe and request.path.startswith(self.api_prefix)
+                and not is_sticky(request)):
+            use_replica(replica_pool.choose())
+        try:
+            response = self.get_response(request)
+        finally:
+            use_replica(None)
+        if not safe and response.status_code < 400:
+            stick_to_primary(request)
+        return response
@@ -1,5 +1,15 @@
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import parse_etags
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
 from rest_framework import viewsets
 from rest_framework import mixins
+from rest_framework import status
+from rest_framework.response import Response
+
+from dish.versions import get_version
 
 
 class CreateDestroyViewSet(
@@ -17,3 +27,55 @@ class ListCreateDestroyViewSet(
     viewsets.GenericViewSet
 ):
     pass
+
+
+class VersionedCacheMixin:
+    """Кеширует GET-ответы справочника по версии его модели.
+
+    Ответ отдается с ETag/Last-Modified и Cache-Control; на совпадающий
+    If-None-Match или If-Modified-Since отвечаем 304 без тела.
+    Сериализованные данные хранятся в кеше Django до смены версии.
+    """
+    def list(self, request, *args, **kwargs):
+        return self.versioned_response(
+            request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.versioned_response(
+            request, super().retrieve, *args, **kwargs)
+
+    def versioned_response(self, request, handler, *args, **kwargs):
+        model = self.get_queryset().model
+        version, last_modified = get_version(model)
+        path_hash = md5(request.get_full_path().encode()).hexdigest()
+        etag = quote_etag(f'{version}-{path_hash}')
+        headers = {
+            'ETag': etag,
+            'Last-Modified': http_date(last_modified),
+            'Cache-Control': f'public, max-age={settings.CATALOG_MAX_AGE}',
+        }
+        if self.is_not_modified(request, etag, last_modified):
+            return Response(status=status.HTTP_304_NOT_MODIFIED,
+                            headers=headers)
+        key = f'catalog:{model._meta.label_lower}:{version}:{path_hash}'
+        data = cache.get(key)
+        if data is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            data = response.data
+            cache.set(key, data, settings.CATALOG_VERSION_TTL)
+        return Response(data, headers=headers)
+
+    @staticmethod
+    def is_not_modified(request, etag, last_modified):
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match is not None:
+            etags = parse_etags(if_none_match)
+            return '*' in etags or etag in etags
+        if_modified_since = parse_http_date_safe(
+            request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+        return (
+            if_modified_since is not None
+            and last_modified <= if_modified_since
+        )
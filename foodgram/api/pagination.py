@@ -0,0 +1,171 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class PageLimitPagination(PageNumberPagination):
+    """Постраничная выдача: ?page= и ?limit= (размер страницы, не больше
+    MAX_PAGE_SIZE)."""
+    page_size_query_param = 'limit'
+
+    @property
+    def max_page_size(self):
+        return settings.MAX_PAGE_SIZE
+
+
+class KeysetPagination(BasePagination):
+    """Курсорная (keyset) пагинация по уникальному набору полей.
+
+    Страница выбирается условием WHERE по значениям ключа последней
+    записи, поэтому стоимость запроса не зависит от глубины прокрутки,
+    а новые записи не сдвигают уже полученные страницы.
+    Курсор непрозрачен для клиента: base64 от JSON со значениями ключа.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Некорректный курсор.'
+
+    def __init__(self, ordering):
+        self.ordering = tuple(ordering)
+        self.page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+        self.max_page_size = settings.MAX_PAGE_SIZE
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            data = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            values, reverse = data['v'], bool(data.get('r'))
+            if len(values) != len(self.ordering):
+                raise ValueError
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    def encode_cursor(self, instance, reverse):
+        values = [
+            str(getattr(instance, field.lstrip('-')))
+            for field in self.ordering
+        ]
+        encoded = urlsafe_b64encode(json.dumps(
+            {'v': values, 'r': int(reverse)}).encode('ascii')).decode('ascii')
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, encoded)
+
+    def keyset_filter(self, queryset, values, reverse):
+        """(a, b) после (va, vb): a > va OR (a = va AND b > vb)."""
+        model = queryset.model
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            try:
+                value = model._meta.get_field(name).to_python(value)
+            except ValidationError:
+                raise NotFound(self.invalid_cursor_message)
+            descending = field.startswith('-') != reverse
+            lookup = f'{name}__lt' if descending else f'{name}__gt'
+            condition |= Q(**equal, **{lookup: value})
+            equal[name] = value
+        return queryset.filter(condition)
+
+    def get_ordering(self, reverse):
+        if not reverse:
+            return self.ordering
+        return tuple(
+            field[1:] if field.startswith('-') else f'-{field}'
+            for field in self.ordering
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+        values, reverse = self.decode_cursor(request)
+        self.count = self.get_count(queryset, request)
+        if values is not None:
+            queryset = self.keyset_filter(queryset, values, reverse)
+        results = list(
+            queryset.order_by(*self.get_ordering(reverse))[:page_size + 1])
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if reverse:
+            results.reverse()
+            has_next, has_previous = values is not None, has_more
+        else:
+            has_next, has_previous = has_more, values is not None
+        self.next_link = (
+            self.encode_cursor(results[-1], False)
+            if has_next and results else None
+        )
+        self.previous_link = (
+            self.encode_cursor(results[0], True)
+            if has_previous and results else None
+        )
+        return results
+
+    def get_count(self, queryset, request):
+        """Приблизительное число записей: кешируется на COUNT_CACHE_TTL."""
+        if request.query_params.get(self.count_query_param) is None:
+            return None
+        params = remove_query_param(
+            remove_query_param(self.base_url, self.cursor_query_param),
+            self.page_size_query_param)
+        key = 'keyset-count:' + md5(
+            f'{request.user.pk}:{params}'.encode()).hexdigest()
+        count = cache.get(key)
+        if count is None:
+            count = queryset.order_by().count()
+            cache.set(key, count, settings.PAGINATION_COUNT_CACHE_TTL)
+        return count
+
+    def get_paginated_response(self, data):
+        response = OrderedDict([
+            ('next', self.next_link),
+            ('previous', self.previous_link),
+            ('results', data),
+        ])
+        if self.count is not None:
+            response['count'] = self.count
+            response.move_to_end('count', last=False)
+        return Response(response)
+
+
+class PageOrCursorPagination(PageLimitPagination):
+    """?page=/?limit= по умолчанию, keyset-пагинация при наличии ?cursor.
+
+    Порядок ключа берётся из атрибута вьюсета cursor_ordering.
+    Первая страница в курсорном режиме запрашивается как ?cursor=.
+    """
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if KeysetPagination.cursor_query_param in request.query_params:
+            self.keyset = KeysetPagination(view.cursor_ordering)
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
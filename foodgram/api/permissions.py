@@ -1,3 +1,6 @@
+from hmac import compare_digest
+
+from django.conf import settings
 from rest_framework import permissions
 
 
@@ -10,3 +13,27 @@ class IsAuthorOrReadOnly(permissions.BasePermission):
 
     def has_object_permission(self, request, view, obj):
         return obj.author == request.user
+
+
+class IsAdminOrMetricsHost(permissions.BasePermission):
+    """Метрики: администраторы, запросы с заголовком
+    Authorization: Bearer METRICS_TOKEN и адреса из METRICS_ALLOWED_IPS.
+
+    Адрес берется из REMOTE_ADDR, то есть это адрес того, кто открыл
+    соединение с gunicorn. За nginx это адрес nginx, поэтому
+    METRICS_ALLOWED_IPS подходит только для сборщика, который ходит в
+    gunicorn напрямую; через прокси метрики отдаются по токену.
+    """
+    def has_permission(self, request, view):
+        return (
+            request.user.is_staff
+            or self.has_token(request)
+            or request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+        )
+
+    @staticmethod
+    def has_token(request):
+        token = settings.METRICS_TOKEN
+        header = request.META.get('HTTP_AUTHORIZATION', '')
+        return bool(token) and compare_digest(
+            header.encode(), f'Bearer {token}'.encode())
@@ -0,0 +1,47 @@
+"""PostgreSQL с пулом соединений процесса (api/connections.py).
+
+Соединение берется из пула при первом обращении потока к БД и
+возвращается в пул вместо закрытия, когда Django закрывает его в конце
+запроса (CONN_MAX_AGE = 0).
+"""
+from django.db.backends.postgresql import base
+from psycopg2 import extensions
+
+from api.connections import ConnectionPool, get_pool
+
+
+class PostgreSQLPool(ConnectionPool):
+    def reset(self, connection):
+        if connection.closed:
+            return False
+        try:
+            if (connection.get_transaction_status()
+                    != extensions.TRANSACTION_STATUS_IDLE):
+                connection.rollback()
+        except base.Database.Error:
+            return False
+        return (connection.get_transaction_status()
+                == extensions.TRANSACTION_STATUS_IDLE)
+
+    def is_healthy(self, connection):
+        if connection.closed:
+            return False
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except base.Database.Error:
+            return False
+        return True
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_new_connection(self, conn_params):
+        connect = super().get_new_connection
+        return get_pool(self.alias, PostgreSQLPool).checkout(
+            lambda: connect(conn_params))
+
+    def _close(self):
+        if self.connection is not None:
+            # После серьезной ошибки соединение в пул не возвращаем
+            get_pool(self.alias, PostgreSQLPool).checkin(
+                self.connection, discard=self.errors_occurred)
@@ -0,0 +1,29 @@
+import json
+
+from rest_framework import renderers
+
+
+class PlainTextRenderer(renderers.BaseRenderer):
+    """Список покупок текстом (?format=txt).
+
+    Строки отдаются как есть; ответ об ошибке {'detail': ...} - текстом
+    сообщения, остальные данные - в json.
+    """
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if isinstance(data, (str, bytes)):
+            return data
+        if isinstance(data, dict) and list(data) == ['detail']:
+            return str(data['detail'])
+        return json.dumps(data, ensure_ascii=False)
+
+
+class CSVRenderer(PlainTextRenderer):
+    """Список покупок в csv (?format=csv)."""
+    media_type = 'text/csv'
+    format = 'csv'
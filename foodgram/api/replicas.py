@@ -0,0 +1,143 @@
+"""Чтение с реплик базы данных.
+
+GET- и HEAD-запросы к API читают с одной из реплик из DB_REPLICAS,
+все записи и чтения в пишущих запросах идут в основную базу
+(ReadReplicaMiddleware выбирает реплику, ReplicaRouter направляет
+запросы). Чтобы клиент сразу видел свои изменения, после успешного
+пишущего запроса его чтения REPLICA_STICKY_SECONDS секунд тоже идут в
+основную базу: клиент узнается по заголовку Authorization или cookie
+сессии, отметка хранится в кеше Django (для нескольких воркеров нужен
+общий кеш).
+
+Раз в REPLICA_HEALTH_INTERVAL секунд каждая реплика проверяется
+запросом; недоступная или отстающая больше REPLICA_MAX_LAG секунд
+реплика исключается, без здоровых реплик чтение идет в основную базу.
+"""
+import logging
+import random
+import threading
+import time
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# Модели, которые всегда читаются с основной базы: токен, выданный при
+# входе, должен работать сразу, даже если реплика отстает
+PRIMARY_MODELS = {'authtoken.token'}
+# Отставание реплики PostgreSQL в секундах; 0, если все полученное
+# из WAL уже применено
+LAG_QUERIES = {
+    'postgresql': (
+        'SELECT CASE WHEN pg_last_wal_receive_lsn() = '
+        'pg_last_wal_replay_lsn() THEN 0 ELSE EXTRACT(EPOCH FROM '
+        'now() - pg_last_xact_replay_timestamp()) END'
+    ),
+}
+
+_state = threading.local()
+
+
+def get_replicas():
+    return [alias for alias in settings.DATABASES if alias != DEFAULT_DB_ALIAS]
+
+
+def check_replica(alias):
+    """True, если реплика отвечает и отстает не больше REPLICA_MAX_LAG."""
+    connection = connections[alias]
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(LAG_QUERIES.get(connection.vendor, 'SELECT 0'))
+            lag = cursor.fetchone()[0] or 0
+    except DatabaseError:
+        logger.warning('Реплика %s недоступна', alias, exc_info=True)
+        connection.close()
+        return False
+    if lag > settings.REPLICA_MAX_LAG:
+        logger.warning('Реплика %s отстает на %.1f с', alias, lag)
+        return False
+    return True
+
+
+class ReplicaPool:
+    """Здоровые реплики; состояние перепроверяется по интервалу."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._healthy = []
+        self._checked_at = None
+
+    def invalidate(self):
+        with self._lock:
+            self._checked_at = None
+
+    def healthy(self):
+        with self._lock:
+            if (self._checked_at is None
+                    or time.monotonic() - self._checked_at
+                    > settings.REPLICA_HEALTH_INTERVAL):
+                self._healthy = [
+                    alias for alias in get_replicas() if check_replica(alias)
+                ]
+                self._checked_at = time.monotonic()
+            return self._healthy
+
+    def choose(self):
+        """Случайная здоровая реплика или None."""
+        healthy = self.healthy()
+        return random.choice(healthy) if healthy else None
+
+
+replica_pool = ReplicaPool()
+
+
+def sticky_key(request):
+    """Ключ клиента в кеше или None для анонимного клиента."""
+    credentials = (
+        request.META.get('HTTP_AUTHORIZATION')
+        or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    )
+    if not credentials:
+        return None
+    return 'replica-sticky:' + md5(credentials.encode()).hexdigest()
+
+
+def is_sticky(request):
+    key = sticky_key(request)
+    return key is not None and cache.get(key) is not None
+
+
+def stick_to_primary(request):
+    key = sticky_key(request)
+    if key is not None:
+        cache.set(key, 1, settings.REPLICA_STICKY_SECONDS)
+
+
+def use_replica(alias):
+    """Реплика для чтений в текущем потоке; None - основная база."""
+    _state.replica = alias
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replica = getattr(_state, 'replica', None)
+        if (replica is None
+                or model._meta.label_lower in PRIMARY_MODELS
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return replica
+
+    def db_for_write(self, model, **hints):
+        # Запрос что-то записал: дальше читаем свои же изменения
+        _state.replica = None
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схему реплик приносит репликация
+        return db == DEFAULT_DB_ALIAS
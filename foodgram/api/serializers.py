@@ -1,23 +1,32 @@
 import base64
+from collections import OrderedDict
 
+from django.conf import settings
 from django.core.files.base import ContentFile
 from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db import transaction
+from django.db.models import Manager
 
 from djoser.serializers import UserSerializer
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 
 from users.models import CustomUser
+from dish import shopping_list
+from dish.cook_index import schedule_cook_update
+from dish.images import schedule_variants
+from dish.membership import get_membership
+from dish.search import schedule_search_update
+from dish.similarity import schedule_signature_update
 from dish.models import (
     Tag,
     Ingredient,
     Recipe,
     RecipeIngredientAmount,
-    Subscription,
-    Favorite,
-    Cart
 )
 
+from .fragments import get_fragments
+
 
 class Base64ImageField(serializers.ImageField):
     def to_internal_value(self, data):
@@ -29,6 +38,32 @@ class Base64ImageField(serializers.ImageField):
         return super().to_internal_value(data)
 
 
+class RecipeImagesMixin(serializers.Serializer):
+    """Уменьшенные копии фото рецепта и srcset для каждого формата."""
+    images = serializers.SerializerMethodField()
+
+    def get_images(self, obj):
+        request = self.context.get('request')
+        images = {}
+        srcset = {}
+        variants = sorted(obj.image_variants.all(), key=lambda v: v.width)
+        for variant in variants:
+            url = variant.image.url
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            images.setdefault(variant.name, {
+                'width': variant.width, 'height': variant.height})
+            images[variant.name][variant.format] = url
+            srcset.setdefault(variant.format, []).append(
+                f'{url} {variant.width}w')
+        if images:
+            images['srcset'] = {
+                image_format: ', '.join(items)
+                for image_format, items in srcset.items()
+            }
+        return images
+
+
 class CustomUserCreateSerializer(UserSerializer):
     """Сериализатор создания юзера."""
     class Meta:
@@ -49,12 +84,7 @@ class CustomUserSerializer(UserSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        if user.is_authenticated:
-            return Subscription.objects.filter(
-                subscriber=user, author=obj
-            ).exists()
-        return False
+        return get_membership(self.context.get('request')).follows(obj.id)
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -97,16 +127,46 @@ class AuthorSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        if user.is_authenticated and Subscription.objects.filter(
-            subscriber=user, author=obj
-        ).exists():
-            return True
-        return False
+        return get_membership(self.context.get('request')).follows(obj.id)
+
+
+class AuthorFragmentSerializer(serializers.ModelSerializer):
+    """Автор рецепта без флага подписки."""
+    class Meta:
+        model = CustomUser
+        fields = ('email', 'id', 'username', 'first_name', 'last_name')
 
 
-class RecipeSerializer(serializers.ModelSerializer):
-    """Показывает список рецептов."""
+class RecipeFragmentSerializer(RecipeImagesMixin,
+                               serializers.ModelSerializer):
+    """Общая для всех пользователей часть рецепта (api/fragments.py)."""
+    tags = TagSerializer(many=True, read_only=True)
+    author = AuthorFragmentSerializer()
+    ingredients = RecipeIngredientAmountSerializer(
+        source='recipeingredientamount_set', many=True)
+
+    class Meta:
+        model = Recipe
+        fields = (
+            'id', 'tags', 'author', 'ingredients',
+            'name', 'image', 'images', 'text', 'cooking_time',
+        )
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    """Список рецептов: фрагменты страницы читаются из кеша разом."""
+    def to_representation(self, data):
+        recipes = list(data.all() if isinstance(data, Manager) else data)
+        return self.child.overlay_many(recipes)
+
+
+class RecipeSerializer(RecipeImagesMixin, serializers.ModelSerializer):
+    """Показывает список рецептов.
+
+    Общая часть берется из кеша фрагментов, флаги пользователя
+    (is_favorited, is_in_shopping_cart, author.is_subscribed)
+    накладываются поверх.
+    """
     tags = TagSerializer(many=True, read_only=True)
     author = AuthorSerializer()
     ingredients = RecipeIngredientAmountSerializer(
@@ -119,20 +179,40 @@ class RecipeSerializer(serializers.ModelSerializer):
         fields = (
             'id', 'tags', 'author', 'ingredients',
             'is_favorited', 'is_in_shopping_cart',
-            'name', 'image', 'text', 'cooking_time',
+            'name', 'image', 'images', 'text', 'cooking_time',
         )
+        list_serializer_class = RecipeListSerializer
 
     def get_is_favorited(self, obj):
-        user = self.context.get('request').user
-        if user.is_authenticated:
-            return Favorite.objects.filter(user=user, recipe=obj.id).exists()
-        return False
+        return get_membership(
+            self.context.get('request')).is_favorited(obj.id)
 
     def get_is_in_shopping_cart(self, obj):
-        user = self.context.get('request').user
-        if user.is_authenticated:
-            return Cart.objects.filter(user=user, recipe=obj.id).exists()
-        return False
+        return get_membership(self.context.get('request')).is_in_cart(obj.id)
+
+    def overlay_many(self, recipes):
+        membership = get_membership(self.context.get('request'))
+        return [
+            self.overlay(fragment, membership)
+            for fragment in get_fragments(
+                recipes, RecipeFragmentSerializer, self.context)
+        ]
+
+    def overlay(self, fragment, membership):
+        flags = {
+            'is_favorited': membership.is_favorited(fragment['id']),
+            'is_in_shopping_cart': membership.is_in_cart(fragment['id']),
+            'author': dict(
+                fragment['author'],
+                is_subscribed=membership.follows(fragment['author']['id'])),
+        }
+        return OrderedDict(
+            (field, flags[field] if field in flags else fragment[field])
+            for field in self.Meta.fields
+        )
+
+    def to_representation(self, instance):
+        return self.overlay_many([instance])[0]
 
 
 class IngredientAmountSerializerWrite(serializers.ModelSerializer):
@@ -153,8 +233,7 @@ class IngredientAmountSerializerWrite(serializers.ModelSerializer):
 
 class RecipeSerializerWrite(serializers.ModelSerializer):
     """Принимает данные для записи рецепта."""
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(), many=True)
+    tags = serializers.ListField(child=serializers.IntegerField())
     ingredients = IngredientAmountSerializerWrite(many=True, required=True)
     image = Base64ImageField(required=True, allow_null=False)
     author = serializers.PrimaryKeyRelatedField(
@@ -178,55 +257,117 @@ class RecipeSerializerWrite(serializers.ModelSerializer):
         if len(value) == 0:
             raise serializers.ValidationError(
                 'Должен быть хотя бы один ингредиент!')
-        return value
+        amounts = {item['id']: item['amount'] for item in value}
+        if len(amounts) != len(value):
+            raise serializers.ValidationError(
+                'Ингредиенты не должны повторяться!')
+        found = Ingredient.objects.in_bulk(list(amounts))
+        missing = sorted(set(amounts) - set(found))
+        if missing:
+            raise serializers.ValidationError(
+                f'Нет ингредиентов с id: {", ".join(map(str, missing))}')
+        return amounts
 
     def validate_tags(self, value):
-        for item in value:
-            if not Tag.objects.filter(name=item).exists():
-                raise serializers.ValidationError('Теги обязательны!')
-        return value
+        if len(value) == 0:
+            raise serializers.ValidationError('Теги обязательны!')
+        tags = set(value)
+        missing = sorted(tags - set(Tag.objects.filter(
+            id__in=tags).values_list('id', flat=True)))
+        if missing:
+            raise serializers.ValidationError(
+                f'Нет тегов с id: {", ".join(map(str, missing))}')
+        return list(tags)
 
     def to_representation(self, instance):
-        return RecipeSerializer(instance).data
-
-    def add_ingredients(self, recipe, ingredients):
-        RecipeIngredientAmount.objects.bulk_create([RecipeIngredientAmount(
-            ingredient=Ingredient.objects.get(id=ingred['id']),
-            recipe=recipe,
-            amount=ingred['amount']) for ingred in ingredients])
-
+        # Версия рецепта увеличена в БД при записи, в памяти - старая
+        instance.refresh_from_db(fields=['cache_version'])
+        return RecipeSerializer(instance, context=self.context).data
+
+    def set_ingredients(self, recipe, amounts, created=False):
+        """Применяет к рецепту только разницу в ингредиентах.
+
+        Возвращает изменение количества по ингредиентам.
+        """
+        existing = {} if created else {
+            item.ingredient_id: item
+            for item in RecipeIngredientAmount.objects.filter(recipe=recipe)
+        }
+        changes = {}
+        removed = []
+        for ingredient_id, item in existing.items():
+            if ingredient_id not in amounts:
+                removed.append(item.id)
+                changes[ingredient_id] = -item.amount
+        if removed:
+            RecipeIngredientAmount.objects.filter(id__in=removed).delete()
+        changed = []
+        for ingredient_id, item in existing.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and item.amount != amount:
+                changes[ingredient_id] = amount - item.amount
+                item.amount = amount
+                changed.append(item)
+        if changed:
+            RecipeIngredientAmount.objects.bulk_update(changed, ['amount'])
+        added = {
+            ingredient_id: amount
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in existing
+        }
+        RecipeIngredientAmount.objects.bulk_create([
+            RecipeIngredientAmount(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount)
+            for ingredient_id, amount in added.items()
+        ])
+        changes.update(added)
+        return changes
+
+    @transaction.atomic
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
         recipe = Recipe.objects.create(**validated_data)
-        self.add_ingredients(recipe, ingredients)
+        self.set_ingredients(recipe, ingredients, created=True)
         recipe.tags.set(tags)
+        schedule_search_update(recipe.id)
+        schedule_signature_update(recipe.id)
+        schedule_cook_update(recipe.id)
+        schedule_variants(recipe.id)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        recipe = instance
-        tags = validated_data.pop('tags')
-        ingredients = validated_data.pop('ingredients')
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('ingredients', None)
+        if ingredients is not None:
+            shopping_list.lock_recipes([instance.id])
         instance = super().update(instance, validated_data)
-        instance.tags.clear()
-        instance.tags.set(tags)
-        RecipeIngredientAmount.objects.filter(recipe=instance).delete()
-        self.add_ingredients(recipe, ingredients)
+        if tags is not None:
+            instance.tags.set(tags)
+        if ingredients is not None:
+            changes = self.set_ingredients(instance, ingredients)
+            shopping_list.update_for_recipe(instance.id, changes)
+            if changes:
+                schedule_signature_update(instance.id)
+                schedule_cook_update(instance.id)
+        schedule_search_update(instance.id)
+        if 'image' in validated_data:
+            schedule_variants(instance.id)
         return instance
 
 
-class ShortRecipeSerializer(serializers.ModelSerializer):
+class ShortRecipeSerializer(RecipeImagesMixin, serializers.ModelSerializer):
     """Показывает короткую информамцию по рецепту."""
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'images', 'cooking_time')
 
 
 class SubscribeSerializer(serializers.ModelSerializer):
     """Подписка и отписка от user_id."""
     recipes = ShortRecipeSerializer(many=True)
     is_subscribed = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
 
     class Meta:
         model = CustomUser
@@ -238,18 +379,20 @@ class SubscribeSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        if user.is_authenticated:
-            return Subscription.objects.filter(
-                subscriber=user, author=obj.id).exists()
-        return False
+        return get_membership(self.context.get('request')).follows(obj.id)
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
 
-
-class FavoriteSerializer(serializers.ModelSerializer):
+class FavoriteSerializer(RecipeImagesMixin, serializers.ModelSerializer):
     """Выдает данные по рецепту при подписке."""
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'images', 'cooking_time')
+
+
+class BulkIdsSerializer(serializers.Serializer):
+    """Список id для пакетного добавления и удаления."""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BULK_MAX_IDS,
+    )
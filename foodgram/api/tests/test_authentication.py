@@ -0,0 +1,74 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.authentication import cache_key
+from users.models import CustomUser
+
+
+class TokenAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(
+            username='cook', email='cook@example.com', password='p',
+            first_name='Повар', last_name='Поваров')
+        self.client = APIClient()
+        response = self.client.post(
+            '/api/auth/token/login/',
+            {'email': 'cook@example.com', 'password': 'p'}, format='json')
+        self.key = response.json()['auth_token']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.key}')
+
+    def me(self):
+        return self.client.get('/api/users/me/')
+
+    @override_settings(SHARED_CACHE=True)
+    def test_cached_user_skips_token_query(self):
+        self.assertEqual(self.me().status_code, 200)
+        self.assertIsNotNone(cache.get(cache_key(self.key)))
+        with self.assertNumQueries(0):
+            response = self.me()
+        self.assertEqual(response.json()['username'], 'cook')
+
+    @override_settings(SHARED_CACHE=True)
+    def test_logout_invalidates_cached_token(self):
+        self.assertEqual(self.me().status_code, 200)
+        response = self.client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, 204)
+        self.assertIsNone(cache.get(cache_key(self.key)))
+        self.assertEqual(self.me().status_code, 401)
+
+    @override_settings(SHARED_CACHE=True)
+    def test_deactivation_invalidates_cached_token(self):
+        self.assertEqual(self.me().status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.me().status_code, 401)
+
+    @override_settings(SHARED_CACHE=True)
+    def test_password_change_keeps_deferred_fields(self):
+        response = self.client.post(
+            '/api/users/set_password/',
+            {'current_password': 'p', 'new_password': 'Zx9-long-pass'},
+            format='json')
+        self.assertEqual(response.status_code, 204)
+        user = CustomUser.objects.get(pk=self.user.pk)
+        self.assertTrue(user.check_password('Zx9-long-pass'))
+        self.assertEqual(user.date_joined, self.user.date_joined)
+
+    @override_settings(SHARED_CACHE=False)
+    def test_local_cache_is_not_used(self):
+        self.assertEqual(self.me().status_code, 200)
+        self.assertIsNone(cache.get(cache_key(self.key)))
+        Token.objects.filter(key=self.key).delete()
+        self.assertEqual(self.me().status_code, 401)
+
+    @override_settings(AUTH_TOKEN_TTL=1)
+    def test_expired_token_is_deleted(self):
+        Token.objects.filter(key=self.key).update(
+            created=Token.objects.get(key=self.key).created.replace(
+                year=2000))
+        response = self.me()
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(Token.objects.filter(key=self.key).exists())
@@ -0,0 +1,62 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import transaction
+from django.test import TransactionTestCase
+from rest_framework.test import APIClient
+
+from dish import versions
+from dish.models import Tag
+
+
+class CatalogCacheTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        Tag.objects.create(name='Завтрак', slug='breakfast', color='#E26C2D')
+
+    def test_etag_changes_only_on_write(self):
+        etag = self.client.get('/api/tags/')['ETag']
+        # Версия перечитывается из базы: истек срок в кеше или другой
+        # воркер с пустым кешем
+        cache.clear()
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Tag.objects.create(name='Обед', slug='lunch', color='#49B64E')
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.json()), 2)
+
+    def test_cached_list_skips_database(self):
+        self.client.get('/api/tags/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/tags/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_version_read_during_write_is_not_kept(self):
+        version = versions.get_version(Tag)
+        cache.clear()
+
+        def read_before_commit(model):
+            # Читатель прочитал строку версии, запись закоммитилась
+            # раньше, чем он положил версию в кеш
+            stale = load_version(model)
+            Tag.objects.create(name='Обед', slug='lunch', color='#49B64E')
+            return stale
+
+        load_version = versions.load_version
+        with mock.patch.object(versions, 'load_version',
+                               side_effect=read_before_commit):
+            self.assertEqual(versions.get_version(Tag), version)
+        self.assertEqual(versions.get_version(Tag)[0], version[0] + 1)
+
+    def test_version_cached_inside_write_is_not_kept(self):
+        version = versions.get_version(Tag)
+        with transaction.atomic():
+            Tag.objects.create(name='Обед', slug='lunch', color='#49B64E')
+            # Другой запрос еще видит старую строку версии
+            with mock.patch.object(versions, 'load_version',
+                                   return_value=version):
+                self.assertEqual(versions.get_version(Tag), version)
+        self.assertEqual(versions.get_version(Tag)[0], version[0] + 1)
@@ -0,0 +1,48 @@
+import time
+from unittest import mock
+
+from django.core.signals import request_started
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from api.connections import ConnectionPool
+
+
+class RecordingPool(ConnectionPool):
+    def __init__(self, alias):
+        super().__init__(alias)
+        self.checks = 0
+
+    def is_healthy(self, connection):
+        self.checks += 1
+        return True
+
+
+@override_settings(DB_CONN_HEALTH_CHECKS=True, DB_CONN_HEALTH_CHECK_IDLE=60,
+                   DB_POOL_SIZE=1, DB_CONN_MAX_AGE=600)
+class HealthCheckTests(TestCase):
+    def test_recently_used_connection_is_not_checked(self):
+        connection.ensure_connection()
+        connection.released_at = time.monotonic()
+        with mock.patch.object(connection, 'is_usable') as is_usable:
+            request_started.send(sender=self.__class__)
+        is_usable.assert_not_called()
+
+    def test_idle_connection_is_checked(self):
+        connection.ensure_connection()
+        connection.released_at = time.monotonic() - 120
+        with mock.patch.object(
+                connection, 'is_usable', return_value=True) as is_usable:
+            request_started.send(sender=self.__class__)
+        is_usable.assert_called_once()
+
+    def test_pool_checks_only_idle_connections(self):
+        pool = RecordingPool('test')
+        raw = pool.checkout(object)
+        pool.checkin(raw)
+        self.assertIs(pool.checkout(object), raw)
+        self.assertEqual(pool.checks, 0)
+        pool.checkin(raw)
+        with override_settings(DB_CONN_HEALTH_CHECK_IDLE=0):
+            self.assertIs(pool.checkout(object), raw)
+        self.assertEqual(pool.checks, 1)
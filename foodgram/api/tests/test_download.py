@@ -0,0 +1,77 @@
+import csv
+import io
+import json
+
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from dish.models import Cart
+from dish.relations import add_relations
+from dish.tests.data import make_ingredients, make_recipe, make_user
+
+URL = '/api/recipes/download_shopping_cart/'
+
+
+class DownloadShoppingCartTests(TestCase):
+    def setUp(self):
+        self.user = make_user('user')
+        flour, sugar = make_ingredients('мука', 'сахар')
+        pie = make_recipe(self.user, 'Пирог', {flour: 200, sugar: 50})
+        cake = make_recipe(self.user, 'Торт', {sugar: 100})
+        add_relations(Cart, self.user, [pie.pk, cake.pk])
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def download(self, query='', **headers):
+        response = self.client.get(URL + query, **headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def assert_file(self, response, content_type, extension):
+        self.assertEqual(
+            response['Content-Type'], f'{content_type}; charset=utf-8')
+        self.assertEqual(
+            response['Content-Disposition'],
+            f'attachment; filename=buy_list.{extension}')
+
+    def test_txt_by_default(self):
+        response, content = self.download()
+        self.assert_file(response, 'text/plain', 'txt')
+        self.assertEqual(content, (
+            'Список покупок FoodGram:\n\n'
+            'мука (г) - 200\n'
+            'сахар (г) - 150\n'
+            '\nУдачных покупок!\n'))
+
+    def test_csv(self):
+        response, content = self.download('?format=csv')
+        self.assert_file(response, 'text/csv', 'csv')
+        self.assertEqual(list(csv.reader(io.StringIO(content))), [
+            ['name', 'measurement_unit', 'amount'],
+            ['мука', 'г', '200'],
+            ['сахар', 'г', '150'],
+        ])
+
+    def test_json(self):
+        for query, headers in (
+                ('?format=json', {}),
+                ('', {'HTTP_ACCEPT': 'application/json'})):
+            with self.subTest(query=query, headers=headers):
+                response, content = self.download(query, **headers)
+                self.assert_file(response, 'application/json', 'json')
+                self.assertEqual(json.loads(content), [
+                    {'name': 'мука', 'measurement_unit': 'г',
+                     'amount': 200},
+                    {'name': 'сахар', 'measurement_unit': 'г',
+                     'amount': 150},
+                ])
+
+    def test_empty_cart(self):
+        self.client.force_authenticate(make_user('other'))
+        _, content = self.download('?format=json')
+        self.assertEqual(json.loads(content), [])
+
+    def test_unknown_format(self):
+        response = self.client.get(URL + '?format=pdf')
+        self.assertEqual(response.status_code, 404)
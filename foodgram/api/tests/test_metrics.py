@@ -0,0 +1,72 @@
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from api.metrics import registry
+from dish.tests.data import make_user
+
+OUTSIDE = '10.0.0.1'
+
+
+class RequestMetricsMiddlewareTests(TestCase):
+    def test_server_timing_and_histograms(self):
+        response = self.client.get('/api/tags/')
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(
+            response['Server-Timing'],
+            r'^db;dur=[\d.]+;desc="\d+ queries", app;dur=[\d.]+$')
+        output = registry.render()
+        self.assertRegex(
+            output,
+            r'foodgram_requests_total\{view="tags-list",method="GET",'
+            r'status="200"\} \d+')
+        self.assertIn(
+            'foodgram_request_db_queries_bucket{view="tags-list",'
+            'method="GET",le="+Inf"}', output)
+
+    def test_unknown_method_is_other(self):
+        self.client.generic('BREW', '/api/tags/')
+        output = registry.render()
+        self.assertIn('method="OTHER"', output)
+        self.assertNotIn('method="BREW"', output)
+
+
+@override_settings(METRICS_ALLOWED_IPS=['127.0.0.1'], METRICS_TOKEN='secret')
+class MetricsEndpointTests(TestCase):
+    def get(self, remote_addr=OUTSIDE, **headers):
+        return APIClient(REMOTE_ADDR=remote_addr).get(
+            '/api/metrics', **headers)
+
+    def assert_metrics(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        self.assertIn(
+            '# TYPE foodgram_requests_total counter',
+            response.content.decode())
+        self.assertIn(
+            '# TYPE foodgram_db_connects_total counter',
+            response.content.decode())
+
+    def test_allowed_address(self):
+        self.assert_metrics(self.get('127.0.0.1'))
+
+    def test_token(self):
+        self.assert_metrics(self.get(HTTP_AUTHORIZATION='Bearer secret'))
+
+    def test_staff(self):
+        admin = make_user('admin')
+        admin.is_staff = True
+        admin.save()
+        client = APIClient(REMOTE_ADDR=OUTSIDE)
+        client.force_authenticate(admin)
+        self.assert_metrics(client.get('/api/metrics'))
+
+    def test_denied(self):
+        for headers in ({}, {'HTTP_AUTHORIZATION': 'Bearer wrong'}):
+            with self.subTest(headers=headers):
+                self.assertIn(
+                    self.get(**headers).status_code, (401, 403))
+
+    @override_settings(METRICS_TOKEN='')
+    def test_empty_token_is_disabled(self):
+        self.assertIn(
+            self.get(HTTP_AUTHORIZATION='Bearer ').status_code, (401, 403))
@@ -0,0 +1,52 @@
+import json
+from base64 import urlsafe_b64encode
+
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from dish.tests.data import make_recipe, make_user
+
+
+def cursor(values):
+    return urlsafe_b64encode(json.dumps({'v': values}).encode()).decode()
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        author = make_user('author')
+        self.recipes = [
+            make_recipe(author, f'Рецепт {number}', {})
+            for number in range(5)
+        ]
+        self.client = APIClient()
+
+    def test_pages_follow_each_other(self):
+        response = self.client.get('/api/recipes/?cursor=&limit=2')
+        names = [recipe['name'] for recipe in response.json()['results']]
+        while response.json()['next']:
+            response = self.client.get(response.json()['next'])
+            names += [recipe['name'] for recipe in response.json()['results']]
+        self.assertEqual(
+            names, [recipe.name for recipe in reversed(self.recipes)])
+
+    def test_tampered_cursor_is_not_found(self):
+        for value in (cursor(['not-a-date', '1']), cursor(['1']), '%%%'):
+            with self.subTest(value=value):
+                response = self.client.get(f'/api/recipes/?cursor={value}')
+                self.assertEqual(response.status_code, 404)
+
+
+@override_settings(MAX_PAGE_SIZE=3)
+class PageSizeLimitTests(TestCase):
+    def setUp(self):
+        author = make_user('author')
+        for number in range(5):
+            make_recipe(author, f'Рецепт {number}', {})
+        self.client = APIClient()
+
+    def test_page_size_is_capped(self):
+        for query in ('limit=1000000', 'cursor=&limit=1000000'):
+            with self.subTest(query=query):
+                response = self.client.get(f'/api/recipes/?{query}')
+                self.assertEqual(len(response.json()['results']), 3)
+                self.assertIsNotNone(response.json()['next'])
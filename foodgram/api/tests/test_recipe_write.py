@@ -0,0 +1,93 @@
+from unittest import mock
+
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from api.serializers import RecipeSerializerWrite
+from dish import shopping_list
+from dish.models import Cart, RecipeIngredientAmount
+from dish.relations import add_relations
+from dish.tests.data import make_ingredients, make_recipe, make_tag, make_user
+
+from .test_shopping_cart import expected_shopping_list
+
+
+class RecipeUpdateTests(TestCase):
+    def setUp(self):
+        self.author = make_user('author')
+        self.user = make_user('user')
+        self.flour, self.sugar, self.salt = make_ingredients(
+            'мука', 'сахар', 'соль')
+        self.breakfast, self.lunch = make_tag('breakfast'), make_tag('lunch')
+        self.pie = make_recipe(
+            self.author, 'Пирог', {self.flour: 200, self.sugar: 50},
+            [self.breakfast])
+        self.cake = make_recipe(self.author, 'Торт', {self.sugar: 100})
+        add_relations(Cart, self.user, [self.pie.pk, self.cake.pk])
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def patch(self, ingredients, tags):
+        return self.client.patch(f'/api/recipes/{self.pie.pk}/', {
+            'ingredients': [
+                {'id': ingredient.pk, 'amount': amount}
+                for ingredient, amount in ingredients.items()
+            ],
+            'tags': [tag.pk for tag in tags],
+        }, format='json')
+
+    def shopping_list(self):
+        return dict(shopping_list.get_items(self.user).values_list(
+            'ingredient__name', 'amount'))
+
+    def test_patch_applies_ingredient_diff(self):
+        response = self.patch(
+            {self.sugar: 70, self.salt: 5}, [self.breakfast, self.lunch])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            dict(RecipeIngredientAmount.objects.filter(
+                recipe=self.pie).values_list('ingredient__name', 'amount')),
+            {'сахар': 70, 'соль': 5})
+        self.assertEqual(
+            sorted(tag['slug'] for tag in response.json()['tags']),
+            ['breakfast', 'lunch'])
+        self.assertEqual(self.shopping_list(), {'сахар': 170, 'соль': 5})
+        self.assertEqual(
+            self.shopping_list(), expected_shopping_list(self.user))
+        self.pie.refresh_from_db()
+        self.assertEqual(self.pie.carts_count, 1)
+
+    def test_patch_without_changes_keeps_rows(self):
+        before = set(RecipeIngredientAmount.objects.filter(
+            recipe=self.pie).values_list('pk', flat=True))
+        response = self.patch(
+            {self.flour: 200, self.sugar: 50}, [self.breakfast])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(before, set(RecipeIngredientAmount.objects.filter(
+            recipe=self.pie).values_list('pk', flat=True)))
+        self.assertEqual(self.shopping_list(), {'мука': 200, 'сахар': 150})
+
+    def test_invalid_patch_changes_nothing(self):
+        response = self.patch({self.sugar: 0}, [self.breakfast])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.shopping_list(), {'мука': 200, 'сахар': 150})
+
+    def test_patch_locks_recipe_before_reading_ingredients(self):
+        calls = []
+        lock_recipes = shopping_list.lock_recipes
+        set_ingredients = RecipeSerializerWrite.set_ingredients
+
+        def lock(recipe_ids):
+            calls.append(('lock', list(recipe_ids)))
+            lock_recipes(recipe_ids)
+
+        def read(serializer, recipe, *args, **kwargs):
+            calls.append(('read', recipe.pk))
+            return set_ingredients(serializer, recipe, *args, **kwargs)
+
+        with mock.patch.object(shopping_list, 'lock_recipes', lock):
+            with mock.patch.object(
+                    RecipeSerializerWrite, 'set_ingredients', read):
+                self.patch({self.sugar: 70}, [self.breakfast])
+        self.assertEqual(
+            calls[:2], [('lock', [self.pie.pk]), ('read', self.pie.pk)])
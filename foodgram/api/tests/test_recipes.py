@@ -0,0 +1,123 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from dish.models import Cart, Favorite
+from dish.tests.data import make_ingredients, make_recipe, make_tag, make_user
+
+
+class RecipeQueryCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = make_user('author')
+        self.user = make_user('user')
+        self.ingredients = make_ingredients('мука', 'сахар', 'соль')
+        self.tag = make_tag('breakfast')
+        self.anonymous = APIClient()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_recipes(self, count):
+        for number in range(count):
+            recipe = make_recipe(
+                self.author, f'Рецепт {self.author.recipes.count()}',
+                {ingredient: 10 for ingredient in self.ingredients},
+                [self.tag])
+            Favorite.objects.create(user=self.user, recipe=recipe)
+            Cart.objects.create(user=self.user, recipe=recipe)
+        return recipe
+
+    def queries(self, client, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assert_constant(self, client, url, expected):
+        """Число запросов не зависит от числа рецептов на странице."""
+        self.add_recipes(2)
+        self.assertEqual(self.queries(client, url), expected)
+        self.add_recipes(8)
+        self.assertEqual(self.queries(client, url), expected)
+
+    def test_list_anonymous(self):
+        self.assert_constant(self.anonymous, '/api/recipes/', 5)
+
+    def test_list_authenticated(self):
+        self.assert_constant(self.client, '/api/recipes/', 8)
+
+    def test_cursor_list(self):
+        self.assert_constant(self.client, '/api/recipes/?cursor=', 7)
+
+    def test_detail(self):
+        recipe = self.add_recipes(1)
+        self.client.force_authenticate(self.author)
+        cache.clear()
+        with self.assertNumQueries(7):
+            response = self.client.get(f'/api/recipes/{recipe.pk}/')
+        self.assertEqual(len(response.json()['ingredients']), 3)
+
+    def test_warm_fragment_cache(self):
+        self.add_recipes(5)
+        self.queries(self.client, '/api/recipes/')
+        # Представления рецептов из кеша: без ингредиентов и тегов
+        with self.assertNumQueries(5):
+            self.client.get('/api/recipes/')
+
+
+class RecipeFilterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = make_user('author')
+        self.other = make_user('other')
+        self.user = make_user('user')
+        flour, = make_ingredients('мука')
+        breakfast, lunch, dinner = (
+            make_tag('breakfast'), make_tag('lunch'), make_tag('dinner'))
+        self.both = make_recipe(
+            self.author, 'Оба тега', {flour: 10}, [breakfast, lunch])
+        self.breakfast = make_recipe(
+            self.author, 'Завтрак', {flour: 10}, [breakfast])
+        self.lunch = make_recipe(self.other, 'Обед', {flour: 10}, [lunch])
+        self.dinner = make_recipe(
+            self.author, 'Ужин', {flour: 10}, [dinner])
+        for recipe in (self.both, self.breakfast, self.lunch):
+            Favorite.objects.create(user=self.user, recipe=recipe)
+        for recipe in (self.both, self.lunch, self.dinner):
+            Cart.objects.create(user=self.user, recipe=recipe)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get_ids(self, query):
+        response = self.client.get(f'/api/recipes/?{query}')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        ids = [item['id'] for item in data['results']]
+        self.assertEqual(len(ids), len(set(ids)))
+        return data['count'], set(ids)
+
+    def test_several_tags(self):
+        self.assertEqual(
+            self.get_ids('tags=breakfast&tags=lunch'),
+            (3, {self.both.pk, self.breakfast.pk, self.lunch.pk}))
+
+    def test_author_and_tags(self):
+        self.assertEqual(
+            self.get_ids(
+                f'author={self.author.pk}&tags=breakfast&tags=lunch'),
+            (2, {self.both.pk, self.breakfast.pk}))
+
+    def test_favorited_and_in_cart(self):
+        self.assertEqual(
+            self.get_ids('is_favorited=1&is_in_shopping_cart=1'),
+            (2, {self.both.pk, self.lunch.pk}))
+
+    def test_combined_filters_paginated(self):
+        count, ids = self.get_ids(
+            'is_favorited=1&is_in_shopping_cart=1&tags=lunch&limit=1')
+        self.assertEqual(count, 2)
+        self.assertEqual(len(ids), 1)
+        self.assertLessEqual(ids, {self.both.pk, self.lunch.pk})
@@ -0,0 +1,20 @@
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+
+class PlainTextErrorTests(TestCase):
+    def test_unauthenticated_download_shows_detail(self):
+        response = APIClient().get(
+            '/api/recipes/download_shopping_cart/?format=txt')
+        self.assertEqual(response.status_code, 401)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        self.assertEqual(
+            response.content.decode(),
+            'Учетные данные не были предоставлены.')
+
+    def test_metrics_denied_shows_detail(self):
+        response = APIClient(REMOTE_ADDR='10.0.0.1').get('/api/metrics')
+        self.assertIn(response.status_code, (401, 403))
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        self.assertEqual(
+            response.content.decode(), str(response.data['detail']))
@@ -0,0 +1,162 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from rest_framework.authtoken.models import Token
+
+from api import replicas
+from api.middleware import ReadReplicaMiddleware
+from api.replicas import ReplicaPool, ReplicaRouter, use_replica
+from dish.models import Recipe
+
+REPLICA = 'replica_1'
+
+
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+
+    def tearDown(self):
+        use_replica(None)
+
+    def test_reads_go_to_replica(self):
+        use_replica(REPLICA)
+        self.assertEqual(self.router.db_for_read(Recipe), REPLICA)
+        self.assertEqual(self.router.db_for_read(Token), DEFAULT_DB_ALIAS)
+
+    def test_without_replica(self):
+        self.assertEqual(self.router.db_for_read(Recipe), DEFAULT_DB_ALIAS)
+
+    def test_reads_after_write_go_to_primary(self):
+        use_replica(REPLICA)
+        self.assertEqual(self.router.db_for_write(Recipe), DEFAULT_DB_ALIAS)
+        self.assertEqual(self.router.db_for_read(Recipe), DEFAULT_DB_ALIAS)
+
+    def test_reads_in_transaction_go_to_primary(self):
+        use_replica(REPLICA)
+        with mock.patch.object(
+                connections[DEFAULT_DB_ALIAS], 'in_atomic_block', True):
+            self.assertEqual(
+                self.router.db_for_read(Recipe), DEFAULT_DB_ALIAS)
+
+    def test_migrations_only_on_primary(self):
+        self.assertTrue(self.router.allow_migrate(DEFAULT_DB_ALIAS, 'dish'))
+        self.assertFalse(self.router.allow_migrate(REPLICA, 'dish'))
+
+
+@override_settings(REPLICA_STICKY_SECONDS=15)
+class ReadReplicaMiddlewareTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.router = ReplicaRouter()
+        patcher = mock.patch.object(
+            replicas.replica_pool, 'choose', return_value=REPLICA)
+        self.choose = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        cache.clear()
+
+    def call(self, method, path='/api/recipes/', status=200,
+             token='first'):
+        """Базы чтений до и после записи внутри запроса."""
+        databases = []
+
+        def get_response(request):
+            databases.append(self.router.db_for_read(Recipe))
+            if method != 'GET':
+                self.router.db_for_write(Recipe)
+                databases.append(self.router.db_for_read(Recipe))
+            return HttpResponse(status=status)
+
+        request = getattr(self.factory, method.lower())(
+            path, HTTP_AUTHORIZATION=f'Token {token}')
+        ReadReplicaMiddleware(get_response)(request)
+        self.assertIsNone(getattr(replicas._state, 'replica', None))
+        return databases
+
+    def test_get_reads_from_replica(self):
+        self.assertEqual(self.call('GET'), [REPLICA])
+
+    def test_not_api_reads_from_primary(self):
+        self.assertEqual(
+            self.call('GET', path='/admin/'), [DEFAULT_DB_ALIAS])
+
+    def test_write_request_sticks_client_to_primary(self):
+        self.assertEqual(
+            self.call('POST', status=201),
+            [DEFAULT_DB_ALIAS, DEFAULT_DB_ALIAS])
+        self.assertEqual(self.call('GET'), [DEFAULT_DB_ALIAS])
+        self.assertEqual(self.call('GET', token='second'), [REPLICA])
+
+    def test_sticky_expires(self):
+        with override_settings(REPLICA_STICKY_SECONDS=0):
+            self.call('PATCH')
+        self.assertEqual(self.call('GET'), [REPLICA])
+
+    def test_failed_write_does_not_stick(self):
+        self.call('POST', status=400)
+        self.assertEqual(self.call('GET'), [REPLICA])
+
+    def test_unhealthy_replicas_fall_back_to_primary(self):
+        self.choose.return_value = None
+        self.assertEqual(self.call('GET'), [DEFAULT_DB_ALIAS])
+
+
+def replica_connection(lag=0, error=None):
+    connection = mock.MagicMock(vendor='postgresql')
+    cursor = connection.cursor.return_value.__enter__.return_value
+    cursor.fetchone.return_value = (lag, )
+    cursor.execute.side_effect = error
+    return connection
+
+
+@override_settings(REPLICA_MAX_LAG=10, REPLICA_HEALTH_INTERVAL=60)
+class ReplicaPoolTests(SimpleTestCase):
+    def setUp(self):
+        self.connections = {
+            'replica_1': replica_connection(),
+            'replica_2': replica_connection(),
+        }
+        for patcher in (
+                mock.patch.object(replicas, 'connections', self.connections),
+                mock.patch.object(replicas, 'get_replicas',
+                                  return_value=list(self.connections))):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.pool = ReplicaPool()
+
+    def test_choose_healthy(self):
+        self.assertIn(self.pool.choose(), self.connections)
+        self.assertEqual(self.pool.healthy(), ['replica_1', 'replica_2'])
+
+    def test_unavailable_replica_is_excluded(self):
+        self.connections['replica_1'] = replica_connection(
+            error=DatabaseError('connection refused'))
+        with self.assertLogs('api.replicas', 'WARNING'):
+            self.assertEqual(self.pool.healthy(), ['replica_2'])
+        self.connections['replica_1'].close.assert_called_once()
+
+    def test_lagging_replica_is_excluded(self):
+        self.connections['replica_2'] = replica_connection(lag=30)
+        with self.assertLogs('api.replicas', 'WARNING'):
+            self.assertEqual(self.pool.healthy(), ['replica_1'])
+
+    def test_no_healthy_replicas(self):
+        for alias in self.connections:
+            self.connections[alias] = replica_connection(
+                error=DatabaseError('connection refused'))
+        with self.assertLogs('api.replicas', 'WARNING'):
+            self.assertIsNone(self.pool.choose())
+
+    def test_health_is_rechecked_after_interval(self):
+        self.pool.healthy()
+        self.connections['replica_1'] = replica_connection(lag=30)
+        # До истечения интервала используется прежний результат
+        self.assertEqual(self.pool.healthy(), ['replica_1', 'replica_2'])
+        self.pool.invalidate()
+        with self.assertLogs('api.replicas', 'WARNING'):
+            self.assertEqual(self.pool.healthy(), ['replica_2'])
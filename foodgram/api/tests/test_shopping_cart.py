@@ -0,0 +1,85 @@
+from django.db.models import Sum
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from dish import shopping_list
+from dish.models import Recipe, RecipeIngredientAmount
+from dish.tests.data import make_ingredients, make_recipe, make_user
+
+
+def expected_shopping_list(user):
+    """Список покупок, посчитанный заново по корзине пользователя."""
+    return dict(RecipeIngredientAmount.objects.filter(
+        recipe__cart__user=user).values_list('ingredient__name').annotate(
+            total=Sum('amount')))
+
+
+class ShoppingCartEndpointTests(TestCase):
+    def setUp(self):
+        self.author = make_user('author')
+        self.user = make_user('user')
+        self.flour, self.sugar = make_ingredients('мука', 'сахар')
+        self.pie = make_recipe(
+            self.author, 'Пирог', {self.flour: 200, self.sugar: 50})
+        self.cake = make_recipe(self.author, 'Торт', {self.sugar: 100})
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def cart_url(self, recipe):
+        return f'/api/recipes/{recipe.pk}/shopping_cart/'
+
+    def assert_consistent(self):
+        self.assertEqual(
+            dict(shopping_list.get_items(self.user).values_list(
+                'ingredient__name', 'amount')),
+            expected_shopping_list(self.user))
+        for recipe in Recipe.objects.all():
+            self.assertEqual(recipe.carts_count, recipe.cart.count())
+            self.assertEqual(recipe.favorites_count, recipe.favorite.count())
+
+    def test_add_re_add_and_delete(self):
+        response = self.client.post(self.cart_url(self.pie))
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post(self.cart_url(self.pie))
+        self.assertEqual(response.status_code, 200)
+        self.client.post(self.cart_url(self.cake))
+        self.assert_consistent()
+        self.assertEqual(expected_shopping_list(self.user),
+                         {'мука': 200, 'сахар': 150})
+        for _ in range(2):
+            response = self.client.delete(self.cart_url(self.pie))
+            self.assertEqual(response.status_code, 204)
+            self.assert_consistent()
+        self.assertEqual(expected_shopping_list(self.user), {'сахар': 100})
+
+    def test_missing_recipe(self):
+        response = self.client.post('/api/recipes/0/shopping_cart/')
+        self.assertEqual(response.status_code, 404)
+        self.assert_consistent()
+
+    def test_bulk_add_and_remove(self):
+        ids = [self.pie.pk, self.cake.pk]
+        unknown = 10 ** 6
+        response = self.client.post(
+            '/api/recipes/shopping_cart/', {'ids': ids + [unknown]},
+            format='json')
+        self.assertEqual(response.json(), {
+            'added': sorted(ids), 'existing': [], 'missing': [unknown]})
+        response = self.client.post(
+            '/api/recipes/shopping_cart/', {'ids': ids}, format='json')
+        self.assertEqual(response.json()['existing'], sorted(ids))
+        self.assert_consistent()
+        response = self.client.delete(
+            '/api/recipes/shopping_cart/', {'ids': ids}, format='json')
+        self.assertEqual(response.json(), {'removed': sorted(ids)})
+        self.assert_consistent()
+        self.assertEqual(expected_shopping_list(self.user), {})
+
+    def test_favorite_counters(self):
+        url = f'/api/recipes/{self.pie.pk}/favorite/'
+        self.client.post(url)
+        self.client.post(url)
+        self.assert_consistent()
+        self.client.delete(url)
+        self.client.delete(url)
+        self.assert_consistent()
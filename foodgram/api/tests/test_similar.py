@@ -0,0 +1,42 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from dish.tests.data import make_ingredients, make_recipe, make_user
+
+
+class SimilarRecipesTests(TestCase):
+    def setUp(self):
+        user = make_user('user')
+        flour, sugar, salt = make_ingredients('мука', 'сахар', 'соль')
+        self.pie = make_recipe(user, 'Пирог', {flour: 200, sugar: 50})
+        self.cake = make_recipe(user, 'Торт', {flour: 100, sugar: 100})
+        self.bread = make_recipe(user, 'Хлеб', {flour: 500, salt: 5})
+        call_command('build_similarity_index', stdout=StringIO())
+        self.client = APIClient()
+
+    def get(self, recipe_id, query=''):
+        return self.client.get(f'/api/recipes/{recipe_id}/similar/{query}')
+
+    def test_similar(self):
+        response = self.get(self.pie.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(item['id'], item['similarity']) for item in response.json()],
+            [(self.cake.pk, 1.0), (self.bread.pk, 0.333)])
+
+    def test_limit(self):
+        response = self.get(self.pie.pk, '?limit=1')
+        self.assertEqual(
+            [item['id'] for item in response.json()], [self.cake.pk])
+
+    def test_invalid_limit(self):
+        for limit in ('0', '-1', 'abc'):
+            with self.subTest(limit=limit):
+                response = self.get(self.pie.pk, f'?limit={limit}')
+                self.assertEqual(response.status_code, 400)
+
+    def test_unknown_recipe(self):
+        self.assertEqual(self.get(10 ** 6).status_code, 404)
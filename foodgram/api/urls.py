@@ -1,13 +1,16 @@
-from django.urls import include, path
+from django.urls import include, path, re_path
 from rest_framework.routers import DefaultRouter
 
 from .views import (
     CustomUserViewSet,
+    ExpiringTokenCreateView,
     TagViewSet,
     IngredientViewSet,
     RecipeViewSet,
     SubscriptionViewSet,
     APISubscribe,
+    APISubscribeMany,
+    MetricsView,
 )
 
 app_name = 'api'
@@ -21,8 +24,13 @@ v1_router.register('tags', TagViewSet, basename='tags')
 v1_router.register('ingredients', IngredientViewSet, basename='ingredients')
 v1_router.register('recipes', RecipeViewSet, basename='recipes')
 urlpatterns = [
+    path('metrics', MetricsView.as_view(), name='metrics'),
+    path('users/subscribe/', APISubscribeMany.as_view(
+        {'post': 'create', 'delete': 'destroy'})),
     path('', include(v1_router.urls)),
     path('', include('djoser.urls')),
+    re_path(r'^auth/token/login/?$', ExpiringTokenCreateView.as_view(),
+            name='login'),
     path('auth/', include('djoser.urls.authtoken')),
     path(r'users/<int:user_id>/subscribe/', APISubscribe.as_view(
         {'post': 'create', 'delete': 'destroy'})),
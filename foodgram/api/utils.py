@@ -0,0 +1,54 @@
+import csv
+import json
+
+
+class Echo:
+    """Псевдо-файл для csv.writer: возвращает строку вместо записи."""
+    def write(self, value):
+        return value
+
+
+def shopping_list_txt(items):
+    yield 'Список покупок FoodGram:\n\n'
+    for item in items:
+        yield (
+            f'{item["ingredient__name"]} '
+            f'({item["ingredient__measurement"]}) - {item["amount"]}\n'
+        )
+    yield '\nУдачных покупок!\n'
+
+
+def shopping_list_csv(items):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for item in items:
+        yield writer.writerow((
+            item['ingredient__name'],
+            item['ingredient__measurement'],
+            item['amount'],
+        ))
+
+
+def shopping_list_item(item):
+    return {
+        'name': item['ingredient__name'],
+        'measurement_unit': item['ingredient__measurement'],
+        'amount': item['amount'],
+    }
+
+
+def shopping_list_json(items):
+    yield '['
+    separator = ''
+    for item in items:
+        yield separator + json.dumps(
+            shopping_list_item(item), ensure_ascii=False)
+        separator = ','
+    yield ']'
+
+
+SHOPPING_LIST_WRITERS = {
+    'txt': shopping_list_txt,
+    'csv': shopping_list_csv,
+    'json': shopping_list_json,
+}
@@ -1,18 +1,18 @@
-import tempfile
-
-from django.shortcuts import get_object_or_404
-from django.db import IntegrityError
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db.models import OuterRef, Prefetch, Subquery
+from django.http import StreamingHttpResponse
 from rest_framework.permissions import (
+    AllowAny,
     IsAuthenticated,
     IsAuthenticatedOrReadOnly,
 )
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
 from rest_framework import viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
-from djoser.views import UserViewSet
+from rest_framework.views import APIView
+from djoser.views import TokenCreateView, UserViewSet
 
 from django_filters.rest_framework import (
     DjangoFilterBackend,
@@ -21,21 +21,36 @@ from django_filters.rest_framework import (
 )
 from django_filters import (
     CharFilter,
+    NumberFilter,
 )
-
-from .mixins import CreateDestroyViewSet
-from .permissions import IsAuthorOrReadOnly
-from users.models import CustomUser
+from rest_framework.filters import BaseFilterBackend
+
+from dish import shopping_list
+from dish.cook_index import cook_index
+from dish.ingredient_index import ingredient_index
+from dish.relations import add_relations, remove_relations
+from dish.search import search_recipes
+from dish.similarity import similar_recipes
 from dish.models import (
     Tag,
     Ingredient,
     Recipe,
-    RecipeIngredientAmount,
     Subscription,
     Favorite,
     Cart
 )
+from users.models import CustomUser
+
+from .authentication import delete_expired_tokens
+from .connections import stats as connection_stats
+from .metrics import registry
+from .mixins import CreateDestroyViewSet, VersionedCacheMixin
+from .pagination import PageLimitPagination, PageOrCursorPagination
+from .permissions import IsAdminOrMetricsHost, IsAuthorOrReadOnly
+from .renderers import CSVRenderer, PlainTextRenderer
+from .utils import SHOPPING_LIST_WRITERS, shopping_list_item
 from .serializers import (
+    BulkIdsSerializer,
     CustomUserCreateSerializer,
     CustomUserSerializer,
     TagSerializer,
@@ -43,6 +58,7 @@ from .serializers import (
     RecipeSerializer,
     RecipeSerializerWrite,
     FavoriteSerializer,
+    ShortRecipeSerializer,
     SubscribeSerializer,
 )
 
@@ -57,7 +73,14 @@ class CustomUserViewSet(UserViewSet):
     serializer_class = CustomUserSerializer
 
 
-class TagViewSet(viewsets.ModelViewSet):
+class ExpiringTokenCreateView(TokenCreateView):
+    """Вход: вместо просроченного токена выдается новый."""
+    def _action(self, serializer):
+        delete_expired_tokens(serializer.user)
+        return super()._action(serializer)
+
+
+class TagViewSet(VersionedCacheMixin, viewsets.ModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (IsAuthenticatedOrReadOnly, )
@@ -66,65 +89,90 @@ class TagViewSet(viewsets.ModelViewSet):
     pagination_class = None
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(VersionedCacheMixin, viewsets.ModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (IsAuthenticatedOrReadOnly, )
     pagination_class = None
 
-    def get_queryset(self):
-        if self.request.GET.get('name'):
-            name = self.request.GET.get('name')
-            queryset = Ingredient.objects.filter(name__startswith=name)
-            return queryset
-        return Ingredient.objects.all()
+    def list(self, request, *args, **kwargs):
+        name = request.GET.get('name')
+        if name:
+            serializer = self.get_serializer(
+                ingredient_index.search(name), many=True)
+            return Response(serializer.data)
+        return super().list(request, *args, **kwargs)
 
 
 class RecipeFilter(FilterSet):
+    """Фильтры рецептов одним запросом.
+
+    Каждый критерий - полусоединение id IN (SELECT recipe_id ...) по
+    связующей таблице, поэтому критерии складываются через AND без JOIN
+    и DISTINCT. Несколько ?tags= объединяются через OR. PostgreSQL
+    планирует такой IN так же, как EXISTS; сам Exists в Django 2.2
+    фильтруется только через annotate, а это лишняя колонка в SELECT и
+    GROUP BY в COUNT пагинации.
+    """
     tags = CharFilter(method='filter_tags')
+    author = NumberFilter(field_name='author_id')
     is_favorited = BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = BooleanFilter(method='filter_in_cart')
 
     class Meta:
         model = Recipe
-        fields = ('tags', )
+        fields = ('tags', 'author')
+
+    @staticmethod
+    def filter_linked(queryset, links):
+        return queryset.filter(pk__in=links.values('recipe_id'))
 
     def filter_tags(self, queryset, name, value):
-        if value:
-            return queryset.filter(
-                tags__slug__in=self.data.getlist('tags')).distinct()
-        return queryset
+        slugs = [slug for slug in self.data.getlist('tags') if slug]
+        if not slugs:
+            return queryset
+        return self.filter_linked(
+            queryset,
+            Recipe.tags.through.objects.filter(tag__slug__in=slugs))
 
-    def filter_is_favorited(self, queryset, name, value):
+    def filter_relation(self, queryset, model, value):
         user = self.request.user
-        if value and user.is_authenticated:
-            return queryset.filter(favorite__user=user)
-        return queryset
+        if not value or not user.is_authenticated:
+            return queryset
+        return self.filter_linked(queryset, model.objects.filter(user=user))
+
+    def filter_is_favorited(self, queryset, name, value):
+        return self.filter_relation(queryset, Favorite, value)
 
     def filter_in_cart(self, queryset, name, value):
-        queryset = Recipe.objects.all()
-        user = self.request.user
-        if value and user.is_authenticated:
-            return queryset.filter(cart__user=user)
-        return queryset
+        return self.filter_relation(queryset, Cart, value)
+
+
+class RecipeSearchFilter(BaseFilterBackend):
+    """Полнотекстовый поиск ?search= по названию, описанию и ингредиентам."""
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        value = request.query_params.get(self.search_param, '').strip()
+        if not value:
+            return queryset
+        return search_recipes(queryset, value)
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
     """Контроллер рецептов."""
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
-    filter_backends = (DjangoFilterBackend, )
+    filter_backends = (DjangoFilterBackend, RecipeSearchFilter)
     filterset_class = RecipeFilter
-    search_fields = ('ingredients', )
     permission_classes = (IsAuthorOrReadOnly, )
+    pagination_class = PageOrCursorPagination
+    cursor_ordering = ('-pub_date', '-id')
 
     def get_queryset(self):
-        if self.request.GET.get('tags'):
-            queryset = Recipe.objects.all()
-            tags = self.request.GET.get('tags')
-            queryset = queryset.filter(tags__slug=tags)
-            return queryset
-        return Recipe.objects.all()
+        # Связи подгружаются только для рецептов, которых нет в кеше
+        # фрагментов (api/fragments.py)
+        return Recipe.objects.select_related('author')
 
     def get_serializer_class(self):
         if self.request.method == 'GET':
@@ -134,6 +182,44 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    def add_or_remove(self, request, model):
+        """Идемпотентно добавляет рецепт в связь model или убирает из нее."""
+        try:
+            recipe_id = int(self.kwargs.get('pk'))
+        except ValueError:
+            raise NotFound('Такого рецепта нет')
+        if request.method == 'DELETE':
+            remove_relations(model, request.user, [recipe_id])
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        added, _, missing = add_relations(model, request.user, [recipe_id])
+        if missing:
+            return Response(
+                {'message': 'Такого рецепта нет'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        recipe = Recipe.objects.prefetch_related('image_variants').get(
+            pk=recipe_id)
+        serializer = FavoriteSerializer(recipe, context={'request': request})
+        return Response(
+            serializer.data,
+            status=status.HTTP_201_CREATED if added else status.HTTP_200_OK
+        )
+
+    def add_or_remove_many(self, request, model):
+        """Пачкой добавляет рецепты ids в связь model или убирает из нее."""
+        serializer = BulkIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        if request.method == 'DELETE':
+            removed = remove_relations(model, request.user, ids)
+            return Response({'removed': sorted(removed)})
+        added, existing, missing = add_relations(model, request.user, ids)
+        return Response({
+            'added': sorted(added),
+            'existing': sorted(existing),
+            'missing': sorted(missing),
+        })
+
     @action(
         methods=['POST', 'DELETE'],
         detail=True,
@@ -141,36 +227,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
     )
     def favorite(self, request, **kwargs):
         """Избранное - добавление, удаление."""
-        recipe_id = self.kwargs.get('pk')
-        user = self.request.user
-        if request.method == 'POST':
-            recipe = get_object_or_404(Recipe, pk=recipe_id)
-            try:
-                Favorite.objects.create(user=user, recipe=recipe)
-                serializer = FavoriteSerializer(
-                    recipe,
-                    context={'request': request}
-                )
-                return Response(
-                    serializer.data, status=status.HTTP_201_CREATED
-                )
-            except IntegrityError:
-                return Response(
-                    {'message': 'Уже добавлено в Избранное'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-        if request.method == 'DELETE':
-            favorite = Favorite.objects.filter(user=user, recipe=recipe_id)
-            if not favorite:
-                return Response(
-                    {'message': 'Рецепт отсутствует в избранном'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            favorite.delete()
-            return Response(
-                {'message': 'Убрано из Избранного'},
-                status=status.HTTP_204_NO_CONTENT
-            )
+        return self.add_or_remove(request, Favorite)
 
     @action(
         methods=['POST', 'DELETE'],
@@ -179,77 +236,165 @@ class RecipeViewSet(viewsets.ModelViewSet):
     )
     def shopping_cart(self, request, **kwargs):
         """Корзина - добавление, удаление."""
-        recipe_id = self.kwargs.get('pk')
-        user = self.request.user
-        if request.method == 'POST':
-            recipe = Recipe.objects.filter(pk=recipe_id)
-            if not recipe:
-                return Response(
-                    {'message': 'Такого рецепта нет'},
-                    status=status.HTTP_404_NOT_FOUND
-                )
-            recipe = get_object_or_404(Recipe, id=recipe_id)
-            try:
-                Cart.objects.create(user=user, recipe=recipe)
-                serializer = FavoriteSerializer(
-                    recipe,
-                    context={'request': request}
-                )
-                return Response(
-                    serializer.data,
-                    status=status.HTTP_201_CREATED)
-            except IntegrityError:
-                return Response(
-                    {'message': 'Уже в корзине'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-        if request.method == 'DELETE':
-            cart = Cart.objects.filter(user=user, recipe=recipe_id)
-        if not cart:
-            return Response(
-                {'message': 'Рецепт отсутствует в корзине'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        cart.delete()
-        return Response(
-            {'message': 'Удалено из корзины'},
-            status=status.HTTP_204_NO_CONTENT
-        )
+        return self.add_or_remove(request, Cart)
 
-    @action(detail=False, permission_classes=(IsAuthenticated, ))
+    @action(
+        methods=['POST', 'DELETE'],
+        detail=False,
+        url_path='favorite',
+        permission_classes=(IsAuthenticated, ),
+    )
+    def favorite_many(self, request):
+        """Избранное - добавление, удаление пачкой: {"ids": [...]}."""
+        return self.add_or_remove_many(request, Favorite)
+
+    @action(
+        methods=['POST', 'DELETE'],
+        detail=False,
+        url_path='shopping_cart',
+        permission_classes=(IsAuthenticated, ),
+    )
+    def shopping_cart_many(self, request):
+        """Корзина - добавление, удаление пачкой: {"ids": [...]}."""
+        return self.add_or_remove_many(request, Cart)
+
+    @action(
+        detail=False,
+        permission_classes=(IsAuthenticated, ),
+        renderer_classes=(PlainTextRenderer, CSVRenderer, JSONRenderer),
+    )
     def download_shopping_cart(self, request):
-        """Список покупок в файл."""
-        user = request.user
-        queryset_ingredient = RecipeIngredientAmount.objects.filter(
-            recipe__cart__user=user).values(
-                'ingredient__name', 'ingredient__measurement').annotate(
-                    amount=Sum('amount'))
-        file_name = 'buy_list.txt'
-        with tempfile.TemporaryFile() as file:
-            file.write('Список покупок FoodGram:\n\n')
-            for item in queryset_ingredient:
-                file.write(
-                    f'{item["ingredient__name"]} '
-                    f'({item["ingredient__measurement"]})- {item["amount"]}\n'
-                )
-            file.write('\nУдачных покупок!\n')
-            file.close
-        with open(file_name, 'r') as file:
-            content_file = file.read()
-            response = HttpResponse(content_file, content_type='text/plain')
-            response['Content-Disposition'] = (
-                r'attachment; filename={file_name}')
-            file.close
+        """Список покупок в файл: ?format=txt|csv|json."""
+        file_format = request.accepted_renderer.format
+        response = StreamingHttpResponse(
+            SHOPPING_LIST_WRITERS[file_format](
+                shopping_list.get_items(request.user).iterator()),
+            content_type=(
+                f'{request.accepted_renderer.media_type}; charset=utf-8')
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename=buy_list.{file_format}')
         return response
 
+    @action(detail=True, permission_classes=(AllowAny, ))
+    def similar(self, request, pk=None):
+        """Рецепты с похожим набором ингредиентов: ?limit= до 50."""
+        try:
+            recipe_id = int(pk)
+        except ValueError:
+            raise NotFound('Такого рецепта нет')
+        scored = similar_recipes(recipe_id, get_similar_limit(request))
+        if scored is None:
+            if not Recipe.objects.filter(pk=recipe_id).exists():
+                raise NotFound('Такого рецепта нет')
+            scored = []
+        recipes = Recipe.objects.prefetch_related('image_variants').in_bulk(
+            [pk for pk, _ in scored])
+        data = []
+        for pk, score in scored:
+            if pk in recipes:
+                item = ShortRecipeSerializer(
+                    recipes[pk], context={'request': request}).data
+                item['similarity'] = round(score, 3)
+                data.append(item)
+        return Response(data)
+
+    @action(detail=False, permission_classes=(AllowAny, ))
+    def cook(self, request):
+        """Что приготовить из имеющегося: ?ingredients=1,2&missing=0.
+
+        Рецепты, где не хватает не больше missing ингредиентов, от самых
+        полно покрытых; к каждому добавлены matched и missing.
+        """
+        ingredient_ids, missing = get_cook_params(request)
+        paginator = PageLimitPagination()
+        page = paginator.paginate_queryset(
+            cook_index.search(ingredient_ids, missing), request, view=self)
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _, _ in page])
+        found = [item for item in page if item[0] in recipes]
+        data = self.get_serializer(
+            [recipes[recipe_id] for recipe_id, _, _ in found],
+            many=True).data
+        for item, (_, matched, total) in zip(data, found):
+            item['matched'] = matched
+            item['missing'] = total - matched
+        return paginator.get_paginated_response(data)
+
+    @action(
+        detail=False,
+        permission_classes=(IsAuthenticated, ),
+    )
+    def shopping_list(self, request):
+        """Список покупок для предпросмотра в JSON."""
+        return Response([
+            shopping_list_item(item)
+            for item in shopping_list.get_items(request.user)
+        ])
+
+
+def get_cook_params(request):
+    """id ингредиентов (?ingredients= через запятую или повтором)
+    и допустимое число недостающих (?missing=)."""
+    values = ','.join(request.query_params.getlist('ingredients'))
+    try:
+        ingredient_ids = {int(value) for value in values.split(',') if value}
+        missing = int(request.query_params.get('missing', 0))
+    except ValueError:
+        raise ValidationError('ingredients и missing - целые числа.')
+    if not ingredient_ids:
+        raise ValidationError('Укажите ингредиенты: ?ingredients=1,2.')
+    if missing < 0:
+        raise ValidationError('missing не может быть отрицательным.')
+    return ingredient_ids, missing
+
+
+def get_similar_limit(request):
+    """?limit= для похожих рецептов: от 1 до 50, по умолчанию 10."""
+    try:
+        limit = int(request.query_params.get('limit', 10))
+    except ValueError:
+        raise ValidationError('limit - целое число.')
+    if limit < 1:
+        raise ValidationError('limit должен быть положительным.')
+    return min(limit, 50)
+
+
+def get_recipes_limit(request):
+    try:
+        recipes_limit = int(request.query_params['recipes_limit'])
+    except (KeyError, ValueError):
+        return None
+    return recipes_limit if recipes_limit >= 0 else None
+
+
+def annotate_subscriptions(queryset, recipes_limit=None):
+    """Авторы подписки с не более чем recipes_limit последними рецептами.
+
+    Последние recipes_limit рецептов каждого автора выбираются одним
+    prefetch-запросом с коррелированным подзапросом (LIMIT на автора).
+    """
+    recipes = Recipe.objects.prefetch_related('image_variants')
+    if recipes_limit is not None:
+        recipes = recipes.filter(pk__in=Subquery(
+            Recipe.objects.filter(author=OuterRef('author')).order_by(
+                '-pub_date', '-id').values('pk')[:recipes_limit]
+        ))
+    return queryset.prefetch_related(Prefetch('recipes', queryset=recipes))
+
 
 class SubscriptionViewSet(viewsets.ModelViewSet):
     """Показываем текущие подписки."""
     serializer_class = SubscribeSerializer
+    pagination_class = PageOrCursorPagination
+    cursor_ordering = ('username', 'id')
 
     def get_queryset(self):
-        return CustomUser.objects.filter(
-            subscribers__subscriber=self.request.user)
+        return annotate_subscriptions(
+            CustomUser.objects.filter(
+                subscribers__subscriber=self.request.user),
+            get_recipes_limit(self.request)
+        )
 
 
 class APISubscribe(CreateDestroyViewSet):
@@ -257,39 +402,69 @@ class APISubscribe(CreateDestroyViewSet):
     permission_classes = (IsAuthenticated, )
 
     def destroy(self, request, user_id):
-        subscribe = Subscription.objects.filter(
-            subscriber=request.user, author__id=user_id)
-        if not subscribe:
-            return Response(
-                {'message': 'Такой подписки нет'},
-                status=status.HTTP_404_NOT_FOUND
-            )
-        subscribe.delete()
-        return Response(
-            {'message': 'Отписка произошла'},
-            status=status.HTTP_204_NO_CONTENT
-        )
+        remove_relations(Subscription, request.user, [user_id])
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
     def create(self, request, user_id):
-        author = get_object_or_404(CustomUser, pk=user_id)
-        user = request.user
-        if not author:
+        if user_id == request.user.pk:
+            return Response(
+                {'message': 'Подписаться на себя нельзя'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        added, _, missing = add_relations(
+            Subscription, request.user, [user_id])
+        if missing:
             return Response(
                 {'message': 'Такого автора нет'},
                 status=status.HTTP_404_NOT_FOUND
             )
-        if author == user:
+        author = annotate_subscriptions(
+            CustomUser.objects.filter(pk=user_id),
+            get_recipes_limit(request)
+        ).get()
+        serializer = SubscribeSerializer(
+            author, context={'request': request})
+        return Response(
+            serializer.data,
+            status=status.HTTP_201_CREATED if added else status.HTTP_200_OK
+        )
+
+
+class APISubscribeMany(CreateDestroyViewSet):
+    """Подписка, отписка пачкой: {"ids": [...]}."""
+    permission_classes = (IsAuthenticated, )
+
+    def destroy(self, request):
+        serializer = BulkIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        removed = remove_relations(
+            Subscription, request.user, serializer.validated_data['ids'])
+        return Response({'removed': sorted(removed)})
+
+    def create(self, request):
+        serializer = BulkIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        if request.user.pk in ids:
             return Response(
                 {'message': 'Подписаться на себя нельзя'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        try:
-            Subscription.objects.create(subscriber=request.user, author=author)
-            serializer = SubscribeSerializer(
-                author, context={'request': request})
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        except IntegrityError:
-            return Response(
-                {'message': 'Подписка уже оформлена'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        added, existing, missing = add_relations(
+            Subscription, request.user, ids)
+        return Response({
+            'added': sorted(added),
+            'existing': sorted(existing),
+            'missing': sorted(missing),
+        })
+
+
+class MetricsView(APIView):
+    """Метрики запросов и соединений с БД для Prometheus."""
+    permission_classes = (IsAdminOrMetricsHost,)
+    renderer_classes = (PlainTextRenderer,)
+
+    def get(self, request):
+        return Response(
+            registry.render() + connection_stats.render(),
+            content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -2,6 +2,11 @@ from django.contrib import admin
 
 from .models import (Ingredient, Tag, Recipe, RecipeIngredientAmount,
                      Subscription, Favorite, Cart)
+from .cook_index import schedule_cook_update
+from .images import schedule_variants
+from .search import schedule_search_update
+from .similarity import schedule_signature_update
+from .shopping_list import rebuild_for_recipe
 
 
 @admin.register(Ingredient)
@@ -11,11 +16,9 @@ class IngredientAdmin(admin.ModelAdmin):
         'measurement',
     )
     ordering = ('name', )
-    list_filter = (
-        'name',
-        'measurement',
-    )
-    search_fields = ('name', )
+    list_filter = ('measurement', )
+    # Поиск по началу названия использует индекс из миграции 0011
+    search_fields = ('^name', )
 
 
 @admin.register(Tag)
@@ -34,8 +37,14 @@ class TagAdmin(admin.ModelAdmin):
 class IngredientInLine(admin.TabularInline):
     model = RecipeIngredientAmount
     list_display = ('recipe', 'ingredient', 'amount', 'measurement')
+    autocomplete_fields = ('ingredient', )
     min_num = 1
 
+    def get_queryset(self, request):
+        # Заголовок строки (__str__) выводит рецепт и ингредиент
+        return super().get_queryset(request).select_related(
+            'recipe', 'ingredient')
+
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
@@ -45,22 +54,30 @@ class RecipeAdmin(admin.ModelAdmin):
         'count_fields',
     )
     readonly_fields = ('count_fields',)
+    autocomplete_fields = ('author', )
 
-    list_select_related = True
+    list_select_related = ('author', )
     inlines = [
         IngredientInLine,
     ]
-    ordering = ('name', '-pub_date')
+    # Порядок ленты: страница читается по индексу без сортировки
+    ordering = ('-pub_date', '-id')
     # list_editable = ('name', )
-    list_filter = (
-        'name',
-        'author',
-        'tags',
-    )
-    search_fields = ('name', )
+    list_filter = ('tags', )
+    search_fields = ('name', 'author__username')
+    show_full_result_count = False
 
     def count_fields(self, obj):
-        return obj.favorite.count()
+        return obj.favorites_count
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        schedule_search_update(form.instance.id)
+        schedule_signature_update(form.instance.id)
+        schedule_cook_update(form.instance.id)
+        schedule_variants(form.instance.id)
+        if change:
+            rebuild_for_recipe(form.instance.id)
 
 
 @admin.register(Subscription)
@@ -69,14 +86,13 @@ class SubscriptionAdmin(admin.ModelAdmin):
         'subscriber',
         'author',
     )
-    list_filter = (
-        'subscriber',
-        'author',
-    )
+    list_select_related = ('subscriber', 'author')
+    autocomplete_fields = ('subscriber', 'author')
     search_fields = (
-        'subscriber',
-        'author',
+        'subscriber__username',
+        'author__username',
     )
+    show_full_result_count = False
 
 
 @admin.register(Favorite)
@@ -85,14 +101,13 @@ class FavoriteAdmin(admin.ModelAdmin):
         'user',
         'recipe',
     )
-    list_filter = (
-        'user',
-        'recipe',
-    )
+    list_select_related = ('user', 'recipe')
+    autocomplete_fields = ('user', 'recipe')
     search_fields = (
-        'user',
-        'recipe',
+        'user__username',
+        'recipe__name',
     )
+    show_full_result_count = False
 
 
 @admin.register(Cart)
@@ -101,11 +116,10 @@ class CartAdmin(admin.ModelAdmin):
         'user',
         'recipe',
     )
-    list_filter = (
-        'user',
-        'recipe',
-    )
+    list_select_related = ('user', 'recipe')
+    autocomplete_fields = ('user', 'recipe')
     search_fields = (
-        'user',
-        'recipe',
+        'user__username',
+        'recipe__name',
     )
+    show_full_result_count = False
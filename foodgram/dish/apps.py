@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class DishConfig(AppConfig):
     name = 'dish'
+
+    def ready(self):
+        from . import signals  # noqa: F401
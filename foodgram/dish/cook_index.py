@@ -0,0 +1,189 @@
+"""Обратный индекс ингредиент -> рецепты в памяти процесса.
+
+Отвечает на вопрос «что приготовить из того, что есть»: для набора
+ингредиентов пользователя считает, сколько ингредиентов каждого рецепта
+у него есть, без GROUP BY/HAVING по всей таблице связей на каждый
+запрос. Для каждого ингредиента хранится отсортированный массив id
+рецептов (array('l')), для каждого рецепта - его ингредиенты (по ним
+правка рецепта трогает только его массивы).
+
+Индекс неизменяем: правка копирует затронутые массивы и словари и
+подменяет ссылку на индекс целиком, поэтому поиск читает его без
+блокировки. Индекс строится лениво при первом запросе. Запись рецепта
+через API и админку обновляет его строки после коммита, удаление
+рецепта или ингредиента - сигналами (dish/signals.py). Изменения из
+соседних воркеров подхватываются перестройкой раз в COOK_INDEX_TTL
+секунд: ее делает один запрос, остальные пока ищут по старому индексу.
+"""
+import threading
+import time
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+from itertools import chain
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import RecipeIngredientAmount
+
+_pending = threading.local()
+
+
+class CookIndex:
+    def __init__(self):
+        # Правки индекса по очереди; поиск блокировку не берет
+        self._lock = threading.Lock()
+        # Перестройка - одна на процесс
+        self._build_lock = threading.Lock()
+        # (ингредиент -> массив id рецептов, рецепт -> его ингредиенты)
+        self._state = None
+        self._built_at = 0
+        # Сбросы индекса: перестройка, начатая до сброса, не годится
+        self._generation = 0
+        # Рецепты, измененные во время перестройки
+        self._changed = None
+
+    def invalidate(self):
+        with self._lock:
+            self._state = None
+            self._generation += 1
+
+    def _is_stale(self):
+        ttl = getattr(settings, 'COOK_INDEX_TTL', None)
+        return ttl is not None and time.monotonic() - self._built_at > ttl
+
+    @staticmethod
+    def _load(recipe_ids=None):
+        """{id рецепта: кортеж id ингредиентов} из БД."""
+        queryset = RecipeIngredientAmount.objects.order_by('recipe_id')
+        if recipe_ids is not None:
+            queryset = queryset.filter(recipe_id__in=recipe_ids)
+        terms = defaultdict(list)
+        for recipe_id, ingredient_id in queryset.values_list(
+                'recipe_id', 'ingredient_id').iterator():
+            terms[recipe_id].append(ingredient_id)
+        return {
+            recipe_id: tuple(ingredient_ids)
+            for recipe_id, ingredient_ids in terms.items()
+        }
+
+    def _build(self):
+        with self._lock:
+            generation = self._generation
+            self._changed = set()
+        terms = self._load()
+        postings = defaultdict(list)
+        for recipe_id, ingredient_ids in terms.items():
+            for ingredient_id in ingredient_ids:
+                postings[ingredient_id].append(recipe_id)
+        postings = {
+            ingredient_id: array('l', recipe_ids)
+            for ingredient_id, recipe_ids in postings.items()
+        }
+        with self._lock:
+            changed, self._changed = self._changed, None
+            if generation != self._generation:
+                return
+            self._state = (postings, terms)
+            self._built_at = time.monotonic()
+        if changed:
+            # Правки, прочитанные из БД раньше перестройки
+            self.update_recipes(changed)
+
+    def _get_state(self):
+        while True:
+            state = self._state
+            if state is not None:
+                if (self._is_stale()
+                        and self._build_lock.acquire(blocking=False)):
+                    try:
+                        if self._is_stale():
+                            self._build()
+                    finally:
+                        self._build_lock.release()
+                return self._state or state
+            with self._build_lock:
+                if self._state is None:
+                    self._build()
+
+    def _apply(self, current):
+        """Заменяет в индексе состав рецептов {id рецепта: ингредиенты}."""
+        with self._lock:
+            if self._changed is not None:
+                self._changed.update(current)
+            if self._state is None:
+                return
+            postings, terms = self._state
+            postings, terms = dict(postings), dict(terms)
+            copied = set()
+            for recipe_id, ingredient_ids in current.items():
+                old = set(terms.pop(recipe_id, ()))
+                new = set(ingredient_ids)
+                for ingredient_id in old ^ new:
+                    if ingredient_id not in copied:
+                        copied.add(ingredient_id)
+                        postings[ingredient_id] = array(
+                            'l', postings.get(ingredient_id, ()))
+                    recipe_ids = postings[ingredient_id]
+                    if ingredient_id in new:
+                        insort(recipe_ids, recipe_id)
+                        continue
+                    position = bisect_left(recipe_ids, recipe_id)
+                    if (position < len(recipe_ids)
+                            and recipe_ids[position] == recipe_id):
+                        del recipe_ids[position]
+                if new:
+                    terms[recipe_id] = tuple(ingredient_ids)
+            self._state = (postings, terms)
+
+    def update_recipes(self, recipe_ids):
+        """Перечитывает из БД ингредиенты рецептов recipe_ids."""
+        recipe_ids = set(recipe_ids)
+        current = self._load(recipe_ids)
+        self._apply({
+            recipe_id: current.get(recipe_id, ())
+            for recipe_id in recipe_ids
+        })
+
+    def remove_recipe(self, recipe_id):
+        self._apply({recipe_id: ()})
+
+    def search(self, ingredient_ids, missing=0):
+        """[(id рецепта, есть, всего)] рецептов, где не хватает не больше
+        missing ингредиентов.
+
+        Сначала рецепты с меньшим числом недостающих, затем с большей
+        долей имеющихся, затем новые (больший id).
+        """
+        postings, terms = self._get_state()
+        matched = Counter(chain.from_iterable(
+            postings[ingredient_id]
+            for ingredient_id in set(ingredient_ids)
+            if ingredient_id in postings
+        ))
+        result = [
+            (recipe_id, count, len(terms[recipe_id]))
+            for recipe_id, count in matched.items()
+            if len(terms[recipe_id]) - count <= missing
+        ]
+        result.sort(key=lambda item: (
+            item[2] - item[1], -item[1] / item[2], -item[0]))
+        return result
+
+
+cook_index = CookIndex()
+
+
+def _flush_pending():
+    recipe_ids = getattr(_pending, 'recipe_ids', set())
+    _pending.recipe_ids = set()
+    if recipe_ids:
+        cook_index.update_recipes(recipe_ids)
+
+
+def schedule_cook_update(recipe_id):
+    """Обновляет строки рецепта в индексе после коммита."""
+    _pending.recipe_ids = getattr(_pending, 'recipe_ids', set())
+    _pending.recipe_ids.add(recipe_id)
+    transaction.on_commit(_flush_pending)
@@ -0,0 +1,75 @@
+"""Денормализованные счетчики.
+
+Recipe.favorites_count, Recipe.carts_count и CustomUser.recipes_count
+меняются атомарно через F() - сигналами для одиночных create/delete
+и явным вызовом update_counter() там, где строки пишутся пачкой
+(bulk_create не отправляет сигналов). Внутри batched_counters()
+изменения из сигналов копятся и применяются одним UPDATE на группу.
+Расхождения исправляет команда reconcile_counters.
+"""
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from users.models import CustomUser
+
+from .models import Cart, Favorite, Recipe
+
+# Модель-связь -> (модель со счетчиком, поле счетчика, поле связи)
+COUNTERS = {
+    Favorite: (Recipe, 'favorites_count', 'recipe_id'),
+    Cart: (Recipe, 'carts_count', 'recipe_id'),
+    Recipe: (CustomUser, 'recipes_count', 'author_id'),
+}
+
+
+def count_subquery(model, link):
+    """Число строк model, ссылающихся полем link на текущую строку."""
+    return Coalesce(Subquery(
+        model.objects.filter(**{link: OuterRef('pk')}).order_by().values(
+            link).annotate(total=Count('pk')).values('total'),
+        output_field=IntegerField()
+    ), 0)
+
+
+def update_counter(model, field, pks, delta=1):
+    """Меняет счетчик field на delta для каждого вхождения pk в pks."""
+    groups = defaultdict(list)
+    for pk, times in Counter(pks).items():
+        groups[times * delta].append(pk)
+    for change, group in groups.items():
+        model.objects.filter(pk__in=group).update(
+            **{field: Greatest(F(field) + change, 0)})
+
+
+_batch = threading.local()
+
+
+def update_counters_for(sender, objs, delta=1):
+    """Пересчитывает счетчики для пачки созданных/удаленных строк."""
+    model, field, link = COUNTERS[sender]
+    pks = [getattr(obj, link) for obj in objs]
+    pending = getattr(_batch, 'pending', None)
+    if pending is not None:
+        pending[(model, field, delta)].extend(pks)
+        return
+    update_counter(model, field, pks, delta)
+
+
+@contextmanager
+def batched_counters():
+    """Копит изменения счетчиков из сигналов до выхода из блока."""
+    if getattr(_batch, 'pending', None) is not None:
+        yield
+        return
+    _batch.pending = defaultdict(list)
+    try:
+        yield
+        pending = _batch.pending
+    finally:
+        _batch.pending = None
+    for (model, field, delta), pks in pending.items():
+        update_counter(model, field, pks, delta)
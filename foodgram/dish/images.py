@@ -0,0 +1,137 @@
+"""Уменьшенные копии фото рецептов в WebP и JPEG.
+
+Копии строятся Pillow в пуле потоков после коммита транзакции, а не
+в обработчике запроса. Пока копий нет, API отдает только оригинал.
+IMAGE_VARIANT_WORKERS = 0 строит копии синхронно (удобно в тестах).
+"""
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from PIL import Image
+
+from .models import Recipe, RecipeImageVariant
+from .versions import bump_recipe_versions
+
+logger = logging.getLogger(__name__)
+
+# Имя варианта -> максимальная ширина и высота
+VARIANT_SIZES = {
+    'thumbnail': (160, 160),
+    'card': (480, 480),
+    'full': (1280, 1280),
+}
+# Формат -> (формат Pillow, параметры сохранения)
+VARIANT_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_VARIANT_WORKERS,
+            thread_name_prefix='image-variants')
+    return _executor
+
+
+def render_variant(source, size, image_format, options):
+    image = source.copy()
+    image.thumbnail(size, Image.LANCZOS)
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    output = io.BytesIO()
+    image.save(output, image_format, **options)
+    return image.size, output.getvalue()
+
+
+def build_variants(recipe_id, force=False):
+    """Строит все варианты фото рецепта, если они устарели."""
+    recipe = Recipe.objects.filter(pk=recipe_id).first()
+    if recipe is None or not recipe.image:
+        return
+    source_name = recipe.image.name
+    current = list(recipe.image_variants.all())
+    expected = len(VARIANT_SIZES) * len(VARIANT_FORMATS)
+    if not force and len(current) == expected and all(
+            variant.source == source_name for variant in current):
+        return
+    with recipe.image.open('rb') as file:
+        source = Image.open(file)
+        source.load()
+    stem = os.path.splitext(os.path.basename(source_name))[0]
+    variants = []
+    for name, size in VARIANT_SIZES.items():
+        for extension, (image_format, options) in VARIANT_FORMATS.items():
+            (width, height), content = render_variant(
+                source, size, image_format, options)
+            variant = RecipeImageVariant(
+                recipe=recipe, name=name, format=extension,
+                width=width, height=height, source=source_name)
+            variant.image.save(
+                f'{stem}-{name}.{extension}', ContentFile(content),
+                save=False)
+            variants.append(variant)
+    with transaction.atomic():
+        try:
+            replace_variants(recipe, source_name, variants)
+        except Exception:
+            # Строки откатятся, файлы новых копий никому не нужны
+            delete_files(variants)
+            raise
+
+
+def replace_variants(recipe, source_name, variants):
+    """Заменяет варианты рецепта построенными.
+
+    Пока строились копии, их могла заменить параллельная сборка или
+    могло смениться фото. Строка рецепта блокируется, заменяются те
+    варианты, что лежат в базе сейчас, а их файлы удаляются после
+    коммита: иначе файлы, на которые ссылаются строки, пропали бы при
+    откате, а файлы замененных строк остались бы без владельца.
+    """
+    image = Recipe.objects.select_for_update().filter(
+        pk=recipe.pk).values_list('image', flat=True).first()
+    if image != source_name:
+        # Копии устаревшего фото; новое построит сборка, запланированная
+        # его правкой
+        obsolete = variants
+    else:
+        obsolete = list(RecipeImageVariant.objects.filter(recipe=recipe))
+        RecipeImageVariant.objects.filter(
+            pk__in=[variant.pk for variant in obsolete]).delete()
+        RecipeImageVariant.objects.bulk_create(variants)
+        bump_recipe_versions(Recipe.objects.filter(pk=recipe.pk))
+    transaction.on_commit(lambda: delete_files(obsolete))
+
+
+def delete_files(variants):
+    for variant in variants:
+        variant.image.delete(save=False)
+
+
+def _build_in_worker(recipe_id):
+    try:
+        build_variants(recipe_id)
+    except Exception:
+        logger.exception('Не удалось построить фото рецепта %s', recipe_id)
+    finally:
+        # У потока пула своё соединение с БД, не оставляем его открытым.
+        connection.close()
+
+
+def schedule_variants(recipe_id):
+    """Ставит построение вариантов в очередь после коммита."""
+    if not settings.IMAGE_VARIANT_WORKERS:
+        transaction.on_commit(lambda: build_variants(recipe_id))
+        return
+    transaction.on_commit(
+        lambda: get_executor().submit(_build_in_worker, recipe_id))
@@ -0,0 +1,77 @@
+"""Индекс ингредиентов в памяти процесса для автодополнения.
+
+Строится лениво при первом запросе, сбрасывается сигналами
+post_save/post_delete модели Ingredient (см. dish/signals.py)
+и по истечении INGREDIENT_INDEX_TTL секунд, чтобы изменения,
+сделанные в соседних воркерах, тоже подхватывались.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+from .models import Ingredient
+
+
+class IngredientIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = None
+        self._items = None
+        self._built_at = 0
+
+    def invalidate(self):
+        with self._lock:
+            self._keys = None
+            self._items = None
+
+    def _is_stale(self):
+        ttl = getattr(settings, 'INGREDIENT_INDEX_TTL', None)
+        return (
+            self._keys is None
+            or (ttl is not None and time.monotonic() - self._built_at > ttl)
+        )
+
+    def _build(self):
+        rows = sorted(
+            (name.casefold(), pk, name, measurement)
+            for pk, name, measurement in Ingredient.objects.values_list(
+                'id', 'name', 'measurement')
+        )
+        self._keys = [row[0] for row in rows]
+        self._items = [
+            Ingredient(id=pk, name=name, measurement=measurement)
+            for _, pk, name, measurement in rows
+        ]
+        self._built_at = time.monotonic()
+
+    def _snapshot(self):
+        with self._lock:
+            if self._is_stale():
+                self._build()
+            return self._keys, self._items
+
+    def search(self, query, limit=None):
+        """Сначала совпадения по началу названия, затем по подстроке."""
+        keys, items = self._snapshot()
+        query = query.casefold()
+        if limit is None:
+            limit = getattr(settings, 'INGREDIENT_SEARCH_LIMIT', None)
+        start = bisect_left(keys, query)
+        end = start
+        while end < len(keys) and keys[end].startswith(query):
+            end += 1
+        result = items[start:end]
+        if limit is not None and len(result) >= limit:
+            return result[:limit]
+        for position, key in enumerate(keys):
+            if start <= position < end or query not in key:
+                continue
+            result.append(items[position])
+            if limit is not None and len(result) >= limit:
+                break
+        return result
+
+
+ingredient_index = IngredientIndex()
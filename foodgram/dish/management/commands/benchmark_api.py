@@ -0,0 +1,359 @@
+"""Management-команда. Замеряет время ответа и число SQL-запросов API.
+Синтаксис:
+python manage.py benchmark_api [--iterations 20] [--warmup 2]
+    [--user email] [--only recipes] [--output benchmark.json]
+
+Запросы идут через тестовый клиент Django в настроенную базу (SQLite
+или локальный PostgreSQL, удобно после generate_fake_data). Пишущие
+сценарии парные (создать - удалить), данные после прогона прежние.
+Вход, выход и смена пароля замеряются от имени служебного пользователя
+AUTH_EMAIL. Пользователей, созданных сценарием регистрации, команда
+удаляет в конце: войти под ними нельзя, API регистрации не сохраняет
+пароль.
+Результат - JSON с p50/p95/p99 времени и числом запросов на каждый
+маршрут: прогоны до и после изменения можно сравнить diff'ом.
+"""
+import base64
+import io
+import json
+import time
+from collections import Counter
+from datetime import datetime
+from uuid import uuid4
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from users.models import CustomUser
+from dish.models import Ingredient, Recipe, Subscription, Tag
+
+PERCENTILES = (50, 95, 99)
+AUTH_EMAIL = 'benchmark-auth@example.com'
+AUTH_PASSWORD = 'benchmark-Pa55word'
+LOGIN = '/api/auth/token/login/'
+LOGOUT = '/api/auth/token/logout/'
+# Домен временных пользователей сценария регистрации
+SIGNUP_DOMAIN = 'benchmark.invalid'
+
+
+def percentile(values, percent):
+    """Перцентиль методом ближайшего ранга."""
+    values = sorted(values)
+    rank = max(int(round(percent / 100 * len(values) + 0.5)), 1)
+    return values[min(rank, len(values)) - 1]
+
+
+def small_image():
+    output = io.BytesIO()
+    Image.new('RGB', (64, 64), (200, 120, 60)).save(output, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(
+        output.getvalue()).decode()
+
+
+def read_scenarios(target):
+    """Сценарии чтения: (имя, [(метод, путь, данные)])."""
+    return [
+        ('users-list', [('GET', '/api/users/', None)]),
+        ('users-me', [('GET', '/api/users/me/', None)]),
+        ('users-detail', [('GET', f'/api/users/{target["author"]}/', None)]),
+        ('subscriptions', [('GET', '/api/users/subscriptions/', None)]),
+        ('subscriptions-recipes-limit', [
+            ('GET', '/api/users/subscriptions/?recipes_limit=3', None)]),
+        ('subscriptions-cursor', [
+            ('GET', '/api/users/subscriptions/?cursor=', None)]),
+        ('tags-list', [('GET', '/api/tags/', None)]),
+        ('tags-detail', [('GET', f'/api/tags/{target["tag_id"]}/', None)]),
+        ('ingredients-list', [('GET', '/api/ingredients/', None)]),
+        ('ingredients-search', [
+            ('GET', f'/api/ingredients/?name={target["prefix"]}', None)]),
+        ('ingredients-detail', [
+            ('GET', f'/api/ingredients/{target["ingredient"]}/', None)]),
+        ('recipes-list', [('GET', '/api/recipes/', None)]),
+        ('recipes-deep-page', [('GET', '/api/recipes/?page=50', None)]),
+        ('recipes-cursor', [('GET', '/api/recipes/?cursor=', None)]),
+        ('recipes-tags', [('GET', '/api/recipes/?' + '&'.join(
+            f'tags={slug}' for slug in target['tags']), None)]),
+        ('recipes-author', [
+            ('GET', f'/api/recipes/?author={target["author"]}', None)]),
+        ('recipes-favorited', [
+            ('GET', '/api/recipes/?is_favorited=1', None)]),
+        ('recipes-in-cart', [
+            ('GET', '/api/recipes/?is_in_shopping_cart=1', None)]),
+        ('recipes-search', [
+            ('GET', f'/api/recipes/?search={target["search"]}', None)]),
+        ('recipes-detail', [
+            ('GET', f'/api/recipes/{target["own_recipe"]}/', None)]),
+    ] + [
+        (f'download-{file_format}', [(
+            'GET',
+            f'/api/recipes/download_shopping_cart/?format={file_format}',
+            None)])
+        for file_format in ('txt', 'csv', 'json')
+    ]
+
+
+def write_scenarios(target):
+    """Парные пишущие сценарии: после прогона данные не меняются."""
+    recipe = target['recipe']
+    ids = {'ids': target['recipes']}
+    scenarios = []
+    for relation in ('favorite', 'shopping_cart'):
+        scenarios.append((relation, [
+            ('POST', f'/api/recipes/{recipe}/{relation}/', None),
+            ('DELETE', f'/api/recipes/{recipe}/{relation}/', None),
+        ]))
+        scenarios.append((f'{relation}-bulk', [
+            ('POST', f'/api/recipes/{relation}/', ids),
+            ('DELETE', f'/api/recipes/{relation}/', ids),
+        ]))
+    scenarios.append(('subscribe', [
+        ('POST', f'/api/users/{target["author"]}/subscribe/', None),
+        ('DELETE', f'/api/users/{target["author"]}/subscribe/', None),
+    ]))
+    scenarios.append(('subscribe-bulk', [
+        ('POST', '/api/users/subscribe/', {'ids': [target['author']]}),
+        ('DELETE', '/api/users/subscribe/', {'ids': [target['author']]}),
+    ]))
+    scenarios.extend(auth_scenarios())
+    scenarios.append(('recipe-write', [
+        ('POST', '/api/recipes/', target['recipe_payload']),
+        ('PATCH', '/api/recipes/{created}/', target['recipe_update']),
+        ('DELETE', '/api/recipes/{created}/', None),
+    ]))
+    return scenarios
+
+
+def auth_scenarios():
+    """Вход, выход, смена пароля и регистрация.
+
+    Запросы после входа идут с токеном, выданным этим входом; {run} в
+    данных - метка прогона, чтобы каждый раз регистрировать нового
+    пользователя.
+    """
+    credentials = {'email': AUTH_EMAIL, 'password': AUTH_PASSWORD}
+    return [
+        ('auth-token', [
+            ('POST', LOGIN, credentials),
+            ('POST', LOGOUT, None),
+        ]),
+        ('set-password', [
+            ('POST', LOGIN, credentials),
+            ('POST', '/api/users/set_password/', {
+                'new_password': AUTH_PASSWORD,
+                'current_password': AUTH_PASSWORD,
+            }),
+            ('POST', LOGOUT, None),
+        ]),
+        ('user-create', [
+            ('POST', '/api/users/', {
+                'email': 'benchmark-{run}@' + SIGNUP_DOMAIN,
+                'username': 'benchmark-{run}',
+                'first_name': 'Замер',
+                'last_name': 'Замер',
+                'password': AUTH_PASSWORD,
+            }),
+        ]),
+    ]
+
+
+def fill(data, run):
+    """Подставляет метку прогона в строки данных запроса."""
+    if isinstance(data, dict):
+        return {key: fill(value, run) for key, value in data.items()}
+    if isinstance(data, str) and '{run}' in data:
+        return data.replace('{run}', run)
+    return data
+
+
+class Command(BaseCommand):
+    help = 'Замеряет время ответа и число SQL-запросов маршрутов API.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20,
+                            help='Сколько раз выполнить каждый сценарий.')
+        parser.add_argument('--warmup', type=int, default=2,
+                            help='Прогоны без замеров перед началом.')
+        parser.add_argument('--user', type=str,
+                            help='email пользователя, от имени которого '
+                                 'идут запросы.')
+        parser.add_argument('--only', type=str, default='',
+                            help='Только сценарии, в имени которых есть '
+                                 'эта строка.')
+        parser.add_argument('--output', type=str,
+                            help='Файл для JSON с результатами.')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('Нужна хотя бы одна итерация.')
+        user = self.get_user(options['user'])
+        target = self.get_target(user)
+        self.prepare_auth_user()
+        token, _ = Token.objects.get_or_create(user=user)
+        client = Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+        scenarios = [
+            (name, requests)
+            for name, requests in (
+                read_scenarios(target) + write_scenarios(target))
+            if options['only'] in name
+        ]
+        results = {}
+        for name, requests in scenarios:
+            for _ in range(options['warmup']):
+                self.run_scenario(client, requests)
+            samples = [
+                self.run_scenario(client, requests)
+                for _ in range(options['iterations'])
+            ]
+            methods = Counter(method for method, _, _ in requests)
+            for index, (method, path, _) in enumerate(requests):
+                key = name if len(requests) == 1 else f'{name}:{method}'
+                if methods[method] > 1:
+                    key = f'{key} {path}'
+                results[key] = self.summarize(
+                    method, path, [sample[index] for sample in samples])
+            self.stderr.write(f'{name}: готово')
+        CustomUser.objects.filter(
+            email__endswith=f'@{SIGNUP_DOMAIN}').delete()
+        report = json.dumps({
+            'meta': {
+                'started': datetime.now().isoformat(timespec='seconds'),
+                'database': connection.vendor,
+                'iterations': options['iterations'],
+                'user': user.email,
+                'users': CustomUser.objects.count(),
+                'recipes': Recipe.objects.count(),
+            },
+            'results': results,
+        }, ensure_ascii=False, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(report + '\n')
+        else:
+            self.stdout.write(report)
+
+    @staticmethod
+    def get_user(email):
+        users = CustomUser.objects.filter(is_active=True)
+        if email:
+            users = users.filter(email=email)
+        # По умолчанию - самый активный автор: с рецептами и корзиной
+        user = users.annotate(
+            carts=Count('cart', distinct=True)
+        ).order_by('-recipes_count', '-carts', 'pk').first()
+        if user is None:
+            raise CommandError(
+                'Нет пользователя для замеров, запустите generate_fake_data.')
+        return user
+
+    @staticmethod
+    def get_target(user):
+        """Объекты, на которые ссылаются сценарии."""
+        own_recipe = Recipe.objects.filter(author=user).first()
+        tags = list(Tag.objects.values_list('slug', flat=True)[:2])
+        recipes = list(Recipe.objects.exclude(author=user).exclude(
+            favorite__user=user).exclude(cart__user=user).order_by(
+            '-pub_date').values_list('pk', flat=True)[:20])
+        author = CustomUser.objects.exclude(pk=user.pk).exclude(
+            pk__in=Subscription.objects.filter(
+                subscriber=user).values('author')).first()
+        ingredients = list(Ingredient.objects.order_by('pk')[:3])
+        tag_ids = list(Tag.objects.values_list('pk', flat=True)[:1])
+        if not (own_recipe and tags and recipes and author and ingredients):
+            raise CommandError(
+                'Мало данных для замеров, запустите generate_fake_data.')
+        return {
+            'own_recipe': own_recipe.pk,
+            'recipe': recipes[0],
+            'recipes': recipes,
+            'author': author.pk,
+            'tags': tags,
+            'tag_id': tag_ids[0],
+            'ingredient': ingredients[0].pk,
+            'prefix': ingredients[0].name[:3],
+            'search': own_recipe.name.split()[0],
+            'recipe_payload': {
+                'name': 'Замер производительности',
+                'text': 'Временный рецепт benchmark_api.',
+                'cooking_time': 10,
+                'image': small_image(),
+                'tags': tag_ids,
+                'ingredients': [
+                    {'id': ingredient.pk, 'amount': 100}
+                    for ingredient in ingredients
+                ],
+            },
+            'recipe_update': {
+                'name': 'Замер производительности 2',
+                'cooking_time': 15,
+                'tags': tag_ids,
+                'ingredients': [
+                    {'id': ingredient.pk, 'amount': 200}
+                    for ingredient in ingredients[:2]
+                ],
+            },
+        }
+
+    @staticmethod
+    def prepare_auth_user():
+        user, _ = CustomUser.objects.get_or_create(
+            email=AUTH_EMAIL,
+            defaults={'username': 'benchmark-auth', 'first_name': 'Замер',
+                      'last_name': 'Замер'})
+        if not user.check_password(AUTH_PASSWORD):
+            user.set_password(AUTH_PASSWORD)
+            user.save()
+
+    @staticmethod
+    def run_scenario(client, requests):
+        """Выполняет запросы сценария: [(статус, мс, SQL-запросов)]."""
+        samples = []
+        created = None
+        run = uuid4().hex[:12]
+        headers = {}
+        for method, path, data in requests:
+            path = path.format(created=created)
+            kwargs = dict(headers)
+            if data is not None:
+                kwargs.update(data=json.dumps(fill(data, run)),
+                              content_type='application/json')
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = getattr(client, method.lower())(path, **kwargs)
+                content = b''.join(response) if response.streaming else (
+                    response.content)
+                elapsed = (time.perf_counter() - started) * 1000
+            if method == 'POST' and response.status_code == 201:
+                created = json.loads(content).get('id')
+            if path == LOGIN and response.status_code == 200:
+                headers['HTTP_AUTHORIZATION'] = (
+                    f'Token {json.loads(content)["auth_token"]}')
+            samples.append((response.status_code, elapsed, len(queries)))
+        return samples
+
+    @staticmethod
+    def summarize(method, path, samples):
+        statuses = Counter(status for status, _, _ in samples)
+        latencies = [elapsed for _, elapsed, _ in samples]
+        queries = [count for _, _, count in samples]
+        summary = {
+            'method': method,
+            'path': path,
+            'status': dict(statuses),
+            'latency_ms': {
+                f'p{percent}': round(percentile(latencies, percent), 2)
+                for percent in PERCENTILES
+            },
+            'queries': {
+                f'p{percent}': percentile(queries, percent)
+                for percent in PERCENTILES
+            },
+        }
+        summary['latency_ms']['mean'] = round(
+            sum(latencies) / len(latencies), 2)
+        summary['queries']['max'] = max(queries)
+        return summary
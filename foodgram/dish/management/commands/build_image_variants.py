@@ -0,0 +1,24 @@
+"""Management-команда. Строит уменьшенные копии фото рецептов.
+Синтаксис:
+python manage.py build_image_variants [--force]
+"""
+from django.core.management.base import BaseCommand
+
+from dish.images import build_variants
+from dish.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Строит недостающие или устаревшие копии фото рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='Перестроить все копии заново.')
+
+    def handle(self, *args, **options):
+        pks = Recipe.objects.order_by('pk').values_list('pk', flat=True)
+        for count, pk in enumerate(pks.iterator(), start=1):
+            build_variants(pk, force=options['force'])
+            if count % 100 == 0:
+                self.stdout.write(f'Обработано рецептов: {count}')
+        self.stdout.write('Копии фото построены')
@@ -0,0 +1,30 @@
+"""Management-команда. Строит индекс похожих рецептов (MinHash и LSH).
+Синтаксис:
+python manage.py build_similarity_index [--batch-size 500]
+"""
+from django.core.management.base import BaseCommand
+
+from dish.models import Recipe
+from dish.similarity import update_signatures
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает сигнатуры и корзины LSH всех рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Сколько рецептов обрабатывать за раз.')
+
+    def handle(self, *args, **options):
+        last_pk = 0
+        total = 0
+        while True:
+            pks = list(Recipe.objects.filter(pk__gt=last_pk).order_by(
+                'pk').values_list('pk', flat=True)[:options['batch_size']])
+            if not pks:
+                break
+            update_signatures(pks)
+            last_pk = pks[-1]
+            total += len(pks)
+            self.stdout.write(f'Обработано рецептов: {total}')
+        self.stdout.write('Индекс похожих рецептов построен')
@@ -0,0 +1,166 @@
+"""Management-команда. Ищет последовательные сканирования в запросах API.
+Синтаксис:
+python manage.py explain_hot_queries [--user email] [--only recipes]
+    [--min-rows 1000]
+
+Выполняет GET-сценарии benchmark_api (лента и фильтры рецептов,
+подписки, выгрузка списка покупок и др.) через тестовый клиент с
+выключенным кешем, собирает все SELECT и для каждого уникального
+запроса выполняет EXPLAIN (ANALYZE, FORMAT JSON) на PostgreSQL или
+EXPLAIN QUERY PLAN на SQLite. Последовательное сканирование таблицы,
+в которой не меньше --min-rows строк, в запросе с WHERE или LIMIT
+считается регрессией: команда печатает план и завершается с ошибкой,
+поэтому ее удобно запускать перед выкладкой на копии боевой базы.
+"""
+import json
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.authtoken.models import Token
+
+from .benchmark_api import Command as BenchmarkCommand, read_scenarios
+
+# Запросы выполняются без кеша, иначе часть из них не дойдет до базы
+NO_CACHE = {
+    'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+}
+# Строка плана SQLite для чтения таблицы целиком (без индекса)
+SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+# Псевдонимы таблиц в SQL Django: "dish_recipe" U0, SQLite пишет в плане
+# псевдоним вместо имени таблицы
+TABLE_ALIAS = re.compile(r'"(\w+)" ([A-Z]\d+)\b')
+# Чтение таблицы целиком (без WHERE и LIMIT) - сканирование по замыслу
+FILTERED = re.compile(r'\b(?:WHERE|LIMIT)\b')
+
+
+def walk(node):
+    yield node
+    for child in node.get('Plans', ()):
+        yield from walk(child)
+
+
+def explain_postgresql(cursor, sql):
+    """(таблицы с Seq Scan, время в мс, план)."""
+    cursor.execute(f'EXPLAIN (ANALYZE, FORMAT JSON) {sql}')
+    plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    scans = [
+        node['Relation Name'] for node in walk(plan[0]['Plan'])
+        if node['Node Type'] == 'Seq Scan'
+    ]
+    return scans, plan[0].get('Execution Time'), json.dumps(
+        plan, ensure_ascii=False, indent=2)
+
+
+def explain_sqlite(cursor, sql):
+    cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+    details = [row[-1] for row in cursor.fetchall()]
+    aliases = {alias: table for table, alias in TABLE_ALIAS.findall(sql)}
+    scans = [
+        aliases.get(match.group(1), match.group(1))
+        for match in map(SQLITE_SCAN.match, details) if match
+    ]
+    return scans, None, '\n'.join(details)
+
+
+def count_postgresql(cursor, table):
+    cursor.execute(
+        'SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+        [table])
+    row = cursor.fetchone()
+    # -1: таблицу еще не анализировали
+    if row is not None and row[0] >= 0:
+        return row[0]
+    return count_sqlite(cursor, table)
+
+
+def count_sqlite(cursor, table):
+    cursor.execute(f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)}')
+    return cursor.fetchone()[0]
+
+
+EXPLAINERS = {
+    'postgresql': (explain_postgresql, count_postgresql),
+    'sqlite': (explain_sqlite, count_sqlite),
+}
+
+
+class Command(BaseCommand):
+    help = ('Выполняет EXPLAIN для запросов API и ищет последовательные '
+            'сканирования больших таблиц.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=str,
+                            help='email пользователя, от имени которого '
+                                 'идут запросы.')
+        parser.add_argument('--only', type=str, default='',
+                            help='Только сценарии, в имени которых есть '
+                                 'эта строка.')
+        parser.add_argument('--min-rows', type=int, default=1000,
+                            help='Сканирование таблицы меньшего размера '
+                                 'не считается проблемой.')
+
+    def handle(self, *args, **options):
+        if connection.vendor not in EXPLAINERS:
+            raise CommandError(
+                f'EXPLAIN для {connection.vendor} не поддерживается.')
+        self.explain, self.count = EXPLAINERS[connection.vendor]
+        self.tables = set(connection.introspection.table_names())
+        self.sizes = {}
+        user = BenchmarkCommand.get_user(options['user'])
+        target = BenchmarkCommand.get_target(user)
+        token, _ = Token.objects.get_or_create(user=user)
+        client = Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+        problems = 0
+        for name, requests in read_scenarios(target):
+            if options['only'] not in name:
+                continue
+            statements = self.capture(client, requests)
+            self.stdout.write(f'{name}: запросов {len(statements)}')
+            for sql in statements:
+                problems += self.check_plan(sql, options)
+        if problems:
+            raise CommandError(
+                f'Последовательных сканирований: {problems}.')
+        self.stdout.write('Последовательных сканирований нет.')
+
+    @staticmethod
+    def capture(client, requests):
+        """Уникальные SELECT, выполненные при запросах сценария."""
+        with override_settings(CACHES=NO_CACHE), CaptureQueriesContext(
+                connection) as queries:
+            for _, path, _ in requests:
+                response = client.get(path)
+                if response.streaming:
+                    b''.join(response)
+        return list(dict.fromkeys(
+            query['sql'] for query in queries
+            if query['sql'].lstrip().upper().startswith('SELECT')
+        ))
+
+    def table_size(self, table):
+        if table not in self.sizes:
+            with connection.cursor() as cursor:
+                self.sizes[table] = self.count(cursor, table)
+        return self.sizes[table]
+
+    def check_plan(self, sql, options):
+        """Печатает план запроса; возвращает число плохих сканирований."""
+        with connection.cursor() as cursor:
+            scans, elapsed, plan = self.explain(cursor, sql)
+        scans = [
+            table for table in scans
+            if FILTERED.search(sql) and table in self.tables
+            and self.table_size(table) >= options['min_rows']
+        ]
+        if options['verbosity'] > 1 or scans:
+            timing = f' ({elapsed:.2f} мс)' if elapsed is not None else ''
+            self.stdout.write(f'  {sql}{timing}\n{plan}\n')
+        for table in scans:
+            self.stdout.write(self.style.WARNING(
+                f'  Seq Scan {table} ({self.table_size(table)} строк)'))
+        return len(scans)
@@ -0,0 +1,278 @@
+"""Management-команда. Заполняет БД синтетическими данными.
+Синтаксис:
+python manage.py generate_fake_data [--users 100] [--recipes 1000]
+    [--tags 8] [--subscriptions 10] [--favorites 20] [--carts 5]
+    [--seed 42] [--ingredients ../data/ingredients.csv] [--prefix fake]
+    [--batch-size 500]
+
+Пользователи, рецепты, подписки, избранное и корзины вставляются
+bulk_create пачками по --batch-size. Сигналы при этом не срабатывают,
+поэтому счетчики, поисковые документы, списки покупок и индекс
+похожих рецептов заполняются здесь же, а копии фото строит
+build_image_variants. С одним и тем же --seed на пустой базе
+получаются одинаковые данные. Пароль всех пользователей FAKE_PASSWORD.
+"""
+import csv
+import io
+import os
+import random
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from users.models import CustomUser
+from dish.models import (
+    Cart,
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredientAmount,
+    RecipeSearchDocument,
+    Subscription,
+    Tag,
+)
+from dish.shopping_list import rebuild as rebuild_shopping_lists
+from dish.similarity import update_signatures
+from dish.versions import bump_version
+
+FAKE_PASSWORD = 'fake-password'
+FAKE_IMAGE = 'images/fake-recipe.jpg'
+INGREDIENT_FILES = (
+    os.path.join(settings.BASE_DIR, '..', 'data', 'ingredients.csv'),
+    os.path.join(settings.BASE_DIR, 'ingredients.csv'),
+)
+FIRST_NAMES = ('Анна', 'Иван', 'Мария', 'Петр', 'Ольга', 'Сергей', 'Елена')
+LAST_NAMES = ('Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Соколов', 'Лебедев')
+DISHES = ('Суп', 'Салат', 'Пирог', 'Омлет', 'Рагу', 'Каша', 'Запеканка',
+          'Паста', 'Плов', 'Блины', 'Котлеты', 'Голубцы')
+ADJECTIVES = ('домашний', 'быстрый', 'праздничный', 'летний', 'острый',
+              'бабушкин', 'постный', 'сытный')
+# Число ингредиентов в рецепте: треугольное распределение
+INGREDIENTS_PER_RECIPE = (2, 15, 6)
+
+
+def sample_count(rng, average, limit):
+    """Случайное число от 0 до 2 * average, не больше limit."""
+    return min(rng.randint(0, 2 * average), limit)
+
+
+class Command(BaseCommand):
+    help = 'Заполняет базу синтетическими пользователями и рецептами.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100,
+                            help='Сколько пользователей создать.')
+        parser.add_argument('--recipes', type=int, default=1000,
+                            help='Сколько рецептов создать.')
+        parser.add_argument('--tags', type=int, default=8,
+                            help='Сколько тегов создать.')
+        parser.add_argument('--subscriptions', type=int, default=10,
+                            help='Подписок на пользователя в среднем.')
+        parser.add_argument('--favorites', type=int, default=20,
+                            help='Рецептов в избранном в среднем.')
+        parser.add_argument('--carts', type=int, default=5,
+                            help='Рецептов в корзине в среднем.')
+        parser.add_argument('--seed', type=int, default=42,
+                            help='Зерно генератора случайных чисел.')
+        parser.add_argument('--ingredients', type=str,
+                            help='csv со списком ингредиентов.')
+        parser.add_argument('--prefix', type=str, default='fake',
+                            help='Префикс имен пользователей и тегов.')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Размер пачки при вставке '
+                                 '(на SQLite не больше 500).')
+
+    def handle(self, *args, **options):
+        if options['users'] < 1:
+            raise CommandError('Нужен хотя бы один пользователь.')
+        prefix = options['prefix']
+        if CustomUser.objects.filter(
+                username__startswith=f'{prefix}_').exists():
+            raise CommandError(
+                f'Пользователи с префиксом "{prefix}" уже есть, '
+                f'укажите другой --prefix.')
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        ingredients = self.load_ingredients(options['ingredients'])
+        with transaction.atomic():
+            tags = self.create_tags(prefix, options['tags'])
+            users = self.create_users(prefix, options)
+            recipes = self.create_recipes(prefix, users, options)
+            self.create_ingredients(recipes, ingredients)
+            self.create_tag_links(recipes, tags)
+            self.create_relations(users, recipes, options)
+            self.create_search_documents(recipes)
+            for start in range(0, len(users), self.batch_size):
+                rebuild_shopping_lists(users[start:start + self.batch_size])
+            for start in range(0, len(recipes), self.batch_size):
+                update_signatures([
+                    recipe.pk
+                    for recipe in recipes[start:start + self.batch_size]
+                ])
+        bump_version(Tag)
+        bump_version(Ingredient)
+        self.stdout.write(
+            f'Создано: пользователей {len(users)}, рецептов {len(recipes)}, '
+            f'тегов {len(tags)}.')
+
+    def load_ingredients(self, path):
+        """Добавляет в базу недостающие ингредиенты из csv."""
+        paths = [path] if path else INGREDIENT_FILES
+        path = next((path for path in paths if os.path.exists(path)), None)
+        if path is not None:
+            with open(path, encoding='utf-8') as file:
+                rows = {tuple(row[:2]) for row in csv.reader(file) if row}
+            existing = set(
+                Ingredient.objects.values_list('name', 'measurement'))
+            Ingredient.objects.bulk_create(
+                [Ingredient(name=name, measurement=measurement)
+                 for name, measurement in sorted(rows - existing)],
+                batch_size=self.batch_size)
+        ingredients = list(
+            Ingredient.objects.order_by('pk').values_list('pk', flat=True))
+        if not ingredients:
+            raise CommandError('Нет ингредиентов: укажите --ingredients.')
+        return ingredients
+
+    def create_tags(self, prefix, count):
+        Tag.objects.bulk_create([
+            Tag(name=f'{prefix} тег {number}',
+                slug=f'{prefix}-tag-{number}',
+                color='#{:06X}'.format(self.rng.randrange(0x1000000)))
+            for number in range(count)
+        ], ignore_conflicts=True)
+        return list(Tag.objects.filter(
+            slug__startswith=f'{prefix}-tag-').order_by('pk').values_list(
+            'pk', flat=True))
+
+    def create_users(self, prefix, options):
+        password = make_password(FAKE_PASSWORD)
+        users = [
+            CustomUser(
+                username=f'{prefix}_{number:06d}',
+                email=f'{prefix}_{number:06d}@example.com',
+                first_name=self.rng.choice(FIRST_NAMES),
+                last_name=self.rng.choice(LAST_NAMES),
+                password=password,
+            )
+            for number in range(options['users'])
+        ]
+        # Активность авторов неравномерна: у немногих много рецептов
+        weights = [self.rng.paretovariate(1.5) for _ in users]
+        self.authors = self.rng.choices(
+            range(len(users)), weights=weights, k=options['recipes'])
+        recipes_count = Counter(self.authors)
+        for number, user in enumerate(users):
+            user.recipes_count = recipes_count[number]
+        CustomUser.objects.bulk_create(users, batch_size=self.batch_size)
+        pks = dict(CustomUser.objects.filter(
+            username__startswith=f'{prefix}_').values_list('username', 'pk'))
+        return [pks[user.username] for user in users]
+
+    def save_image(self):
+        if not default_storage.exists(FAKE_IMAGE):
+            output = io.BytesIO()
+            Image.new('RGB', (1280, 960), (230, 160, 90)).save(
+                output, 'JPEG', quality=80)
+            default_storage.save(FAKE_IMAGE, ContentFile(output.getvalue()))
+        return FAKE_IMAGE
+
+    def create_recipes(self, prefix, users, options):
+        image = self.save_image()
+        now = timezone.now()
+        recipes = []
+        for number, author in enumerate(self.authors):
+            recipes.append(Recipe(
+                name=(f'{self.rng.choice(DISHES)} '
+                      f'{self.rng.choice(ADJECTIVES)} {prefix}-{number}'),
+                author_id=users[author],
+                text=f'Рецепт {number}: смешать, нагреть и подать.',
+                cooking_time=self.rng.randint(5, 180),
+                image=image,
+            ))
+        Recipe.objects.bulk_create(recipes, batch_size=self.batch_size)
+        pks = dict(Recipe.objects.filter(
+            author__username__startswith=f'{prefix}_').values_list(
+            'name', 'pk'))
+        for recipe in recipes:
+            recipe.pk = pks[recipe.name]
+            # auto_now_add заполняет pub_date при вставке, даты разносятся
+            # на год назад и сохраняются вместе со счетчиками
+            recipe.pub_date = now - timedelta(
+                minutes=self.rng.randint(0, 365 * 24 * 60))
+        return recipes
+
+    def create_ingredients(self, recipes, ingredients):
+        low, high, mode = INGREDIENTS_PER_RECIPE
+        rows = []
+        self.recipe_ingredients = {}
+        for recipe in recipes:
+            count = min(round(self.rng.triangular(low, high, mode)),
+                        len(ingredients))
+            chosen = self.rng.sample(ingredients, count)
+            self.recipe_ingredients[recipe.pk] = chosen
+            rows.extend(
+                RecipeIngredientAmount(
+                    recipe_id=recipe.pk, ingredient_id=ingredient,
+                    amount=self.rng.randint(1, 500))
+                for ingredient in chosen
+            )
+        RecipeIngredientAmount.objects.bulk_create(
+            rows, batch_size=self.batch_size)
+
+    def create_tag_links(self, recipes, tags):
+        if not tags:
+            return
+        through = Recipe.tags.through
+        through.objects.bulk_create([
+            through(recipe_id=recipe.pk, tag_id=tag)
+            for recipe in recipes
+            for tag in self.rng.sample(
+                tags, self.rng.randint(1, min(3, len(tags))))
+        ], batch_size=self.batch_size)
+
+    def create_relations(self, users, recipes, options):
+        subscriptions, favorites, carts = [], [], []
+        favorites_count, carts_count = Counter(), Counter()
+        recipe_pks = [recipe.pk for recipe in recipes]
+        for user in users:
+            authors = self.rng.sample(users, sample_count(
+                self.rng, options['subscriptions'], len(users)))
+            subscriptions.extend(
+                Subscription(subscriber_id=user, author_id=author)
+                for author in authors if author != user)
+            for model, rows, counter, average in (
+                    (Favorite, favorites, favorites_count, 'favorites'),
+                    (Cart, carts, carts_count, 'carts')):
+                chosen = self.rng.sample(recipe_pks, sample_count(
+                    self.rng, options[average], len(recipe_pks)))
+                counter.update(chosen)
+                rows.extend(model(user_id=user, recipe_id=recipe)
+                            for recipe in chosen)
+        for model, rows in ((Subscription, subscriptions),
+                            (Favorite, favorites), (Cart, carts)):
+            model.objects.bulk_create(rows, batch_size=self.batch_size)
+        for recipe in recipes:
+            recipe.favorites_count = favorites_count[recipe.pk]
+            recipe.carts_count = carts_count[recipe.pk]
+        Recipe.objects.bulk_update(
+            recipes, ['pub_date', 'favorites_count', 'carts_count'],
+            batch_size=self.batch_size)
+
+    def create_search_documents(self, recipes):
+        names = dict(Ingredient.objects.values_list('pk', 'name'))
+        RecipeSearchDocument.objects.bulk_create([
+            RecipeSearchDocument(recipe_id=recipe.pk, document=' '.join([
+                recipe.name, recipe.text,
+                *(names[pk] for pk in self.recipe_ingredients[recipe.pk])
+            ]))
+            for recipe in recipes
+        ], batch_size=self.batch_size)
@@ -1,55 +1,319 @@
-"""Management-команда. Заполняет БД данными из csv-файлов.
+"""Management-команда. Заполняет БД данными из csv- или json-файлов.
 Синтаксис:
 python manage.py loadcsv csv_path model_name
-"""
+    [--fields name,measurement] [--header] [--map measurement_unit:measurement]
+    [--key name,measurement] [--update] [--batch-size 1000] [--no-copy]
 
+Файл читается потоком и обрабатывается пачками по --batch-size строк в
+одной транзакции; размер отдельных INSERT выбирает Django по
+ограничениям базы. Строки, уже существующие в базе (по естественному
+ключу --key), пропускаются, а с --update - обновляются, поэтому команду
+можно запускать повторно. На PostgreSQL данные загружаются через COPY
+во временную таблицу и переносятся в модель одним INSERT ... SELECT.
+"""
 import csv
+import io
+import json
+import time
+from itertools import islice
 
 from django.apps import apps
-
 from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from dish.models import Ingredient, Tag
+from dish.versions import bump_version
+
+# Колонки csv без заголовка и ключи json по умолчанию
+DEFAULT_FIELDS = {
+    'Ingredient': ['name', 'measurement'],
+}
+DEFAULT_MAP = {'measurement_unit': 'measurement'}
+JSON_CHUNK_SIZE = 64 * 1024
+
+
+def iter_csv(file, fields, header):
+    reader = csv.reader(file, delimiter=',')
+    if header:
+        fields = next(reader, [])
+    for row in reader:
+        if row:
+            yield dict(zip(fields, row))
+
+
+def iter_json(file):
+    """Потоково читает json-массив объектов, не загружая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = file.read(JSON_CHUNK_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Ожидается json-массив объектов.')
+    buffer = buffer[1:]
+    while True:
+        buffer = buffer.lstrip(' \t\r\n,')
+        if buffer.startswith(']'):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except ValueError:
+            chunk = file.read(JSON_CHUNK_SIZE)
+            if not chunk:
+                raise CommandError('Некорректный json-файл.')
+            buffer += chunk
+            continue
+        buffer = buffer[end:]
+        yield item
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class CopyBuffer(io.RawIOBase):
+    """Файлоподобный объект для COPY: отдает строки csv по мере чтения.
+
+    Каждые every строк вызывает progress(число строк).
+    """
+    def __init__(self, rows, fields, progress, every):
+        self.lines = self.render(rows, fields)
+        self.tail = b''
+        self.count = 0
+        self.progress = progress
+        self.every = every
 
-app_models = [model.__name__ for model in apps.get_models()]
-set_csv_fields = ['name', 'measurement']
+    def render(self, rows, fields):
+        out = io.StringIO()
+        writer = csv.writer(out)
+        for row in rows:
+            writer.writerow([row.get(field) for field in fields])
+            self.count += 1
+            if self.count % self.every == 0:
+                self.progress(self.count)
+            yield out.getvalue().encode('utf-8')
+            out.seek(0)
+            out.truncate()
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self.tail) < size:
+            line = next(self.lines, None)
+            if line is None:
+                break
+            self.tail += line
+        if size < 0:
+            size = len(self.tail)
+        data, self.tail = self.tail[:size], self.tail[size:]
+        return data
 
 
 class Command(BaseCommand):
-    help = 'Заполняет базу данных модели из файла csv.'
+    help = 'Заполняет базу данных модели из файла csv или json.'
 
     def add_arguments(self, parser):
-        parser.add_argument('csv_path', type=str, help='Путь к файлу csv.')
+        parser.add_argument('csv_path', type=str,
+                            help='Путь к файлу csv или json.')
         parser.add_argument('model_name', type=str, help='Имя модели.')
+        parser.add_argument('--fields', type=str,
+                            help='Поля модели для колонок csv через запятую.')
+        parser.add_argument('--header', action='store_true',
+                            help='Первая строка csv - имена полей.')
+        parser.add_argument('--map', type=str, default='',
+                            help='Переименование ключей: ключ:поле,...')
+        parser.add_argument('--key', type=str,
+                            help='Естественный ключ через запятую.')
+        parser.add_argument('--update', action='store_true',
+                            help='Обновлять существующие строки.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Сколько строк файла обрабатывать за раз.')
+        parser.add_argument('--no-copy', action='store_true',
+                            help='Не использовать COPY на PostgreSQL.')
 
     def handle(self, *args, **options):
-        if options['model_name'] not in app_models:
+        try:
+            model = apps.get_model(app_label='dish',
+                                   model_name=options['model_name'])
+        except LookupError:
             raise CommandError(
                 f'Модели "{options["model_name"]}" нет в приложении.')
-        model = apps.get_model(app_label='dish',
-                               model_name=options['model_name'])
-        try:
-            with open(options['csv_path'], 'r', encoding="utf-8") as csv_file:
-                csv_reader = csv.reader(csv_file, delimiter=',')
-                for row in csv_reader:
-                    model.objects.bulk_create([
-                        model(name=row[0], measurement=row[1])
-                    ])
+        path = options['csv_path']
+        fields = (
+            options['fields'].split(',') if options['fields']
+            else DEFAULT_FIELDS.get(model.__name__, [])
+        )
+        if not fields and not options['header'] and not path.endswith(
+                '.json'):
+            raise CommandError('Укажите --fields или --header.')
+        renames = dict(DEFAULT_MAP)
+        renames.update(
+            item.split(':', 1) for item in options['map'].split(',') if item)
 
+        started = time.monotonic()
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                if path.endswith('.json'):
+                    rows = iter_json(file)
+                else:
+                    rows = iter_csv(file, fields, options['header'])
+                rows = (
+                    {renames.get(key, key): value
+                     for key, value in row.items()}
+                    for row in rows
+                )
+                stats = self.load(model, rows, options)
+            if model in (Ingredient, Tag):
+                # bulk_create и COPY не отправляют сигналов
+                bump_version(model)
         except FileNotFoundError:
-            raise FileNotFoundError(
-                f'Файл не найден или некорректный путь {options["csv_path"]}')
-
-        # try:
-        #     model.objects.bulk_create([
-        #         model(
-        #             **{rename_csv_fields.get(key) if rename_csv_fields.
-        #             get(key) else key: value
-        #                 for key, value in row.items()
-        #             }) for row in incoming_data
-        #     ])
-        # except Exception as error:
-        #     raise CommandError(
-        #         f'Возникла ошибка при импорте данных в модель: {error}')
-
-        # self.stdout.write (f'Данные из {options["csv_path"].split("/")[2]} '
-        #         f'были успешно загружены в модель {options["model_name"]}')
-        self.stdout.write('Данные загружены')
+            raise CommandError(
+                f'Файл не найден или некорректный путь {path}')
+        self.stdout.write(
+            f'Данные загружены за {time.monotonic() - started:.2f} c: '
+            f'создано {stats["created"]}, обновлено {stats["updated"]}, '
+            f'пропущено {stats["skipped"]}.'
+        )
+
+    def load(self, model, rows, options):
+        rows = iter(rows)
+        first = next(rows, None)
+        if first is None:
+            return {'created': 0, 'updated': 0, 'skipped': 0}
+        fields = list(first)
+        model_fields = {
+            field.name: field for field in model._meta.concrete_fields}
+        unknown = set(fields) - set(model_fields)
+        if unknown:
+            raise CommandError(
+                f'У модели {model.__name__} нет полей: '
+                f'{", ".join(sorted(unknown))}.')
+        key = options['key'].split(',') if options['key'] else fields
+        if set(key) - set(fields):
+            raise CommandError('Поля ключа должны быть среди колонок файла.')
+        rows = self.chain(first, rows)
+        with transaction.atomic():
+            if connection.vendor == 'postgresql' and not options['no_copy']:
+                return self.load_copy(model, rows, fields, key, options)
+            return self.load_batches(
+                model, rows, fields, key, model_fields, options)
+
+    @staticmethod
+    def chain(first, rows):
+        yield first
+        yield from rows
+
+    def load_batches(self, model, rows, fields, key, model_fields, options):
+        stats = {'created': 0, 'updated': 0, 'skipped': 0}
+        seen = set()
+        processed = 0
+        for batch in batches(rows, options['batch_size']):
+            processed += len(batch)
+            objs = {}
+            for row in batch:
+                values = {
+                    field: model_fields[field].to_python(row[field])
+                    for field in fields
+                }
+                row_key = tuple(values[field] for field in key)
+                if row_key not in seen:
+                    seen.add(row_key)
+                    objs[row_key] = model(**values)
+            stats['skipped'] += len(batch) - len(objs)
+            existing = {
+                row_key: obj
+                for row_key, obj in self.find_existing(model, key, objs)
+                if row_key in objs
+            }
+            new = [obj for row_key, obj in objs.items()
+                   if row_key not in existing]
+            # Размер INSERT выбирает база: SQLite не примет 1000 строк
+            model.objects.bulk_create(new)
+            stats['created'] += len(new)
+            updated = 0
+            if options['update']:
+                updated = self.update_existing(
+                    model, objs, existing,
+                    [field for field in fields if field not in key])
+            stats['updated'] += updated
+            stats['skipped'] += len(existing) - updated
+            self.report(processed)
+        return stats
+
+    def report(self, processed):
+        self.stdout.write(f'Обработано строк: {processed}')
+
+    @staticmethod
+    def find_existing(model, key, objs):
+        """(ключ, объект) для строк базы с первым полем ключа из objs."""
+        values = list({row_key[0] for row_key in objs})
+        # SQLite ограничивает число параметров в запросе
+        size = connection.features.max_query_params or len(values)
+        for start in range(0, len(values), size):
+            for obj in model.objects.filter(**{
+                    f'{key[0]}__in': values[start:start + size]}):
+                yield tuple(getattr(obj, field) for field in key), obj
+
+    @staticmethod
+    def update_existing(model, objs, existing, other):
+        changed = []
+        for row_key, obj in existing.items():
+            incoming = objs[row_key]
+            if any(getattr(obj, field) != getattr(incoming, field)
+                   for field in other):
+                for field in other:
+                    setattr(obj, field, getattr(incoming, field))
+                changed.append(obj)
+        if changed:
+            model.objects.bulk_update(changed, other)
+        return len(changed)
+
+    def load_copy(self, model, rows, fields, key, options):
+        table = connection.ops.quote_name(model._meta.db_table)
+        columns = {
+            field: connection.ops.quote_name(
+                model._meta.get_field(field).column)
+            for field in fields
+        }
+        column_list = ', '.join(columns.values())
+        match = ' AND '.join(
+            f't.{columns[field]} = s.{columns[field]}' for field in key)
+        other = [field for field in fields if field not in key]
+        buffer = CopyBuffer(
+            rows, fields, self.report, options['batch_size'])
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TEMP TABLE loadcsv_staging ON COMMIT DROP AS '
+                f'SELECT {column_list} FROM {table} WITH NO DATA')
+            cursor.cursor.copy_expert(
+                f'COPY loadcsv_staging ({column_list}) '
+                f'FROM STDIN WITH (FORMAT csv)',
+                buffer, size=JSON_CHUNK_SIZE)
+            updated = 0
+            if options['update'] and other:
+                assignments = ', '.join(
+                    f'{columns[field]} = s.{columns[field]}'
+                    for field in other)
+                differs = ' OR '.join(
+                    f't.{columns[field]} IS DISTINCT FROM s.{columns[field]}'
+                    for field in other)
+                cursor.execute(
+                    f'UPDATE {table} t SET {assignments} '
+                    f'FROM loadcsv_staging s WHERE {match} AND ({differs})')
+                updated = cursor.rowcount
+            key_list = ', '.join(columns[field] for field in key)
+            cursor.execute(
+                f'INSERT INTO {table} ({column_list}) '
+                f'SELECT DISTINCT ON ({key_list}) {column_list} '
+                f'FROM loadcsv_staging s WHERE NOT EXISTS '
+                f'(SELECT 1 FROM {table} t WHERE {match})')
+            created = cursor.rowcount
+        self.report(buffer.count)
+        return {
+            'created': created,
+            'updated': updated,
+            'skipped': buffer.count - created - updated,
+        }
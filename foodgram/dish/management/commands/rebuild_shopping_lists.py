@@ -0,0 +1,34 @@
+"""Management-команда. Пересобирает материализованные списки покупок.
+Синтаксис:
+python manage.py rebuild_shopping_lists [--user id] [--batch-size 500]
+"""
+from django.core.management.base import BaseCommand
+
+from users.models import CustomUser
+from dish.shopping_list import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает списки покупок из корзин пользователей.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append',
+                            help='id пользователя (можно несколько раз).')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Сколько пользователей обрабатывать за раз.')
+
+    def handle(self, *args, **options):
+        users = CustomUser.objects.order_by('pk')
+        if options['user']:
+            users = users.filter(pk__in=options['user'])
+        last_pk = 0
+        total = 0
+        while True:
+            pks = list(users.filter(pk__gt=last_pk).values_list(
+                'pk', flat=True)[:options['batch_size']])
+            if not pks:
+                break
+            rebuild(pks)
+            last_pk = pks[-1]
+            total += len(pks)
+        self.stdout.write(f'Списки покупок пересобраны: {total}')
@@ -0,0 +1,62 @@
+"""Management-команда. Сверяет денормализованные счетчики с данными.
+Синтаксис:
+python manage.py reconcile_counters [--batch-size 1000]
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Q
+
+from users.models import CustomUser
+from dish.counters import count_subquery
+from dish.models import Cart, Favorite, Recipe
+
+# Модель -> {поле счетчика: (модель-связь, поле связи)}
+COUNTERS = {
+    Recipe: {
+        'favorites_count': (Favorite, 'recipe'),
+        'carts_count': (Cart, 'recipe'),
+    },
+    CustomUser: {
+        'recipes_count': (Recipe, 'author'),
+    },
+}
+
+
+class Command(BaseCommand):
+    help = 'Исправляет расхождения в счетчиках рецептов и пользователей.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Сколько строк проверять за раз.')
+
+    def handle(self, *args, **options):
+        for model, counters in COUNTERS.items():
+            fixed = self.reconcile(model, counters, options['batch_size'])
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}: исправлено {fixed}')
+
+    def reconcile(self, model, counters, batch_size):
+        actual = {
+            f'actual_{field}': count_subquery(*source)
+            for field, source in counters.items()
+        }
+        drift = Q()
+        for field in counters:
+            drift |= ~Q(**{field: F(f'actual_{field}')})
+        fixed = 0
+        last_pk = 0
+        while True:
+            pks = list(model.objects.filter(pk__gt=last_pk).order_by(
+                'pk').values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                return fixed
+            last_pk = pks[-1]
+            with transaction.atomic():
+                rows = list(model.objects.select_for_update().filter(
+                    pk__gte=pks[0], pk__lte=last_pk
+                ).annotate(**actual).filter(drift))
+                for row in rows:
+                    for field in counters:
+                        setattr(row, field, getattr(row, f'actual_{field}'))
+                model.objects.bulk_update(rows, list(counters))
+            fixed += len(rows)
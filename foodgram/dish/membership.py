@@ -0,0 +1,125 @@
+"""Множества принадлежности для текущего пользователя.
+
+Для каждого пользователя есть три множества: id рецептов в избранном,
+id рецептов в корзине и id авторов в подписках. Каждое множество
+загружается одним запросом при первом обращении в запросе.
+
+С общим кешем (SHARED_CACHE) множества хранятся в нем под ключом с
+версией пользователя. Любая запись в Favorite, Cart или Subscription
+увеличивает версию (dish/signals.py, dish/relations.py) - сразу и еще
+раз после коммита, чтобы множество, прочитанное другим запросом до
+коммита, не осталось в кеше. Множества в кеше не правятся на месте.
+С локальным кешем процесса запись в одном воркере не сбросила бы
+множества в других, поэтому множества живут только в пределах запроса.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from .models import Cart, Favorite, Subscription
+
+# Вид множества -> (модель, поле пользователя, поле id в множестве)
+SOURCES = {
+    'favorites': (Favorite, 'user_id', 'recipe_id'),
+    'cart': (Cart, 'user_id', 'recipe_id'),
+    'follows': (Subscription, 'subscriber_id', 'author_id'),
+}
+MODEL_KINDS = {model: kind for kind, (model, _, _) in SOURCES.items()}
+
+
+def version_key(user_id):
+    return f'membership-version:{user_id}'
+
+
+def bump_version(user_id):
+    try:
+        cache.incr(version_key(user_id))
+    except ValueError:
+        # Версии нет: get_version заведет новую
+        pass
+
+
+def get_version(user_id):
+    version = cache.get(version_key(user_id))
+    if version is None:
+        # Версию могли вытеснить из кеша: новая не должна совпасть со
+        # старой, под которой еще лежат множества
+        cache.add(version_key(user_id), int(time.time() * 1000), None)
+        version = cache.get(version_key(user_id))
+    return version
+
+
+def set_key(user_id, kind):
+    return f'membership:{user_id}:{get_version(user_id)}:{kind}'
+
+
+def query_set(user_id, kind):
+    model, user_field, id_field = SOURCES[kind]
+    return set(model.objects.filter(
+        **{user_field: user_id}).values_list(id_field, flat=True))
+
+
+def load_set(user_id, kind):
+    """Множество из общего кеша или из базы.
+
+    Без общего кеша (SHARED_CACHE) множество всегда читается из базы:
+    в кеше процесса его не сбросила бы запись в другом воркере.
+    """
+    if not settings.SHARED_CACHE:
+        return query_set(user_id, kind)
+    key = set_key(user_id, kind)
+    ids = cache.get(key)
+    if ids is None:
+        ids = query_set(user_id, kind)
+        cache.set(key, ids, settings.MEMBERSHIP_CACHE_TTL)
+    return ids
+
+
+def invalidate_for_rows(sender, objs):
+    """Сбрасывает множества владельцев созданных или удаленных строк."""
+    if not settings.SHARED_CACHE:
+        return
+    _, user_field, _ = SOURCES[MODEL_KINDS[sender]]
+    user_ids = {getattr(obj, user_field) for obj in objs}
+
+    def bump_all():
+        for user_id in user_ids:
+            bump_version(user_id)
+
+    bump_all()
+    if connection.in_atomic_block:
+        transaction.on_commit(bump_all)
+
+
+class Membership:
+    """Множества пользователя, загружаемые лениво в пределах запроса."""
+    def __init__(self, user):
+        self.user_id = user.pk if user.is_authenticated else None
+        self._sets = {}
+
+    def _get(self, kind):
+        if self.user_id is None:
+            return set()
+        if kind not in self._sets:
+            self._sets[kind] = load_set(self.user_id, kind)
+        return self._sets[kind]
+
+    def is_favorited(self, recipe_id):
+        return recipe_id in self._get('favorites')
+
+    def is_in_cart(self, recipe_id):
+        return recipe_id in self._get('cart')
+
+    def follows(self, author_id):
+        return author_id in self._get('follows')
+
+
+def get_membership(request):
+    """Один объект Membership на запрос."""
+    membership = getattr(request, '_membership', None)
+    if membership is None:
+        membership = Membership(request.user)
+        request._membership = membership
+    return membership
@@ -0,0 +1,105 @@
+# Generated by Django 2.2.19 on 2026-10-18 18:00
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+POSTGRES_INDEX = (
+    "CREATE INDEX dish_recipesearch_gin ON dish_recipesearchdocument "
+    "USING gin (to_tsvector('russian'::regconfig, COALESCE(document, '')))",
+)
+SQLITE_FTS = (
+    "CREATE VIRTUAL TABLE dish_recipesearch_fts USING fts5("
+    "document, content='dish_recipesearchdocument', "
+    "content_rowid='recipe_id', tokenize='unicode61')",
+    "CREATE TRIGGER dish_recipesearch_ai AFTER INSERT ON "
+    "dish_recipesearchdocument BEGIN "
+    "INSERT INTO dish_recipesearch_fts(rowid, document) "
+    "VALUES (new.recipe_id, new.document); END",
+    "CREATE TRIGGER dish_recipesearch_ad AFTER DELETE ON "
+    "dish_recipesearchdocument BEGIN "
+    "INSERT INTO dish_recipesearch_fts(dish_recipesearch_fts, rowid, "
+    "document) VALUES ('delete', old.recipe_id, old.document); END",
+    "CREATE TRIGGER dish_recipesearch_au AFTER UPDATE ON "
+    "dish_recipesearchdocument BEGIN "
+    "INSERT INTO dish_recipesearch_fts(dish_recipesearch_fts, rowid, "
+    "document) VALUES ('delete', old.recipe_id, old.document); "
+    "INSERT INTO dish_recipesearch_fts(rowid, document) "
+    "VALUES (new.recipe_id, new.document); END",
+)
+SQLITE_FTS_DROP = (
+    'DROP TRIGGER IF EXISTS dish_recipesearch_ai',
+    'DROP TRIGGER IF EXISTS dish_recipesearch_ad',
+    'DROP TRIGGER IF EXISTS dish_recipesearch_au',
+    'DROP TABLE IF EXISTS dish_recipesearch_fts',
+)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        statements = POSTGRES_INDEX
+    elif vendor == 'sqlite':
+        statements = SQLITE_FTS
+    else:
+        return
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS dish_recipesearch_gin')
+    elif vendor == 'sqlite':
+        for statement in SQLITE_FTS_DROP:
+            schema_editor.execute(statement)
+
+
+def fill_search_documents(apps, schema_editor):
+    Recipe = apps.get_model('dish', 'Recipe')
+    RecipeSearchDocument = apps.get_model('dish', 'RecipeSearchDocument')
+    recipes = Recipe.objects.prefetch_related('ingredients')
+    RecipeSearchDocument.objects.bulk_create([
+        RecipeSearchDocument(
+            recipe=recipe,
+            document=' '.join([
+                recipe.name,
+                recipe.text,
+                *(ingredient.name for ingredient in recipe.ingredients.all())
+            ])
+        ) for recipe in recipes
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dish', '0002_auto_20230209_1918'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeSearchDocument',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='dish.Recipe', verbose_name='Рецепт')),
+                ('document', models.TextField(verbose_name='Поисковый документ')),
+            ],
+            options={
+                'verbose_name': 'Поисковый документ',
+                'verbose_name_plural': 'Поисковые документы',
+            },
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='cooking_time',
+            field=models.PositiveSmallIntegerField(validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(5000)], verbose_name='Время приготовления'),
+        ),
+        migrations.AlterField(
+            model_name='recipeingredientamount',
+            name='amount',
+            field=models.SmallIntegerField(validators=[django.core.validators.MinValueValidator(1, message='Минимальное значение 1'), django.core.validators.MaxValueValidator(30000, message='Максимальное значение 30000')], verbose_name='Количество'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+        migrations.RunPython(fill_search_documents, migrations.RunPython.noop),
+    ]
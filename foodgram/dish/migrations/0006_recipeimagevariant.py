@@ -0,0 +1,35 @@
+# Generated by Django 2.2.19 on 2026-10-18 18:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dish', '0005_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeImageVariant',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=20, verbose_name='Размер')),
+                ('format', models.CharField(max_length=10, verbose_name='Формат')),
+                ('image', models.ImageField(upload_to='images/variants/', verbose_name='Файл')),
+                ('width', models.PositiveSmallIntegerField(verbose_name='Ширина')),
+                ('height', models.PositiveSmallIntegerField(verbose_name='Высота')),
+                ('source', models.CharField(max_length=255, verbose_name='Исходное фото')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='image_variants', to='dish.Recipe', verbose_name='Рецепт')),
+            ],
+            options={
+                'verbose_name': 'Вариант фото',
+                'verbose_name_plural': 'Варианты фото',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='recipeimagevariant',
+            constraint=models.UniqueConstraint(fields=('recipe', 'name', 'format'), name='recipe_image_variant'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.19 on 2026-10-18 18:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dish', '0007_shoppinglistitem'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='cache_version',
+            field=models.PositiveIntegerField(default=1, editable=False, verbose_name='Версия в кеше'),
+        ),
+    ]
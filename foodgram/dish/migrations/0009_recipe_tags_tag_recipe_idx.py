@@ -0,0 +1,22 @@
+from django.db import migrations
+
+# Фильтр ?tags= выбирает recipe_id по tag_id: уникальный индекс
+# (recipe_id, tag_id) автоматической M2M-таблицы для этого не подходит,
+# а (tag_id, recipe_id) покрывает подзапрос целиком. Для избранного и
+# корзины то же делают уникальные индексы (user_id, recipe_id).
+CREATE_INDEX = (
+    'CREATE INDEX dish_recipe_tags_tag_recipe_idx '
+    'ON dish_recipe_tags (tag_id, recipe_id)'
+)
+DROP_INDEX = 'DROP INDEX dish_recipe_tags_tag_recipe_idx'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dish', '0008_recipe_cache_version'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_INDEX, DROP_INDEX),
+    ]
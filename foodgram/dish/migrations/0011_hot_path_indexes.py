@@ -0,0 +1,51 @@
+# Generated by Django 2.2.19 on 2026-10-18 18:26
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Поиск ингредиента по началу названия без учета регистра: Django
+# строит для name__istartswith условие UPPER(name::text) LIKE UPPER(%s),
+# обычный B-tree по name его не обслуживает. На SQLite LIKE и так
+# регистронезависим, но индекс использует только с COLLATE NOCASE.
+POSTGRES_INDEX = (
+    'CREATE INDEX ingredient_name_upper_like_idx ON dish_ingredient '
+    '(UPPER(name::text) text_pattern_ops)'
+)
+
+
+def create_name_pattern_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(POSTGRES_INDEX)
+
+
+def drop_name_pattern_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'DROP INDEX IF EXISTS ingredient_name_upper_like_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dish', '0010_recipesignature'),
+    ]
+
+    operations = [
+        # Сначала новый индекс, потом удаление индекса по author_id
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-pub_date', '-id'], name='recipe_author_pub_date_idx'),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='author',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='recipes', to=settings.AUTH_USER_MODEL, verbose_name='Автор рецепта'),
+        ),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['name', 'measurement'], name='ingredient_name_measure_idx'),
+        ),
+        migrations.RunPython(
+            create_name_pattern_index, drop_name_pattern_index),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 2.2.19 on 2026-10-18 18:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dish', '0011_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogVersion',
+            fields=[
+                ('model', models.CharField(max_length=100, primary_key=True, serialize=False, verbose_name='Модель')),
+                ('version', models.PositiveIntegerField(default=1, verbose_name='Версия')),
+                ('modified', models.DateTimeField(auto_now=True, verbose_name='Изменен')),
+            ],
+            options={
+                'verbose_name': 'Версия справочника',
+                'verbose_name_plural': 'Версии справочников',
+            },
+        ),
+    ]
@@ -2,6 +2,7 @@ from django.db import models
 from django.core.validators import MinValueValidator, MaxValueValidator
 
 from colorfield.fields import ColorField
+
 from users.models import CustomUser
 
 
@@ -14,6 +15,11 @@ class Ingredient(models.Model):
     class Meta:
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        indexes = [
+            # Естественный ключ при загрузке справочника (loadcsv)
+            models.Index(fields=['name', 'measurement'],
+                         name='ingredient_name_measure_idx'),
+        ]
 
     def __str__(self):
         return f'{self.name} ({self.measurement})'
@@ -32,10 +38,31 @@ class Tag(models.Model):
         return self.name
 
 
+class CatalogVersion(models.Model):
+    """Версия справочника (теги, ингредиенты) для HTTP-кеширования.
+
+    Увеличивается при каждой записи в справочник, см. dish/versions.py.
+    """
+    model = models.CharField(max_length=100, primary_key=True,
+                             verbose_name='Модель')
+    version = models.PositiveIntegerField(default=1, verbose_name='Версия')
+    modified = models.DateTimeField(auto_now=True, verbose_name='Изменен')
+
+    class Meta:
+        verbose_name = 'Версия справочника'
+        verbose_name_plural = 'Версии справочников'
+
+    def __str__(self):
+        return f'{self.model}: {self.version}'
+
+
 class Recipe(models.Model):
     name = models.CharField(max_length=254, verbose_name='Название блюда')
+    # Отдельный индекс по author_id не нужен: его заменяет
+    # recipe_author_pub_date_idx
     author = models.ForeignKey(CustomUser,
                                on_delete=models.CASCADE,
+                               db_index=False,
                                related_name='recipes',
                                verbose_name='Автор рецепта')
     pub_date = models.DateTimeField(auto_now_add=True,
@@ -55,15 +82,88 @@ class Recipe(models.Model):
                                   verbose_name='Теги',
                                   related_name='recipes',
                                   )
+    # Счетчики ведутся в dish/counters.py, сверяются reconcile_counters
+    favorites_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='В избранном')
+    carts_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='В корзинах')
+    # Версия закешированного представления (api/fragments.py),
+    # увеличивается в dish/versions.py
+    cache_version = models.PositiveIntegerField(
+        default=1, editable=False, verbose_name='Версия в кеше')
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date', )
+        indexes = [
+            # Ключ курсорной пагинации ленты рецептов
+            models.Index(fields=['-pub_date', '-id'],
+                         name='recipe_pub_date_id_idx'),
+            # ?author= и последние рецепты авторов в подписках
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='recipe_author_pub_date_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # Счетчики и версию не перезаписываем устаревшими значениями
+        # из памяти.
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in (
+                    'favorites_count', 'carts_count', 'cache_version')
+            ]
+        super().save(*args, **kwargs)
+
+
+class RecipeImageVariant(models.Model):
+    """Уменьшенная копия фото рецепта (см. dish/images.py)."""
+    recipe = models.ForeignKey(Recipe,
+                               on_delete=models.CASCADE,
+                               related_name='image_variants',
+                               verbose_name='Рецепт')
+    name = models.CharField(max_length=20, verbose_name='Размер')
+    format = models.CharField(max_length=10, verbose_name='Формат')
+    image = models.ImageField(upload_to='images/variants/',
+                              verbose_name='Файл')
+    width = models.PositiveSmallIntegerField(verbose_name='Ширина')
+    height = models.PositiveSmallIntegerField(verbose_name='Высота')
+    source = models.CharField(max_length=255,
+                              verbose_name='Исходное фото')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['recipe', 'name', 'format'],
+                                    name='recipe_image_variant')
+        ]
+        verbose_name = 'Вариант фото'
+        verbose_name_plural = 'Варианты фото'
+
+    def __str__(self):
+        return f'{self.recipe}, {self.name}.{self.format}'
+
+
+class RecipeSearchDocument(models.Model):
+    """Поисковый документ рецепта: название, описание и ингредиенты.
+
+    Индексируется GIN-индексом (PostgreSQL) или таблицей FTS5 (SQLite),
+    см. миграцию 0003 и dish/search.py.
+    """
+    recipe = models.OneToOneField(Recipe,
+                                  on_delete=models.CASCADE,
+                                  primary_key=True,
+                                  related_name='search_document',
+                                  verbose_name='Рецепт')
+    document = models.TextField(verbose_name='Поисковый документ')
+
+    class Meta:
+        verbose_name = 'Поисковый документ'
+        verbose_name_plural = 'Поисковые документы'
+
 
 class RecipeIngredientAmount(models.Model):
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
@@ -146,3 +246,62 @@ class Cart(models.Model):
         ]
         verbose_name = 'Корзина'
         verbose_name_plural = 'Корзины'
+
+
+class ShoppingListItem(models.Model):
+    """Сумма ингредиента по рецептам в корзине пользователя.
+
+    Ведется в dish/shopping_list.py, пересобирается командой
+    rebuild_shopping_lists.
+    """
+    user = models.ForeignKey(CustomUser,
+                             on_delete=models.CASCADE,
+                             related_name='shopping_list',
+                             verbose_name='Пользователь')
+    ingredient = models.ForeignKey(Ingredient,
+                                   on_delete=models.CASCADE,
+                                   related_name='shopping_list_items',
+                                   verbose_name='Ингредиент')
+    amount = models.IntegerField(verbose_name='Количество')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'ingredient'],
+                                    name='shopping_list_user_ingredient')
+        ]
+        verbose_name = 'Строка списка покупок'
+        verbose_name_plural = 'Списки покупок'
+
+    def __str__(self):
+        return f'{self.user}, {self.ingredient}, {self.amount}'
+
+
+class RecipeSignature(models.Model):
+    """MinHash-сигнатура множества ингредиентов рецепта.
+
+    Вместе с RecipeSignatureBucket образует LSH-индекс похожих
+    рецептов (dish/similarity.py).
+    """
+    recipe = models.OneToOneField(Recipe,
+                                  on_delete=models.CASCADE,
+                                  primary_key=True,
+                                  related_name='signature',
+                                  verbose_name='Рецепт')
+    signature = models.BinaryField(verbose_name='Сигнатура')
+
+    class Meta:
+        verbose_name = 'Сигнатура рецепта'
+        verbose_name_plural = 'Сигнатуры рецептов'
+
+
+class RecipeSignatureBucket(models.Model):
+    """Корзина LSH: хеш одной полосы сигнатуры рецепта."""
+    recipe = models.ForeignKey(Recipe,
+                               on_delete=models.CASCADE,
+                               related_name='signature_buckets',
+                               verbose_name='Рецепт')
+    bucket = models.BigIntegerField(db_index=True, verbose_name='Корзина')
+
+    class Meta:
+        verbose_name = 'Корзина LSH'
+        verbose_name_plural = 'Корзины LSH'
@@ -0,0 +1,79 @@
+"""Идемпотентное добавление и удаление связей пользователя.
+
+Избранное, корзина и подписки пишутся пачкой: одна проверка, какие
+объекты существуют и какие уже связаны, один INSERT с
+ignore_conflicts и один DELETE. Счетчики, кеш принадлежности и списки
+покупок обновляются только по реально добавленным или удаленным
+строкам. Чтобы два одновременных запроса не посчитали одну и ту же
+связь новой, изменения связей пользователя идут по очереди под
+блокировкой его строки.
+"""
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from users.models import CustomUser
+
+from . import membership, shopping_list
+from .counters import COUNTERS, batched_counters, update_counters_for
+from .models import Cart, Favorite, Recipe, Subscription
+
+# Модель-связь -> модель, на которую она ссылается
+TARGETS = {
+    Favorite: Recipe,
+    Cart: Recipe,
+    Subscription: CustomUser,
+}
+
+
+def lock_user(user):
+    """Блокирует строку пользователя до конца транзакции."""
+    list(CustomUser.objects.select_for_update().filter(
+        pk=user.pk).values_list('pk', flat=True))
+
+
+def add_relations(model, user, ids):
+    """Связывает пользователя с объектами ids.
+
+    Возвращает (добавленные, уже связанные, несуществующие) id.
+    """
+    _, user_field, id_field = membership.SOURCES[membership.MODEL_KINDS[
+        model]]
+    ids = set(ids)
+    linked = model.objects.filter(
+        **{user_field: user.pk, id_field: OuterRef('pk')})
+    with transaction.atomic():
+        lock_user(user)
+        found = dict(TARGETS[model].objects.filter(pk__in=ids).annotate(
+            linked=Exists(linked)).values_list('pk', 'linked'))
+        added = [pk for pk, is_linked in found.items() if not is_linked]
+        if model is Cart:
+            # До вставки: правка рецепта не должна увидеть новую строку
+            # корзины раньше, чем ее учтет список покупок
+            shopping_list.lock_recipes(added)
+        rows = [model(**{user_field: user.pk, id_field: pk}) for pk in added]
+        model.objects.bulk_create(rows, ignore_conflicts=True)
+        if model in COUNTERS:
+            update_counters_for(model, rows, 1)
+        if model is Cart:
+            shopping_list.update_for_carts(rows, 1)
+    membership.invalidate_for_rows(model, rows)
+    existing = set(found) - set(added)
+    return set(added), existing, ids - set(found)
+
+
+def remove_relations(model, user, ids):
+    """Удаляет связи пользователя с объектами ids, возвращает удаленные."""
+    _, user_field, id_field = membership.SOURCES[membership.MODEL_KINDS[
+        model]]
+    queryset = model.objects.filter(
+        **{user_field: user.pk, f'{id_field}__in': set(ids)})
+    with transaction.atomic(), batched_counters():
+        with shopping_list.batched_shopping_lists():
+            lock_user(user)
+            # Удаляем и учитываем только строки, заблокированные здесь:
+            # строку, удаленную параллельно, сигналы не увидят
+            removed = dict(queryset.select_for_update().values_list(
+                'pk', id_field))
+            if removed:
+                model.objects.filter(pk__in=removed).delete()
+    return set(removed.values())
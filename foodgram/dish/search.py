@@ -0,0 +1,93 @@
+"""Полнотекстовый поиск рецептов.
+
+Документ рецепта (RecipeSearchDocument) хранит название, описание и
+названия ингредиентов. На PostgreSQL по нему построен GIN-индекс
+to_tsvector('russian', ...), на SQLite - внешняя таблица FTS5,
+которую синхронизируют триггеры (миграция 0003).
+"""
+import re
+import threading
+
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+)
+from django.db import connections, transaction
+
+from .models import Recipe, RecipeSearchDocument
+
+SEARCH_CONFIG = 'russian'
+
+_pending = threading.local()
+
+
+def build_document(recipe):
+    return ' '.join([
+        recipe.name,
+        recipe.text,
+        *(ingredient.name for ingredient in recipe.ingredients.all())
+    ])
+
+
+def update_search_documents(recipe_ids):
+    """Пересобирает документы указанных рецептов."""
+    recipes = Recipe.objects.filter(
+        pk__in=recipe_ids).prefetch_related('ingredients')
+    for recipe in recipes:
+        RecipeSearchDocument.objects.update_or_create(
+            recipe=recipe, defaults={'document': build_document(recipe)})
+
+
+def _flush_pending():
+    recipe_ids = getattr(_pending, 'recipe_ids', set())
+    _pending.recipe_ids = set()
+    if recipe_ids:
+        update_search_documents(recipe_ids)
+
+
+def schedule_search_update(recipe_id):
+    """Пересобирает документ после коммита, один раз на транзакцию."""
+    _pending.recipe_ids = getattr(_pending, 'recipe_ids', set())
+    _pending.recipe_ids.add(recipe_id)
+    transaction.on_commit(_flush_pending)
+
+
+def _search_postgresql(queryset, value):
+    vector = SearchVector(
+        'search_document__document', config=SEARCH_CONFIG)
+    query = SearchQuery(value, config=SEARCH_CONFIG)
+    return queryset.annotate(
+        search=vector, search_rank=SearchRank(vector, query)
+    ).filter(search=query).order_by('-search_rank', '-pub_date')
+
+
+def _search_sqlite(queryset, value):
+    words = re.findall(r'\w+', value)
+    if not words:
+        return queryset.none()
+    match = ' '.join(f'"{word}"*' for word in words)
+    # Соединение с FTS-таблицей: ранг считается и сортируется в SQL, и
+    # LIMIT пагинации ограничивает сам поисковый запрос
+    quote = connections[queryset.db].ops.quote_name
+    recipe_id = (
+        f'{quote(Recipe._meta.db_table)}.{quote(Recipe._meta.pk.column)}')
+    return queryset.extra(
+        select={'search_rank': 'bm25(dish_recipesearch_fts)'},
+        tables=['dish_recipesearch_fts'],
+        where=[
+            f'dish_recipesearch_fts.rowid = {recipe_id}',
+            'dish_recipesearch_fts MATCH %s',
+        ],
+        params=[match],
+    ).order_by('search_rank', '-pub_date')
+
+
+def search_recipes(queryset, value):
+    """Фильтрует рецепты по запросу и сортирует по релевантности."""
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        return _search_postgresql(queryset, value)
+    if vendor == 'sqlite':
+        return _search_sqlite(queryset, value)
+    return queryset.filter(search_document__document__icontains=value)
@@ -0,0 +1,176 @@
+"""Материализованные списки покупок.
+
+ShoppingListItem хранит сумму каждого ингредиента по рецептам в корзине
+пользователя. Строки меняются на разницу: при добавлении рецепта в
+корзину и удалении из нее (сигналы Cart и add_relations) и при правке
+ингредиентов рецепта (RecipeSerializerWrite.update). Разница
+применяется одним INSERT ... ON CONFLICT DO UPDATE (PostgreSQL,
+SQLite 3.24+); сумма не опускается ниже нуля, строки с нулевой суммой
+в список не попадают. Удаляемые из корзины строки сначала блокируются,
+и разница учитывается только для тех, что еще не удалил параллельный
+запрос. Изменение корзины и правка ингредиентов рецепта идут по очереди
+под блокировкой строки рецепта (lock_recipes): иначе добавление в
+корзину учло бы старые количества, а правка не увидела бы новую
+корзину. Расхождения исправляет команда rebuild_shopping_lists.
+"""
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+from django.db.models import Sum
+
+from .models import Cart, Recipe, RecipeIngredientAmount, ShoppingListItem
+
+# Строк в одном INSERT: 3 параметра на строку, SQLite допускает 999
+UPSERT_BATCH_SIZE = 300
+
+_batch = threading.local()
+
+
+def get_items(user):
+    """Список покупок пользователя одним запросом по его строкам."""
+    return ShoppingListItem.objects.filter(
+        user=user, amount__gt=0).values(
+            'ingredient__name', 'ingredient__measurement').annotate(
+                amount=Sum('amount')).order_by('ingredient__name')
+
+
+def apply_deltas(deltas):
+    """Прибавляет к строкам списков разницу {(user_id, ingredient_id): d}."""
+    rows = [
+        (user_id, ingredient_id, delta)
+        for (user_id, ingredient_id), delta in deltas.items() if delta
+    ]
+    if not rows:
+        return
+    meta = ShoppingListItem._meta
+    quote = connection.ops.quote_name
+    table = quote(meta.db_table)
+    user, ingredient, amount = (
+        quote(meta.get_field(name).column)
+        for name in ('user', 'ingredient', 'amount'))
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+            batch = rows[start:start + UPSERT_BATCH_SIZE]
+            cursor.execute(
+                f'INSERT INTO {table} ({user}, {ingredient}, {amount}) '
+                f'VALUES {", ".join(["(%s, %s, %s)"] * len(batch))} '
+                f'ON CONFLICT ({user}, {ingredient}) DO UPDATE '
+                f'SET {amount} = {table}.{amount} + EXCLUDED.{amount}',
+                [value for row in batch for value in row])
+    # Строки не удаляем: сумма может принадлежать и другим рецептам
+    ShoppingListItem.objects.filter(
+        user_id__in={user_id for user_id, _, _ in rows},
+        amount__lt=0).update(amount=0)
+
+
+def lock_recipes(recipe_ids):
+    """Блокирует строки рецептов до конца транзакции, по порядку id."""
+    list(Recipe.objects.select_for_update().filter(
+        pk__in=recipe_ids).order_by('pk').values_list('pk', flat=True))
+
+
+def _apply_carts(carts):
+    """carts: [(user_id, recipe_id, знак)]."""
+    by_recipe = defaultdict(list)
+    for user_id, recipe_id, sign in carts:
+        by_recipe[recipe_id].append((user_id, sign))
+    deltas = defaultdict(int)
+    # Сигнал post_save Cart приходит и вне транзакции
+    with transaction.atomic():
+        lock_recipes(by_recipe)
+        amounts = RecipeIngredientAmount.objects.filter(
+            recipe_id__in=by_recipe).values_list(
+                'recipe_id', 'ingredient_id', 'amount')
+        for recipe_id, ingredient_id, amount in amounts:
+            for user_id, sign in by_recipe[recipe_id]:
+                deltas[(user_id, ingredient_id)] += sign * amount
+        apply_deltas(deltas)
+
+
+def lock_existing(carts):
+    """Строки carts, которые еще есть в базе, под блокировкой."""
+    locked = set(Cart.objects.select_for_update().filter(
+        pk__in=[cart.pk for cart in carts]).values_list('pk', flat=True))
+    return [cart for cart in carts if cart.pk in locked]
+
+
+def update_for_carts(carts, sign=1):
+    """Учитывает добавленные (sign=1) или удаляемые (-1) строки Cart.
+
+    Удаление нужно учитывать до того, как удалены ингредиенты рецепта,
+    поэтому сигнал - pre_delete. Внутри batched_shopping_lists()
+    удаляемые строки блокирует вызывающий код (remove_relations).
+    """
+    pending = getattr(_batch, 'pending', None)
+    if sign < 0 and pending is None:
+        carts = lock_existing(carts)
+    carts = [(cart.user_id, cart.recipe_id, sign) for cart in carts]
+    if pending is not None:
+        pending.extend(carts)
+        return
+    _apply_carts(carts)
+
+
+@contextmanager
+def batched_shopping_lists():
+    """Копит изменения корзин из сигналов до выхода из блока."""
+    if getattr(_batch, 'pending', None) is not None:
+        yield
+        return
+    _batch.pending = []
+    try:
+        yield
+        pending = _batch.pending
+    finally:
+        _batch.pending = None
+    if pending:
+        _apply_carts(pending)
+
+
+def update_for_recipe(recipe_id, changes):
+    """Учитывает правку ингредиентов рецепта {ingredient_id: разница}.
+
+    Строку рецепта вызывающий код блокирует (lock_recipes) до того, как
+    прочитать его ингредиенты.
+    """
+    changes = {
+        ingredient_id: delta
+        for ingredient_id, delta in changes.items() if delta
+    }
+    if not changes:
+        return
+    users = Cart.objects.filter(
+        recipe_id=recipe_id).values_list('user_id', flat=True)
+    apply_deltas({
+        (user_id, ingredient_id): delta
+        for user_id in users
+        for ingredient_id, delta in changes.items()
+    })
+
+
+def rebuild(user_ids):
+    """Пересобирает списки покупок пользователей с нуля."""
+    user_ids = list(user_ids)
+    with transaction.atomic():
+        ShoppingListItem.objects.filter(user_id__in=user_ids).delete()
+        totals = RecipeIngredientAmount.objects.filter(
+            recipe__cart__user_id__in=user_ids).values(
+                'recipe__cart__user_id', 'ingredient_id').annotate(
+                    total=Sum('amount')).order_by()
+        ShoppingListItem.objects.bulk_create([
+            ShoppingListItem(
+                user_id=row['recipe__cart__user_id'],
+                ingredient_id=row['ingredient_id'],
+                amount=row['total'])
+            for row in totals
+        ], batch_size=UPSERT_BATCH_SIZE)
+
+
+def rebuild_for_recipe(recipe_id):
+    """Пересобирает списки всех, у кого рецепт в корзине."""
+    with transaction.atomic():
+        lock_recipes([recipe_id])
+        rebuild(Cart.objects.filter(
+            recipe_id=recipe_id).values_list('user_id', flat=True))
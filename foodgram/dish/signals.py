@@ -0,0 +1,122 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from users.models import CustomUser
+
+from . import membership, shopping_list
+from .cook_index import cook_index
+from .counters import update_counters_for
+from .ingredient_index import ingredient_index
+from .models import (Cart, Favorite, Ingredient, Recipe,
+                     RecipeIngredientAmount, Subscription, Tag)
+from .search import schedule_search_update, update_search_documents
+from .versions import bump_recipe_versions, bump_version
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    ingredient_index.invalidate()
+
+
+@receiver(post_delete, sender=Ingredient)
+def invalidate_cook_index(sender, **kwargs):
+    # Каскадом удалены строки состава: проще перестроить индекс целиком
+    cook_index.invalidate()
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_from_cook_index(sender, instance, **kwargs):
+    cook_index.remove_recipe(instance.pk)
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search_document(sender, instance, raw=False, **kwargs):
+    if not raw:
+        schedule_search_update(instance.id)
+
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredient_search_documents(sender, instance, created,
+                                       raw=False, **kwargs):
+    if created or raw:
+        return
+    update_search_documents(
+        RecipeIngredientAmount.objects.filter(
+            ingredient=instance).values_list('recipe_id', flat=True))
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=Cart)
+@receiver(post_save, sender=Recipe)
+def increment_counter(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        update_counters_for(sender, [instance], 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=Cart)
+@receiver(post_delete, sender=Recipe)
+def decrement_counter(sender, instance, **kwargs):
+    update_counters_for(sender, [instance], -1)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+@receiver((post_save, post_delete), sender=Ingredient)
+def bump_catalog_version(sender, **kwargs):
+    bump_version(sender)
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+@receiver((post_save, post_delete), sender=Cart)
+@receiver((post_save, post_delete), sender=Subscription)
+def invalidate_membership(sender, instance, created=True, raw=False,
+                          **kwargs):
+    if created and not raw:
+        membership.invalidate_for_rows(sender, [instance])
+
+
+@receiver(post_save, sender=Cart)
+def add_to_shopping_list(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        shopping_list.update_for_carts([instance], 1)
+
+
+@receiver(pre_delete, sender=Cart)
+def remove_from_shopping_list(sender, instance, **kwargs):
+    shopping_list.update_for_carts([instance], -1)
+
+
+# Поля автора, которые попадают в представление рецепта
+AUTHOR_FIELDS = {'email', 'username', 'first_name', 'last_name'}
+
+
+@receiver(post_save, sender=Recipe)
+def bump_recipe_version(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        bump_recipe_versions(Recipe.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def bump_tag_recipes_version(sender, instance, created=False, raw=False,
+                             **kwargs):
+    if not created and not raw:
+        bump_recipe_versions(Recipe.objects.filter(tags=instance))
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Ingredient)
+def bump_ingredient_recipes_version(sender, instance, created=False,
+                                    raw=False, **kwargs):
+    if not created and not raw:
+        bump_recipe_versions(Recipe.objects.filter(ingredients=instance))
+
+
+@receiver(post_save, sender=CustomUser)
+def bump_author_recipes_version(sender, instance, created, raw=False,
+                                update_fields=None, **kwargs):
+    if created or raw:
+        return
+    if update_fields is not None and not AUTHOR_FIELDS & set(update_fields):
+        return
+    bump_recipe_versions(Recipe.objects.filter(author=instance))
@@ -0,0 +1,34 @@
+"""Тестовые данные: пользователи, ингредиенты и рецепты без картинок."""
+from dish.models import Ingredient, Recipe, RecipeIngredientAmount, Tag
+from users.models import CustomUser
+
+
+def make_user(username):
+    return CustomUser.objects.create_user(
+        username=username, email=f'{username}@example.com', password='p',
+        first_name=username, last_name=username)
+
+
+def make_ingredients(*names):
+    return [
+        Ingredient.objects.create(name=name, measurement='г')
+        for name in names
+    ]
+
+
+def make_tag(slug):
+    return Tag.objects.create(name=slug, slug=slug, color='#E26C2D')
+
+
+def make_recipe(author, name, amounts, tags=()):
+    """amounts: {ингредиент: количество}."""
+    recipe = Recipe.objects.create(
+        author=author, name=name, text='Описание', cooking_time=10,
+        image='images/test.png')
+    RecipeIngredientAmount.objects.bulk_create([
+        RecipeIngredientAmount(
+            recipe=recipe, ingredient=ingredient, amount=amount)
+        for ingredient, amount in amounts.items()
+    ])
+    recipe.tags.set(tags)
+    return recipe
@@ -0,0 +1,76 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from dish.models import Cart, Favorite, Subscription
+from dish.relations import add_relations
+from users.models import CustomUser
+
+from .data import make_ingredients, make_recipe, make_user
+
+
+class AdminQueryCountTests(TestCase):
+    """Число запросов страниц админки не зависит от числа строк."""
+    def setUp(self):
+        self.admin = CustomUser.objects.create_superuser(
+            username='admin', email='admin@example.com', password='p',
+            first_name='admin', last_name='admin')
+        self.client.force_login(self.admin)
+        self.ingredients = make_ingredients('мука', 'сахар')
+        self.number = 0
+
+    def add_rows(self, count):
+        for _ in range(count):
+            self.number += 1
+            user = make_user(f'user{self.number}')
+            recipe = make_recipe(
+                user, f'Рецепт {self.number}',
+                {ingredient: 100 for ingredient in self.ingredients})
+            add_relations(Favorite, self.admin, [recipe.pk])
+            add_relations(Cart, user, [recipe.pk])
+            Subscription.objects.create(subscriber=self.admin, author=user)
+
+    def count_queries(self, url):
+        # Первый запрос заполняет кеш типов содержимого
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context)
+
+    def test_changelists(self):
+        urls = [
+            f'/admin/{app}/{model}/' for app, model in (
+                ('dish', 'recipe'), ('dish', 'subscription'),
+                ('dish', 'favorite'), ('dish', 'cart'),
+                ('users', 'customuser'))
+        ]
+        self.add_rows(2)
+        few = {url: self.count_queries(url) for url in urls}
+        self.add_rows(8)
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.count_queries(url), few[url])
+
+    def test_change_pages(self):
+        self.add_rows(1)
+        user_url = f'/admin/users/customuser/{self.admin.pk}/change/'
+        few = self.count_queries(user_url)
+        self.add_rows(8)
+        self.assertEqual(self.count_queries(user_url), few)
+
+    def test_recipe_change_page(self):
+        url = '/admin/dish/recipe/{}/change/'
+        more = make_ingredients('соль', 'яйца', 'масло')
+        one = make_recipe(self.admin, 'Хлеб', {self.ingredients[0]: 1})
+        four = make_recipe(
+            self.admin, 'Пирог',
+            {ingredient: 1 for ingredient in self.ingredients + more[:2]})
+        five = make_recipe(
+            self.admin, 'Торт',
+            {ingredient: 1 for ingredient in self.ingredients + more})
+        # На строку состава - только выбранное значение виджета
+        # автодополнения ингредиента (AutocompleteSelect)
+        base = self.count_queries(url.format(one.pk))
+        self.assertEqual(self.count_queries(url.format(four.pk)), base + 3)
+        self.assertEqual(self.count_queries(url.format(five.pk)), base + 4)
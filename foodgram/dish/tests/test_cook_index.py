@@ -0,0 +1,94 @@
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from dish.cook_index import CookIndex, cook_index
+from dish.models import RecipeIngredientAmount
+
+from .data import make_ingredients, make_recipe, make_user
+
+
+class CookIndexTests(TestCase):
+    def setUp(self):
+        self.user = make_user('user')
+        self.flour, self.sugar, self.salt, self.eggs = make_ingredients(
+            'мука', 'сахар', 'соль', 'яйца')
+        self.bread = make_recipe(
+            self.user, 'Хлеб', {self.flour: 500, self.salt: 5})
+        self.pie = make_recipe(
+            self.user, 'Пирог',
+            {self.flour: 200, self.sugar: 50, self.eggs: 2})
+        self.cake = make_recipe(
+            self.user, 'Торт', {self.flour: 100, self.sugar: 100})
+        self.index = CookIndex()
+
+    def test_ranking(self):
+        self.assertEqual(
+            self.index.search([self.flour.pk, self.sugar.pk], missing=1), [
+                (self.cake.pk, 2, 2),
+                (self.pie.pk, 2, 3),
+                (self.bread.pk, 1, 2),
+            ])
+        self.assertEqual(
+            self.index.search([self.flour.pk, self.sugar.pk]),
+            [(self.cake.pk, 2, 2)])
+
+    def test_update_after_recipe_edit(self):
+        self.index.search([self.flour.pk])
+        RecipeIngredientAmount.objects.filter(
+            recipe=self.pie, ingredient=self.eggs).delete()
+        RecipeIngredientAmount.objects.create(
+            recipe=self.bread, ingredient=self.sugar, amount=10)
+        self.index.update_recipes([self.pie.pk, self.bread.pk])
+        self.assertEqual(
+            self.index.search([self.flour.pk, self.sugar.pk]), [
+                (self.cake.pk, 2, 2),
+                (self.pie.pk, 2, 2),
+            ])
+        self.assertEqual(
+            self.index.search([self.eggs.pk], missing=5), [])
+
+    def test_search_keeps_its_snapshot(self):
+        self.index.search([self.flour.pk])
+        postings, terms = self.index._state
+        self.index.remove_recipe(self.cake.pk)
+        # Правка не меняет индекс, по которому, возможно, идет поиск
+        self.assertIn(self.cake.pk, terms)
+        self.assertIn(self.cake.pk, postings[self.flour.pk])
+        self.assertNotIn(
+            self.cake.pk,
+            [item[0] for item in self.index.search([self.flour.pk], 5)])
+
+    def test_change_during_build_is_kept(self):
+        load = CookIndex._load
+
+        def load_then_edit(recipe_ids=None):
+            terms = load(recipe_ids)
+            if recipe_ids is None:
+                # Рецепт правят, пока индекс строится из старых данных
+                RecipeIngredientAmount.objects.filter(
+                    recipe=self.cake).delete()
+                self.index.update_recipes([self.cake.pk])
+            return terms
+
+        with mock.patch.object(CookIndex, '_load',
+                               side_effect=load_then_edit):
+            result = self.index.search([self.flour.pk], missing=5)
+        self.assertNotIn(self.cake.pk, [item[0] for item in result])
+
+    @override_settings(COOK_INDEX_TTL=0)
+    def test_rebuild_after_ttl(self):
+        self.index.search([self.flour.pk])
+        RecipeIngredientAmount.objects.create(
+            recipe=self.bread, ingredient=self.sugar, amount=10)
+        self.assertIn(
+            (self.bread.pk, 2, 3),
+            self.index.search([self.flour.pk, self.sugar.pk], missing=1))
+
+    def test_recipe_delete_signal(self):
+        cook_index.invalidate()
+        cook_index.search([self.flour.pk])
+        self.cake.delete()
+        self.assertEqual(
+            [item[0] for item in cook_index.search([self.flour.pk], 5)],
+            [self.bread.pk, self.pie.pk])
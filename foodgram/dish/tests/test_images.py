@@ -0,0 +1,99 @@
+import io
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TransactionTestCase, override_settings
+from PIL import Image
+
+from dish import images
+from dish.models import Recipe, RecipeImageVariant
+
+from .data import make_recipe, make_user
+
+
+def save_image(name, color):
+    output = io.BytesIO()
+    Image.new('RGB', (800, 400), color).save(output, 'PNG')
+    return default_storage.save(name, ContentFile(output.getvalue()))
+
+
+class ImageVariantTests(TransactionTestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        settings = override_settings(MEDIA_ROOT=media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.variants_dir = os.path.join(media, 'images', 'variants')
+        self.recipe = make_recipe(make_user('author'), 'Пирог', {})
+        self.recipe.image = save_image('images/pie.png', 'orange')
+        self.recipe.save()
+
+    def files(self):
+        return set(os.listdir(self.variants_dir))
+
+    def variant_files(self):
+        return {
+            os.path.basename(name)
+            for name in RecipeImageVariant.objects.values_list(
+                'image', flat=True)
+        }
+
+    def test_build(self):
+        self.recipe.refresh_from_db()
+        version = self.recipe.cache_version
+        images.build_variants(self.recipe.pk)
+        variants = RecipeImageVariant.objects.filter(recipe=self.recipe)
+        self.assertEqual(variants.count(), 6)
+        for variant in variants:
+            # Копии уменьшаются, но не увеличиваются
+            width = min(images.VARIANT_SIZES[variant.name][0], 800)
+            self.assertEqual(
+                (variant.width, variant.height), (width, width // 2))
+            self.assertEqual(variant.source, 'images/pie.png')
+        self.assertEqual(self.files(), self.variant_files())
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.cache_version, version + 1)
+
+    def test_rebuild_deletes_replaced_files(self):
+        images.build_variants(self.recipe.pk)
+        old = self.files()
+        images.build_variants(self.recipe.pk, force=True)
+        self.assertEqual(self.files(), self.variant_files())
+        self.assertFalse(old & self.files())
+
+    def test_concurrent_build_leaves_no_orphans(self):
+        images.build_variants(self.recipe.pk)
+        render = images.render_variant
+        calls = []
+
+        def render_racing(*args):
+            # Параллельная сборка успевает заменить копии
+            calls.append(args)
+            if len(calls) == 1:
+                images.build_variants(self.recipe.pk, force=True)
+            return render(*args)
+
+        with mock.patch.object(images, 'render_variant', render_racing):
+            images.build_variants(self.recipe.pk, force=True)
+        self.assertEqual(RecipeImageVariant.objects.count(), 6)
+        self.assertEqual(self.files(), self.variant_files())
+
+    def test_build_for_replaced_image_is_dropped(self):
+        images.build_variants(self.recipe.pk)
+        before = self.variant_files()
+        render = images.render_variant
+
+        def render_after_edit(*args):
+            Recipe.objects.filter(pk=self.recipe.pk).update(
+                image='images/other.png')
+            return render(*args)
+
+        with mock.patch.object(images, 'render_variant', render_after_edit):
+            images.build_variants(self.recipe.pk, force=True)
+        self.assertEqual(self.variant_files(), before)
+        self.assertEqual(self.files(), before)
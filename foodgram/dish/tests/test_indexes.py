@@ -0,0 +1,39 @@
+from io import StringIO
+from unittest import skipUnless
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+
+from dish.models import Recipe
+
+from .data import make_ingredients, make_recipe, make_tag, make_user
+
+
+class IndexTests(TestCase):
+    def setUp(self):
+        self.author = make_user('author')
+        self.user = make_user('user')
+        self.flour, self.sugar, self.salt = make_ingredients(
+            'мука', 'сахар', 'соль')
+        tags = [make_tag('breakfast'), make_tag('lunch')]
+        make_recipe(self.author, 'Пирог', {self.flour: 200}, tags)
+        make_recipe(self.user, 'Торт', {self.sugar: 100}, tags[:1])
+
+    @skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN SQLite')
+    def test_author_feed_uses_index(self):
+        queryset = Recipe.objects.filter(
+            author=self.author).order_by('-pub_date', '-id')[:10]
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = '\n'.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('recipe_author_pub_date_idx', plan)
+        self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan)
+
+    def test_explain_hot_queries_on_small_data(self):
+        out = StringIO()
+        call_command('explain_hot_queries', user=self.user.email,
+                     only='recipes-author', stdout=out)
+        self.assertIn('recipes-author: запросов', out.getvalue())
+        self.assertIn('Последовательных сканирований нет.', out.getvalue())
@@ -0,0 +1,70 @@
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from dish.ingredient_index import ingredient_index
+from dish.models import Ingredient
+
+from .data import make_ingredients
+
+
+class IngredientIndexTests(TestCase):
+    def setUp(self):
+        ingredient_index.invalidate()
+        make_ingredients('Сахарная пудра', 'сахар', 'ванильный сахар',
+                         'соль', 'сало')
+
+    def tearDown(self):
+        ingredient_index.invalidate()
+
+    def names(self, query, limit=None):
+        return [
+            ingredient.name
+            for ingredient in ingredient_index.search(query, limit)
+        ]
+
+    def test_prefix_before_substring(self):
+        self.assertEqual(
+            self.names('САХ'),
+            ['сахар', 'Сахарная пудра', 'ванильный сахар'])
+        self.assertEqual(self.names('са'), [
+            'сало', 'сахар', 'Сахарная пудра', 'ванильный сахар'])
+
+    def test_limit(self):
+        self.assertEqual(self.names('сах', limit=1), ['сахар'])
+        self.assertEqual(
+            self.names('сах', limit=3),
+            ['сахар', 'Сахарная пудра', 'ванильный сахар'])
+        with override_settings(INGREDIENT_SEARCH_LIMIT=2):
+            self.assertEqual(
+                self.names('сах'), ['сахар', 'Сахарная пудра'])
+
+    def test_refresh_after_changes(self):
+        self.assertEqual(self.names('сол'), ['соль'])
+        make_ingredients('солод')
+        self.assertEqual(self.names('сол'), ['солод', 'соль'])
+        Ingredient.objects.filter(name='соль').get().delete()
+        self.assertEqual(self.names('сол'), ['солод'])
+        salo = Ingredient.objects.get(name='сало')
+        salo.name = 'солонина'
+        salo.save()
+        self.assertEqual(self.names('сол'), ['солод', 'солонина'])
+        self.assertEqual(self.names('сал'), [])
+
+    @override_settings(INGREDIENT_INDEX_TTL=0)
+    def test_rebuild_after_ttl(self):
+        self.assertEqual(self.names('сол'), ['соль'])
+        # Изменение из другого воркера: сигналы этого процесса не сработали
+        Ingredient.objects.filter(name='соль').update(name='солод')
+        self.assertEqual(self.names('сол'), ['солод'])
+
+    def test_endpoint(self):
+        response = APIClient().get('/api/ingredients/', {'name': 'сах'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [item['name'] for item in response.json()],
+            ['сахар', 'Сахарная пудра', 'ванильный сахар'])
+        make_ingredients('сахарин')
+        response = APIClient().get('/api/ingredients/', {'name': 'сах'})
+        self.assertEqual(
+            [item['name'] for item in response.json()],
+            ['сахар', 'сахарин', 'Сахарная пудра', 'ванильный сахар'])
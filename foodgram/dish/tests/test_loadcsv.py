@@ -0,0 +1,32 @@
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from dish.models import Ingredient
+
+
+class LoadCsvTests(TestCase):
+    def setUp(self):
+        file = tempfile.NamedTemporaryFile(
+            'w', suffix='.csv', encoding='utf-8', delete=False)
+        with file:
+            for number in range(1200):
+                file.write(f'ингредиент {number},г\n')
+        self.path = file.name
+        self.addCleanup(os.remove, self.path)
+
+    def load(self, *args):
+        out = StringIO()
+        call_command('loadcsv', self.path, 'Ingredient', *args, stdout=out)
+        return out.getvalue()
+
+    def test_large_batch_and_reload(self):
+        output = self.load('--batch-size', '1000')
+        self.assertIn('Обработано строк: 1200', output)
+        self.assertEqual(Ingredient.objects.count(), 1200)
+        output = self.load('--batch-size', '1000')
+        self.assertIn('создано 0, обновлено 0, пропущено 1200', output)
+        self.assertEqual(Ingredient.objects.count(), 1200)
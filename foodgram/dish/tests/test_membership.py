@@ -0,0 +1,44 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from dish.membership import Membership, set_key
+from dish.models import Favorite
+from dish.relations import add_relations, remove_relations
+
+from .data import make_recipe, make_user
+
+
+class MembershipTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user('user')
+        self.pie = make_recipe(self.user, 'Пирог', {})
+
+    @override_settings(SHARED_CACHE=True)
+    def test_writes_change_cached_sets(self):
+        self.assertFalse(Membership(self.user).is_favorited(self.pie.pk))
+        with self.assertNumQueries(0):
+            Membership(self.user).is_favorited(self.pie.pk)
+        add_relations(Favorite, self.user, [self.pie.pk])
+        self.assertTrue(Membership(self.user).is_favorited(self.pie.pk))
+        Favorite.objects.get(user=self.user).delete()
+        self.assertFalse(Membership(self.user).is_favorited(self.pie.pk))
+        add_relations(Favorite, self.user, [self.pie.pk])
+        remove_relations(Favorite, self.user, [self.pie.pk])
+        self.assertFalse(Membership(self.user).is_favorited(self.pie.pk))
+
+    @override_settings(SHARED_CACHE=False)
+    def test_local_cache_keeps_sets_per_request(self):
+        membership = Membership(self.user)
+        self.assertFalse(membership.is_favorited(self.pie.pk))
+        self.assertIsNone(cache.get(set_key(self.user.pk, 'favorites')))
+        add_relations(Favorite, self.user, [self.pie.pk])
+        self.assertTrue(Membership(self.user).is_favorited(self.pie.pk))
+
+    @override_settings(SHARED_CACHE=False)
+    def test_local_cache_sees_writes_of_other_workers(self):
+        self.assertFalse(Membership(self.user).is_favorited(self.pie.pk))
+        # Запись другого воркера: сигналы этого процесса ее не видят
+        Favorite.objects.bulk_create(
+            [Favorite(user=self.user, recipe=self.pie)])
+        self.assertTrue(Membership(self.user).is_favorited(self.pie.pk))
@@ -0,0 +1,54 @@
+from django.test import TestCase
+
+from dish.models import Cart, Favorite, Recipe, ShoppingListItem
+from dish.relations import add_relations, remove_relations
+
+from .data import make_ingredients, make_recipe, make_user
+
+
+class RelationsTests(TestCase):
+    def setUp(self):
+        self.author = make_user('author')
+        self.user = make_user('user')
+        self.flour, self.sugar = make_ingredients('мука', 'сахар')
+        self.pie = make_recipe(
+            self.author, 'Пирог', {self.flour: 200, self.sugar: 50})
+        self.cake = make_recipe(self.author, 'Торт', {self.sugar: 100})
+
+    def shopping_list(self):
+        return dict(ShoppingListItem.objects.filter(
+            user=self.user, amount__gt=0).values_list(
+                'ingredient__name', 'amount'))
+
+    def counters(self, recipe):
+        return Recipe.objects.values_list(
+            'favorites_count', 'carts_count').get(pk=recipe.pk)
+
+    def test_add_is_idempotent(self):
+        added, existing, missing = add_relations(
+            Cart, self.user, [self.pie.pk])
+        self.assertEqual(added, {self.pie.pk})
+        added, existing, missing = add_relations(
+            Cart, self.user, [self.pie.pk])
+        self.assertEqual((added, existing), (set(), {self.pie.pk}))
+        self.assertEqual(Cart.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(self.counters(self.pie), (0, 1))
+        self.assertEqual(self.shopping_list(), {'мука': 200, 'сахар': 50})
+
+    def test_duplicate_and_missing_ids(self):
+        added, existing, missing = add_relations(
+            Favorite, self.user, [self.pie.pk, self.pie.pk, 0])
+        self.assertEqual((added, existing, missing),
+                         ({self.pie.pk}, set(), {0}))
+        self.assertEqual(self.counters(self.pie), (1, 0))
+
+    def test_remove_twice(self):
+        add_relations(Cart, self.user, [self.pie.pk, self.cake.pk])
+        self.assertEqual(self.shopping_list(), {'мука': 200, 'сахар': 150})
+        self.assertEqual(
+            remove_relations(Cart, self.user, [self.pie.pk]), {self.pie.pk})
+        self.assertEqual(
+            remove_relations(Cart, self.user, [self.pie.pk]), set())
+        self.assertEqual(self.shopping_list(), {'сахар': 100})
+        self.assertEqual(self.counters(self.pie), (0, 0))
+        self.assertEqual(self.counters(self.cake), (0, 1))
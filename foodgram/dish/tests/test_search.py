@@ -0,0 +1,34 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from dish.models import Recipe
+from dish.search import search_recipes, update_search_documents
+
+from .data import make_ingredients, make_recipe, make_user
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        author = make_user('author')
+        sugar, = make_ingredients('сахар')
+        self.recipes = [
+            make_recipe(author, f'Пирог {number}', {sugar: 10})
+            for number in range(300)
+        ]
+        self.soup = make_recipe(author, 'Суп с сахаром и сахаром', {})
+        update_search_documents(Recipe.objects.values_list('pk', flat=True))
+
+    def test_ranked_and_limited_in_sql(self):
+        with CaptureQueriesContext(connection) as queries:
+            found = list(search_recipes(Recipe.objects.all(), 'сахар')[:5])
+        self.assertEqual(len(found), 5)
+        self.assertEqual(found[0], self.soup)
+        self.assertEqual(len(queries), 1)
+        self.assertIn('LIMIT', queries[0]['sql'])
+        self.assertLess(len(queries[0]['sql']), 2000)
+        self.assertEqual(
+            search_recipes(Recipe.objects.all(), 'сахар').count(), 301)
+
+    def test_no_words(self):
+        self.assertFalse(search_recipes(Recipe.objects.all(), '!!!').exists())
@@ -0,0 +1,72 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from dish import shopping_list
+from dish.models import Cart, RecipeIngredientAmount, ShoppingListItem
+from dish.relations import add_relations, remove_relations
+
+from .data import make_ingredients, make_recipe, make_user
+
+
+class ShoppingListTests(TestCase):
+    def setUp(self):
+        self.user = make_user('user')
+        self.flour, self.sugar = make_ingredients('мука', 'сахар')
+        self.pie = make_recipe(
+            self.user, 'Пирог', {self.flour: 200, self.sugar: 50})
+        self.cake = make_recipe(self.user, 'Торт', {self.sugar: 100})
+        add_relations(Cart, self.user, [self.pie.pk, self.cake.pk])
+
+    def amounts(self):
+        return dict(shopping_list.get_items(self.user).values_list(
+            'ingredient__name', 'amount'))
+
+    def test_stale_cart_delete_is_ignored(self):
+        stale = Cart.objects.get(user=self.user, recipe=self.pie)
+        stale.delete()
+        self.assertEqual(self.amounts(), {'сахар': 100})
+        # Повторное удаление уже удаленной строки ничего не вычитает
+        shopping_list.update_for_carts([stale], -1)
+        self.assertEqual(self.amounts(), {'сахар': 100})
+
+    def test_negative_amounts_are_clamped(self):
+        shopping_list.apply_deltas({(self.user.pk, self.sugar.pk): -1000})
+        item = ShoppingListItem.objects.get(
+            user=self.user, ingredient=self.sugar)
+        self.assertEqual(item.amount, 0)
+        self.assertEqual(self.amounts(), {'мука': 200})
+
+    def test_recipe_delete_updates_shopping_list(self):
+        self.cake.delete()
+        self.assertEqual(self.amounts(), {'мука': 200, 'сахар': 50})
+
+    def test_incremental_list_matches_rebuild(self):
+        salt, = make_ingredients('соль')
+        soup = make_recipe(self.user, 'Суп', {salt: 10, self.flour: 30})
+        add_relations(Cart, self.user, [soup.pk, self.pie.pk])
+        remove_relations(Cart, self.user, [self.cake.pk])
+        remove_relations(Cart, self.user, [self.cake.pk])
+        RecipeIngredientAmount.objects.filter(
+            recipe=self.pie, ingredient=self.flour).update(amount=150)
+        shopping_list.update_for_recipe(
+            self.pie.pk, {self.flour.pk: -50, self.sugar.pk: 0})
+        add_relations(Cart, self.user, [self.cake.pk, soup.pk])
+        incremental = self.amounts()
+        shopping_list.rebuild([self.user.pk])
+        self.assertEqual(incremental, self.amounts())
+        self.assertEqual(
+            incremental, {'мука': 180, 'сахар': 150, 'соль': 10})
+
+    def test_cart_add_locks_recipe_before_insert(self):
+        self.cake.cart.all().delete()
+        calls = []
+
+        def lock(recipe_ids):
+            calls.append((
+                list(recipe_ids),
+                Cart.objects.filter(recipe=self.cake).exists()))
+
+        with mock.patch.object(shopping_list, 'lock_recipes', lock):
+            add_relations(Cart, self.user, [self.cake.pk])
+        self.assertEqual(calls[0], ([self.cake.pk], False))
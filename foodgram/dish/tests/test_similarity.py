@@ -0,0 +1,59 @@
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from dish import similarity
+from dish.models import RecipeSignature, RecipeSignatureBucket
+
+from .data import make_ingredients, make_recipe, make_user
+
+
+class SimilarityTests(TestCase):
+    def setUp(self):
+        self.user = make_user('user')
+        ingredients = make_ingredients(*(f'ингредиент {i}' for i in range(8)))
+        self.base = make_recipe(
+            self.user, 'Основа', dict.fromkeys(ingredients[:4], 10))
+        self.far = make_recipe(
+            self.user, 'Далекий',
+            dict.fromkeys(ingredients[3:4] + ingredients[5:8], 10))
+        self.close = make_recipe(
+            self.user, 'Похожий', dict.fromkeys(ingredients[:3], 10))
+        self.other = make_recipe(
+            self.user, 'Другой', dict.fromkeys(ingredients[5:8], 10))
+        call_command('build_similarity_index', stdout=StringIO())
+
+    def test_index_build(self):
+        self.assertEqual(RecipeSignature.objects.count(), 4)
+        self.assertEqual(
+            RecipeSignatureBucket.objects.filter(recipe=self.base).count(),
+            similarity.BANDS)
+
+    def test_ranked_by_jaccard(self):
+        self.assertEqual(similarity.similar_recipes(self.base.pk, 10), [
+            (self.close.pk, 0.75),
+            (self.far.pk, 1 / 7),
+        ])
+        self.assertEqual(
+            similarity.similar_recipes(self.base.pk, 1),
+            [(self.close.pk, 0.75)])
+
+    def test_candidates_ranked_before_limit(self):
+        # Лимит отсекает кандидатов с меньшим числом общих корзин, а не
+        # с большим id
+        with mock.patch.object(similarity, 'CANDIDATES_LIMIT', 1):
+            self.assertEqual(
+                similarity.similar_recipes(self.base.pk, 1),
+                [(self.close.pk, 0.75)])
+
+    def test_falls_back_to_shared_ingredients(self):
+        RecipeSignatureBucket.objects.all().delete()
+        self.assertEqual(
+            [pk for pk, _ in similarity.similar_recipes(self.base.pk, 10)],
+            [self.close.pk, self.far.pk])
+
+    def test_recipe_without_ingredients(self):
+        empty = make_recipe(self.user, 'Пустой', {})
+        self.assertIsNone(similarity.similar_recipes(empty.pk, 10))
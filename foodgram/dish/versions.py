@@ -0,0 +1,85 @@
+"""Версии справочников (теги, ингредиенты) для HTTP-кеширования.
+
+Версия и время последнего изменения хранятся в CatalogVersion и
+меняются только при записи в справочник (сигналы), поэтому ETag и
+Last-Modified одинаковы во всех воркерах и не устаревают сами по себе.
+Чтобы не читать версию из базы на каждый запрос, она лежит в кеше
+Django не дольше CATALOG_VERSION_TTL секунд под ключом с меткой
+справочника. Запись увеличивает метку сразу и еще раз после коммита:
+версия, прочитанная другим запросом до коммита, останется под старой
+меткой, и следующий запрос перечитает ее из базы. Поэтому запись в кеш
+только добавляет ключ (cache.add) и не правит существующий. Метка в
+локальном кеше процесса меняется только в этом воркере; другие увидят
+запись после истечения CATALOG_VERSION_TTL.
+
+Версия рецепта (Recipe.cache_version) хранится в самой строке: она
+читается тем же запросом, что и рецепт, и увеличивается в той же
+транзакции, что и правка рецепта, его тегов, ингредиентов или автора.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import CatalogVersion
+
+
+def stamp_key(model):
+    return f'catalog-stamp:{model._meta.label_lower}'
+
+
+def bump_stamp(model):
+    try:
+        cache.incr(stamp_key(model))
+    except ValueError:
+        # Метки нет: get_stamp заведет новую
+        pass
+
+
+def get_stamp(model):
+    stamp = cache.get(stamp_key(model))
+    if stamp is None:
+        # Метку могли вытеснить из кеша: новая не должна совпасть со
+        # старой, под которой еще лежит версия
+        cache.add(stamp_key(model), int(time.time() * 1000), None)
+        stamp = cache.get(stamp_key(model))
+    return stamp
+
+
+def version_key(model):
+    return f'catalog-version:{model._meta.label_lower}:{get_stamp(model)}'
+
+
+def bump_version(model):
+    row, created = CatalogVersion.objects.get_or_create(
+        model=model._meta.label_lower)
+    if not created:
+        CatalogVersion.objects.filter(pk=row.pk).update(
+            version=F('version') + 1, modified=timezone.now())
+    bump_stamp(model)
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: bump_stamp(model))
+
+
+def load_version(model):
+    row, _ = CatalogVersion.objects.get_or_create(
+        model=model._meta.label_lower)
+    return row.version, int(row.modified.timestamp())
+
+
+def get_version(model):
+    """(версия, время изменения в секундах) справочника model."""
+    key = version_key(model)
+    version = cache.get(key)
+    if version is None:
+        version = load_version(model)
+        cache.add(key, version, settings.CATALOG_VERSION_TTL)
+    return version
+
+
+def bump_recipe_versions(recipes):
+    """Увеличивает версию рецептов из queryset recipes."""
+    recipes.update(cache_version=F('cache_version') + 1)
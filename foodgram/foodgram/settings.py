@@ -6,7 +6,7 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 SECRET_KEY = os.getenv('SECRET_KEY', default='secret234')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.getenv('DEBUG', default='True') == 'True'
 
 ALLOWED_HOSTS = [
     '*',
@@ -34,12 +34,11 @@ INSTALLED_APPS = [
     'djoser',
     'django_filters',
 
-    'debug_toolbar',
-
     # "corsheaders",
 ]
 
 MIDDLEWARE = [
+    'api.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -48,12 +47,16 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
-
     # "corsheaders.middleware.CorsMiddleware",
     # "django.middleware.common.CommonMiddleware",
 ]
 
+# debug_toolbar только для разработки; в продакшене время запросов и
+# число SQL-запросов собирает api.middleware.RequestMetricsMiddleware
+if DEBUG:
+    INSTALLED_APPS.append('debug_toolbar')
+    MIDDLEWARE.append('debug_toolbar.middleware.DebugToolbarMiddleware')
+
 ROOT_URLCONF = 'foodgram.urls'
 
 TEMPLATES = [
@@ -86,6 +89,19 @@ WSGI_APPLICATION = 'foodgram.wsgi.application'
 # }
 
 
+# Постоянные соединения с БД (api/connections.py): сколько секунд
+# держать соединение (0 - закрывать после каждого запроса) и проверять
+# ли его перед повторным использованием в новом запросе
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', default=60))
+DB_CONN_HEALTH_CHECKS = os.getenv('DB_CONN_HEALTH_CHECKS', default='True') == 'True'
+# Проверяются только соединения, простоявшие дольше стольких секунд
+DB_CONN_HEALTH_CHECK_IDLE = int(os.getenv('DB_CONN_HEALTH_CHECK_IDLE', default=10))
+# Пул соединений процесса для gunicorn --threads (только PostgreSQL):
+# не больше DB_POOL_SIZE соединений на процесс и базу, ожидание
+# свободного - до DB_POOL_TIMEOUT секунд; 0 - без пула
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', default=0))
+DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', default=10))
+
 DATABASES = {
     'default': {
         'ENGINE': os.getenv('DB_ENGINE', default='django.db.backends.postgresql'),
@@ -93,10 +109,69 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
         'HOST': os.getenv('DB_HOST'),
-        'PORT': os.getenv('DB_PORT')
+        'PORT': os.getenv('DB_PORT'),
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
     }
 }
 
+# Реплики для чтения (api/replicas.py) через запятую: host[:port] для
+# PostgreSQL (имя базы, пользователь и пароль - как у основной) или
+# пути к файлам для SQLite. GET-запросы к API читают с реплик.
+DB_REPLICAS = [
+    replica for replica in os.getenv('DB_REPLICAS', default='').split(',')
+    if replica
+]
+# Сколько секунд после записи клиент читает из основной базы
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', default=15))
+# Как часто проверять реплики и допустимое отставание в секундах
+REPLICA_HEALTH_INTERVAL = int(os.getenv('REPLICA_HEALTH_INTERVAL', default=5))
+REPLICA_MAX_LAG = int(os.getenv('REPLICA_MAX_LAG', default=10))
+REPLICA_CONNECT_TIMEOUT = int(os.getenv('REPLICA_CONNECT_TIMEOUT', default=2))
+
+for number, replica in enumerate(DB_REPLICAS, start=1):
+    if DATABASES['default']['ENGINE'].endswith('sqlite3'):
+        location = {'NAME': replica}
+    else:
+        host, _, port = replica.partition(':')
+        location = {
+            'HOST': host,
+            'PORT': port or DATABASES['default']['PORT'],
+            'OPTIONS': {'connect_timeout': REPLICA_CONNECT_TIMEOUT},
+        }
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        **location,
+        'TEST': {'MIRROR': 'default'},
+    }
+
+if DB_REPLICAS:
+    DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+    MIDDLEWARE.insert(1, 'api.middleware.ReadReplicaMiddleware')
+
+if DB_POOL_SIZE and 'postgresql' in DATABASES['default']['ENGINE']:
+    for database in DATABASES.values():
+        database['ENGINE'] = 'api.pooled_postgresql'
+        # Соединение возвращается в пул в конце каждого запроса, время
+        # жизни DB_CONN_MAX_AGE отсчитывает пул
+        database['CONN_MAX_AGE'] = 0
+
+CACHES = {
+    'default': {
+        # Для нескольких воркеров укажите общий кеш, например
+        # django.core.cache.backends.memcached.MemcachedCache
+        'BACKEND': os.getenv('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', default=''),
+    }
+}
+
+# Кеш общий для всех воркеров. С локальным кешем процесса не кешируется
+# то, что должно сбрасываться сразу во всех воркерах (токены, избранное,
+# корзина и подписки пользователя).
+SHARED_CACHE = CACHES['default']['BACKEND'] not in (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -121,14 +196,75 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
 
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.PageLimitPagination',
     'PAGE_SIZE': 6,
 
  }
 
+# Наибольший размер страницы (?limit=) в постраничной и курсорной выдаче
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', default=100))
+
+# Сколько секунд кешировать count в курсорной пагинации (?cursor=&count=1)
+PAGINATION_COUNT_CACHE_TTL = int(os.getenv('PAGINATION_COUNT_CACHE_TTL', default=60))
+
+# Автодополнение ингредиентов (?name=) из индекса в памяти процесса
+INGREDIENT_SEARCH_LIMIT = int(os.getenv('INGREDIENT_SEARCH_LIMIT', default=50))
+INGREDIENT_INDEX_TTL = int(os.getenv('INGREDIENT_INDEX_TTL', default=300))
+
+# «Что приготовить» (?ingredients=): как часто перестраивать обратный
+# индекс ингредиент -> рецепты, чтобы видеть записи соседних воркеров
+COOK_INDEX_TTL = int(os.getenv('COOK_INDEX_TTL', default=300))
+
+# HTTP-кеширование тегов и ингредиентов: время жизни ответов и версии
+# справочника в кеше и max-age для браузеров и nginx
+CATALOG_VERSION_TTL = int(os.getenv('CATALOG_VERSION_TTL', default=300))
+CATALOG_MAX_AGE = int(os.getenv('CATALOG_MAX_AGE', default=60))
+
+# Максимум id в одном пакетном запросе (избранное, корзина, подписки)
+BULK_MAX_IDS = int(os.getenv('BULK_MAX_IDS', default=500))
+
+# Сколько секунд хранить множества избранного, корзины и подписок
+# пользователя (только с общим кешем, SHARED_CACHE; dish/membership.py)
+MEMBERSHIP_CACHE_TTL = int(os.getenv('MEMBERSHIP_CACHE_TTL', default=3600))
+
+# Сколько секунд кешировать пользователя по токену (только с общим
+# кешем, SHARED_CACHE) и время жизни токена в секундах (0 - бессрочно),
+# см. api/authentication.py
+AUTH_TOKEN_CACHE_TTL = int(os.getenv('AUTH_TOKEN_CACHE_TTL', default=300))
+AUTH_TOKEN_TTL = int(os.getenv('AUTH_TOKEN_TTL', default=0))
+
+# Сколько секунд хранить в кеше общую часть представления рецепта
+RECIPE_FRAGMENT_TTL = int(os.getenv('RECIPE_FRAGMENT_TTL', default=3600))
+
+# Метрики запросов (api/middleware.py): запросы, превысившие бюджет по
+# числу SQL-запросов или по времени, логируются вместе с SQL
+# (не больше METRICS_LOG_SQL_LIMIT запросов). /api/metrics доступен
+# администраторам, по заголовку Authorization: Bearer METRICS_TOKEN и
+# адресам из METRICS_ALLOWED_IPS через запятую. Адрес - REMOTE_ADDR: за
+# nginx это адрес nginx, поэтому снаружи метрики забираются по токену.
+METRICS_QUERY_BUDGET = int(os.getenv('METRICS_QUERY_BUDGET', default=30))
+METRICS_LATENCY_BUDGET_MS = int(os.getenv('METRICS_LATENCY_BUDGET_MS', default=500))
+METRICS_LOG_SQL_LIMIT = int(os.getenv('METRICS_LOG_SQL_LIMIT', default=50))
+METRICS_ALLOWED_IPS = [
+    ip for ip in os.getenv('METRICS_ALLOWED_IPS', default='127.0.0.1').split(',')
+    if ip
+]
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', default='')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api.metrics': {'handlers': ['console'], 'level': 'WARNING'},
+    },
+}
+
 
 DJOSER = {
     'LOGIN_FIELD': 'email',
@@ -171,6 +307,9 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 AUTH_USER_MODEL = 'users.CustomUser'
 
+# Потоки для построения уменьшенных копий фото (0 - синхронно)
+IMAGE_VARIANT_WORKERS = int(os.getenv('IMAGE_VARIANT_WORKERS', default=2))
+
 # CORS_ORIGIN_ALLOW_ALL = True
 # CORS_URLS_REGEX = r'^/api/.*$'
 
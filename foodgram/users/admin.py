@@ -1,5 +1,8 @@
 from django.contrib import admin
 
+from dish.counters import count_subquery
+from dish.models import Favorite
+
 from .models import CustomUser
 
 
@@ -14,10 +17,26 @@ class CustomUserAdmin(admin.ModelAdmin):
     readonly_fields = ('count_fields',)
     ordering = ('username', )
     list_filter = (
-        'username',
-        'email',
+        'is_staff',
+        'is_active',
     )
     search_fields = ('username', 'email', )
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        # Число избранного считается подзапросом только для строк страницы
+        return super().get_queryset(request).annotate(
+            favorites_total=count_subquery(Favorite, 'user'))
+
+    def formfield_for_manytomany(self, db_field, request, **kwargs):
+        if db_field.name == 'user_permissions':
+            # Название права включает тип содержимого
+            kwargs['queryset'] = (
+                db_field.remote_field.model.objects.select_related(
+                    'content_type')
+            )
+        return super().formfield_for_manytomany(db_field, request, **kwargs)
 
     def count_fields(self, obj):
-        return obj.favorite.count()
+        return obj.favorites_total
+    count_fields.admin_order_field = 'favorites_total'
@@ -24,6 +24,12 @@ class CustomUser(AbstractUser):
         blank=False,
         null=False,
     )
+    # Ведется в dish/counters.py, сверяется reconcile_counters
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Число рецептов',
+    )
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
 
@@ -35,5 +41,17 @@ class CustomUser(AbstractUser):
     def __str__(self):
         return self.username
 
+    def save(self, *args, **kwargs):
+        # Счетчик не перезаписываем устаревшим значением из памяти,
+        # отложенные поля (api/authentication.py) - не загруженными.
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'recipes_count'
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
     def get_absolute_url(self):
         return reverse('users:profile', kwargs={'user': self.username})
@@ -1,5 +1,9 @@
 python3 manage.py makemigrations
 python3 manage.py migrate
+python3 manage.py reconcile_counters
+python3 manage.py rebuild_shopping_lists
+python3 manage.py build_image_variants
+python3 manage.py build_similarity_index
 python3 manage.py collectstatic --no-input
 # python manage.py createsuperuser
 # python manage.py loadcsv ../data/ingredients.csv Ingredient